@@ -0,0 +1,197 @@
+import random
+from obj.cfg import CFG, Letter, Rule
+from processors_cfg.witness import min_lengths
+
+
+def variable(name: str) -> Letter:
+    return Letter(name, True)
+
+
+def terminal(name: str) -> Letter:
+    return Letter(name, False)
+
+
+def random_cnf(
+    num_variables: int, num_terminals: int, rules_per_variable: int, seed: int = 0
+) -> CFG:
+    """random grammar in Chomsky normal form
+
+    every variable gets one terminal rule so that all variables are generating,
+    the remaining rules are random `A -> B C` rules"""
+    rng = random.Random(seed)
+    variables = [variable("S")] + [variable(f"V{i}") for i in range(1, num_variables)]
+    terminals = [terminal(f"t{i}") for i in range(num_terminals)]
+    cfg = CFG()
+    cfg.set_start_variable(variables[0])
+    for var in variables:
+        cfg.add_rule(Rule(var, (rng.choice(terminals),)))
+        for _ in range(rules_per_variable - 1):
+            if rng.random() < 0.2:
+                cfg.add_rule(Rule(var, (rng.choice(terminals),)))
+            else:
+                cfg.add_rule(Rule(var, (rng.choice(variables), rng.choice(variables))))
+    return cfg
+
+
+def ambiguous() -> CFG:
+    """the highly ambiguous grammar `S -> S S | a`"""
+    s = variable("S")
+    cfg = CFG([Rule(s, (s, s)), Rule(s, (terminal("a"),))])
+    cfg.set_start_variable(s)
+    return cfg
+
+
+def unit_chain(length: int) -> CFG:
+    """`S -> A0`, `A0 -> A1`, ..., with only the last variable producing letters"""
+    chain = [variable("S")] + [variable(f"A{i}") for i in range(length)]
+    cfg = CFG()
+    cfg.set_start_variable(chain[0])
+    for var, next_var in zip(chain, chain[1:]):
+        cfg.add_rule(Rule(var, (next_var,)))
+    last = chain[-1]
+    cfg.add_rule(Rule(last, (terminal("a"), last)))
+    cfg.add_rule(Rule(last, (terminal("a"),)))
+    return cfg
+
+
+def epsilon_nesting(depth: int) -> CFG:
+    """`Ai -> Ai+1 bi | e` nested `depth` times, every variable is nullable"""
+    nest = [variable("S")] + [variable(f"A{i}") for i in range(depth)]
+    cfg = CFG()
+    cfg.set_start_variable(nest[0])
+    for i, (var, next_var) in enumerate(zip(nest, nest[1:])):
+        cfg.add_rule(Rule(var, (next_var, terminal(f"b{i}"))))
+        cfg.add_rule(Rule(var, (next_var, next_var)))
+        cfg.add_rule(Rule(var, ()))
+    cfg.add_rule(Rule(nest[-1], (terminal("a"),)))
+    cfg.add_rule(Rule(nest[-1], ()))
+    return cfg
+
+
+def wide_alphabet(size: int) -> CFG:
+    """`S -> T S | T`, where `T` produces any of `size` different letters"""
+    s = variable("S")
+    t = variable("T")
+    cfg = CFG([Rule(s, (t, s)), Rule(s, (t,))])
+    cfg.set_start_variable(s)
+    for i in range(size):
+        cfg.add_rule(Rule(t, (terminal(f"t{i}"),)))
+    return cfg
+
+
+def random_cfg(
+    num_variables: int, num_terminals: int, rules_per_variable: int, seed: int = 0
+) -> CFG:
+    """random grammar in no normal form, with e rules, unit rules and rules of
+    up to 3 letters"""
+    rng = random.Random(seed)
+    variables = [variable("S")] + [variable(f"V{i}") for i in range(1, num_variables)]
+    terminals = [terminal(f"t{i}") for i in range(num_terminals)]
+    cfg = CFG()
+    cfg.set_start_variable(variables[0])
+    for var in variables:
+        for _ in range(rules_per_variable):
+            size = rng.choice((0, 1, 1, 2, 2, 3))
+            output = tuple(
+                rng.choice(variables) if rng.random() < 0.4 else rng.choice(terminals)
+                for _ in range(size)
+            )
+            cfg.add_rule(Rule(var, output))
+    return cfg
+
+
+def random_linear(
+    num_variables: int, num_terminals: int, rules_per_variable: int, seed: int = 0
+) -> CFG:
+    """random right-linear grammar, rules are `A -> w B` or `A -> w` with up to 2
+    letters in `w`"""
+    rng = random.Random(seed)
+    variables = [variable("S")] + [variable(f"V{i}") for i in range(1, num_variables)]
+    terminals = [terminal(f"t{i}") for i in range(num_terminals)]
+    cfg = CFG()
+    cfg.set_start_variable(variables[0])
+    for var in variables:
+        for _ in range(rules_per_variable):
+            output = tuple(rng.choice(terminals) for _ in range(rng.randint(0, 2)))
+            if rng.random() < 0.7:
+                output += (rng.choice(variables),)
+            cfg.add_rule(Rule(var, output))
+    return cfg
+
+
+def all_words(letters: list[Letter], max_length: int) -> list[tuple[Letter]]:
+    """every word of the letters up to `max_length`, shortest first"""
+    words = [()]
+    last = [()]
+    for _ in range(max_length):
+        last = [word + (letter,) for word in last for letter in letters]
+        words.extend(last)
+    return words
+
+
+def bounded_blocks(count: int, width: int) -> CFG:
+    """`S -> Bi S | Bi` for `count` blocks, where `Bi` only produces words of
+    `width` to `width + 2` letters over {a, b}"""
+    s = variable("S")
+    cfg = CFG()
+    cfg.set_start_variable(s)
+    for i in range(count):
+        block = variable(f"B{i}")
+        letter = variable(f"X{i}")
+        cfg.add_rule(Rule(s, (block, s)))
+        cfg.add_rule(Rule(s, (block,)))
+        cfg.add_rule(Rule(block, (letter,) * (width + i % 3)))
+        cfg.add_rule(Rule(letter, (terminal("a"),)))
+        cfg.add_rule(Rule(letter, (terminal("b"),)))
+    return cfg
+
+
+def sample_word(cfg: CFG, length: int, seed: int = 0) -> tuple[Letter]:
+    """random word of the grammar, aiming for roughly `length` letters
+
+    the longest rules are picked at random until the word is long enough, after
+    that the rule with the shortest possible output is always picked"""
+    rng = random.Random(seed)
+    lengths = min_lengths(cfg)
+    rules_map = cfg.rules_map()
+    if cfg.start_variable not in lengths:
+        raise Exception(f"Start variable {cfg.start_variable} produces no words!")
+
+    def rule_length(rule: Rule) -> int:
+        return sum(lengths[l] if l.is_variable else 1 for l in rule.output_word)
+
+    usable = {
+        var: [r for r in rules if all(l in lengths or not l.is_variable for l in r.output_word)]
+        for var, rules in rules_map.items()
+    }
+    shortest = {var: min(rules, key=rule_length) for var, rules in usable.items() if rules}
+    longest = {}
+    for var, rules in usable.items():
+        max_size = max((len(r.output_word) for r in rules), default=0)
+        longest[var] = [r for r in rules if len(r.output_word) == max_size]
+
+    word = []
+    # stack of letters still to be expanded, rightmost letter at the bottom
+    stack = [cfg.start_variable]
+    pending = lengths[cfg.start_variable]
+    while stack:
+        letter = stack.pop()
+        if not letter.is_variable:
+            word.append(letter)
+            pending -= 1
+            continue
+        pending -= lengths[letter]
+        if len(word) + pending < length:
+            rule = rng.choice(longest[letter])
+        else:
+            rule = shortest[letter]
+        pending += rule_length(rule)
+        stack.extend(reversed(rule.output_word))
+    return tuple(word)
+
+
+def random_word(cfg: CFG, length: int, seed: int = 0) -> tuple[Letter]:
+    """random word over the grammar's alphabet, usually rejected by the grammar"""
+    rng = random.Random(seed)
+    alphabet = sorted(cfg.all_alphabet())
+    return tuple(rng.choice(alphabet) for _ in range(length))
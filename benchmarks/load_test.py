@@ -0,0 +1,284 @@
+"""send many concurrent queries to `serve.py` and measure throughput and latency
+
+```
+python -m benchmarks.load_test
+python -m benchmarks.load_test --clients 64 --requests 200 --op tree
+python -m benchmarks.load_test --socket /tmp/cfg-tools.sock --grammar examples/cfg03.txt
+python -m benchmarks.load_test --cli-calls 20
+```
+
+without `--socket` or `--port`, a server is started for the test and stopped
+after it, and it's also checked that a grammar whose CNF never finishes only
+stops its own queries. the answers to `accepts` queries are checked against CYK
+run here
+"""
+
+if __name__ == "__main__":
+    import sys, os
+
+    sys.path.insert(1, os.path.join(sys.path[0], ".."))
+
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from obj.cfg import word_to_str
+from processors_cfg.cnf import to_cnf
+from processors_cfg.cyk_batch import batch_accepts
+from tools.cfg_parse import spaced_exclam_to_word, text_to_cfg
+from benchmarks import generators
+
+ROOT = Path(__file__).resolve().parent.parent
+
+# `cnf` never finishes on this grammar
+STUCK_GRAMMAR = (
+    "format char\nstart S\nS -> C | SB\nA -> B | CSC | Ca\nB -> ba\nC -> e | S"
+)
+
+
+def default_grammar() -> str:
+    cfg = generators.random_cnf(10, 4, 4, seed=1)
+    text_format = cfg.min_format()
+    return f"format {text_format}\n{cfg.to_format(text_format)}"
+
+
+def make_words(text: str, count: int, length: int) -> list[str]:
+    """half sampled from the grammar, half random letters"""
+    cfg = text_to_cfg(text)
+    words = []
+    for seed in range(count):
+        if seed % 2 == 0:
+            word = generators.sample_word(cfg, length, seed)
+        else:
+            word = generators.random_word(cfg, length, seed)
+        words.append(word_to_str(word))
+    return words
+
+
+def make_request(op: str, word: str) -> dict:
+    if op == "accepts":
+        return {"op": "accepts", "word": word}
+    if op == "tree":
+        return {"op": "tree", "word": word}
+    return {"op": "spans", "text": word, "mode": "maximal"}
+
+
+async def open_connection(args):
+    if args.socket is not None:
+        return await asyncio.open_unix_connection(str(args.socket), limit=1 << 24)
+    return await asyncio.open_connection("127.0.0.1", args.port, limit=1 << 24)
+
+
+async def run_client(args, grammar_id: str, words: list[str], latencies: list):
+    """send the requests one after another, return the responses in order"""
+    reader, writer = await open_connection(args)
+    responses = []
+    for i, word in enumerate(words):
+        request = {"id": i, "grammar_id": grammar_id, **make_request(args.op, word)}
+        start = time.perf_counter()
+        writer.write(json.dumps(request).encode("utf8") + b"\n")
+        await writer.drain()
+        response = json.loads(await reader.readline())
+        latencies.append(time.perf_counter() - start)
+        if "error" in response:
+            raise Exception(f"Server error on {word}: {response['error']}")
+        responses.append(response)
+    writer.close()
+    return responses
+
+
+async def run_load(args, text: str, words: list[str]) -> dict:
+    reader, writer = await open_connection(args)
+    writer.write(json.dumps({"op": "load", "grammar": text}).encode("utf8") + b"\n")
+    await writer.drain()
+    grammar_id = json.loads(await reader.readline())["grammar_id"]
+    # a short run first, so the grammar's worker has compiled it
+    warm_up = words[: args.clients * 4]
+    await asyncio.gather(
+        *(
+            run_client(args, grammar_id, warm_up[i :: args.clients], [])
+            for i in range(args.clients)
+        )
+    )
+
+    latencies = []
+    per_client = [words[i :: args.clients] for i in range(args.clients)]
+    start = time.perf_counter()
+    results = await asyncio.gather(
+        *(run_client(args, grammar_id, w, latencies) for w in per_client)
+    )
+    elapsed = time.perf_counter() - start
+
+    writer.write(b'{"op": "stats"}\n')
+    await writer.drain()
+    stats = json.loads(await reader.readline())
+    writer.close()
+    answers = {}
+    for client_words, responses in zip(per_client, results):
+        for word, response in zip(client_words, responses):
+            answers[word] = response
+    latencies.sort()
+    return {
+        "requests": len(latencies),
+        "seconds": elapsed,
+        "requests_per_second": len(latencies) / elapsed,
+        "latency_p50": latencies[len(latencies) // 2],
+        "latency_p95": latencies[int(len(latencies) * 0.95)],
+        "latency_p99": latencies[int(len(latencies) * 0.99)],
+        "queries_per_batch": stats.get("batched_queries", 0)
+        / max(stats.get("batches", 0), 1),
+        "answers": answers,
+    }
+
+
+async def check_stuck_worker(args) -> float:
+    """send a query that never finishes and one about another grammar on the
+    same worker, return the seconds until both are answered"""
+    reader, writer = await open_connection(args)
+
+    async def send(request: dict):
+        writer.write(json.dumps(request).encode("utf8") + b"\n")
+        await writer.drain()
+
+    await send({"op": "stats"})
+    workers = json.loads(await reader.readline())["workers"]
+
+    def slot(text: str) -> int:
+        return int(hashlib.sha256(text.encode("utf8")).hexdigest()[:16], 16) % workers
+
+    # a grammar that the server sends to the same worker
+    other = next(
+        text
+        for n in range(1000)
+        for text in [f"format char\nstart S\nS -> aSb | e\n# {n}"]
+        if slot(text) == slot(STUCK_GRAMMAR)
+    )
+    start = time.perf_counter()
+    await send(
+        {"id": "stuck", "op": "accepts", "grammar": STUCK_GRAMMAR, "word": "b a"}
+    )
+    await send({"id": "other", "op": "accepts", "grammar": other, "word": "a a b b"})
+    responses = {}
+    for _ in range(2):
+        response = json.loads(
+            await asyncio.wait_for(reader.readline(), args.query_timeout * 3 + 10)
+        )
+        responses[response["id"]] = response
+    writer.close()
+    if "error" not in responses["stuck"]:
+        raise Exception(f"The stuck query was answered: {responses['stuck']}")
+    if responses["other"].get("accepted") is not True:
+        raise Exception(f"The other query got {responses['other']}")
+    return time.perf_counter() - start
+
+
+def check_answers(text: str, answers: dict) -> int:
+    """return the number of `accepts` answers that differ from CYK"""
+    cfg = to_cnf(text_to_cfg(text))
+    words = list(answers)
+    expected = batch_accepts(cfg, [spaced_exclam_to_word(w) for w in words])
+    return sum(answers[w]["accepted"] != e for w, e in zip(words, expected))
+
+
+def time_cli_calls(text: str, words: list[str], calls: int) -> float:
+    """return the seconds per `main.py` run that tests one word"""
+    with tempfile.TemporaryDirectory() as folder:
+        path = Path(folder) / "grammar.txt"
+        path.write_text(text + "\naction cyk_bnf\n", encoding="utf8")
+        start = time.perf_counter()
+        for word in words[:calls]:
+            subprocess.run(
+                [sys.executable, str(ROOT / "main.py"), str(path), "-O"]
+                + [f"word={word}"],
+                cwd=ROOT,
+                stdout=subprocess.DEVNULL,
+                check=True,
+            )
+        return (time.perf_counter() - start) / calls
+
+
+def start_server(args, folder: str) -> subprocess.Popen:
+    args.socket = Path(folder) / "cfg-tools.sock"
+    command = [sys.executable, str(ROOT / "serve.py"), "--socket", str(args.socket)]
+    if args.jobs is not None:
+        command += ["--jobs", str(args.jobs)]
+    command += ["--query-timeout", str(args.query_timeout)]
+    server = subprocess.Popen(command, cwd=ROOT, stdout=subprocess.PIPE, text=True)
+    # the server prints a line once it's listening
+    server.stdout.readline()
+    return server
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Load test the grammar service.")
+    where = ap.add_mutually_exclusive_group()
+    where.add_argument("--socket", type=Path, help="Unix socket of a running server")
+    where.add_argument("--port", type=int, help="TCP port of a running server")
+    ap.add_argument("--jobs", type=int, help="Workers of the server started here")
+    ap.add_argument(
+        "--query-timeout",
+        type=float,
+        default=2.0,
+        help="Query timeout of the server started here, in seconds",
+    )
+    ap.add_argument("--grammar", type=Path, help="Input file of the grammar to query")
+    ap.add_argument("--op", choices=("accepts", "tree", "spans"), default="accepts")
+    ap.add_argument("--clients", type=int, default=32, help="Concurrent connections")
+    ap.add_argument("--requests", type=int, default=2000, help="Requests in total")
+    ap.add_argument("--length", type=int, default=12, help="Length of the words")
+    ap.add_argument(
+        "--cli-calls",
+        type=int,
+        default=0,
+        help="Also time this many `main.py` runs of one word each",
+    )
+    ap.add_argument("--output", type=Path, help="Write results to this JSON file")
+    args = ap.parse_args(argv)
+
+    if args.grammar is not None:
+        text = args.grammar.read_text(encoding="utf8")
+    else:
+        text = default_grammar()
+    # each request gets its own word, so batching can't just reuse answers
+    words = list(dict.fromkeys(make_words(text, args.requests, args.length)))
+
+    with tempfile.TemporaryDirectory() as folder:
+        server = None
+        if args.socket is None and args.port is None:
+            server = start_server(args, folder)
+        try:
+            results = asyncio.run(run_load(args, text, words))
+            if server is not None:
+                results["stuck_worker_seconds"] = asyncio.run(check_stuck_worker(args))
+        finally:
+            if server is not None:
+                server.terminate()
+                # the server must stop even with a worker stuck
+                server.wait(timeout=10)
+
+    answers = results.pop("answers")
+    if args.op == "accepts":
+        results["wrong_answers"] = check_answers(text, answers)
+    if args.cli_calls > 0:
+        results["cli_seconds_per_call"] = time_cli_calls(text, words, args.cli_calls)
+    for key, value in results.items():
+        if isinstance(value, float):
+            print(f"{key}: {value:.4f}")
+        else:
+            print(f"{key}: {value}")
+    if args.output is not None:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+    if results.get("wrong_answers"):
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,246 @@
+"""time the main stages of the tool on synthetic grammars
+
+```
+python -m benchmarks.run
+python -m benchmarks.run --output bench.json
+python -m benchmarks.run --baseline bench.json
+```
+"""
+
+if __name__ == "__main__":
+    import sys, os
+
+    sys.path.insert(1, os.path.join(sys.path[0], ".."))
+
+import argparse
+import contextlib
+import io
+import json
+import platform
+import sys
+import time
+from pathlib import Path
+
+import tools.cfg_parse
+import tools.fromtext
+import processors_cfg.bnf as bnf
+import processors_cfg.cnf as cnf
+import processors_cfg.cyk as cyk
+import processors_cfg.cyk_batch as cyk_batch
+import processors_cfg.cyk_bnf as cyk_bnf
+import processors_cfg.cyk_chart as cyk_chart
+import processors_cfg.pda as pda
+import processors_cfg.pda_run as pda_run
+from processors_cfg.compare import compare_cfgs
+from obj.cfg import CFG, word_to_str
+from benchmarks import generators
+
+CNF_PHASES = (
+    ("cnf_start", cnf.need_start, cnf.cnf_start),
+    ("cnf_bin", cnf.need_bin, cnf.cnf_bin),
+    ("cnf_del", cnf.need_del, cnf.cnf_del),
+    ("cnf_unit", cnf.need_unit, cnf.cnf_unit),
+    ("cnf_term", cnf.need_term, cnf.cnf_term),
+    ("cnf_merge", cnf.need_merge, cnf.cnf_merge),
+)
+
+# the PDA search can blow up, cases over this limit aren't cross-checked with CYK
+PDA_MAX_CONFIGURATIONS = 200000
+
+# the CNF is compared with the input up to this length
+COMPARE_MAX_LENGTH = 8
+
+
+def suite(scale: int = 1):
+    """return the benchmark cases as (name, cfg, word length)"""
+    return [
+        ("random_cnf", generators.random_cnf(10 * scale, 4, 4, seed=1), 12 * scale),
+        ("ambiguous", generators.ambiguous(), 24 * scale),
+        ("unit_chain", generators.unit_chain(30 * scale), 12 * scale),
+        ("epsilon_nesting", generators.epsilon_nesting(6 * scale), 20 * scale),
+        ("wide_alphabet", generators.wide_alphabet(300 * scale), 20 * scale),
+        ("bounded_blocks", generators.bounded_blocks(8 * scale, 4), 40 * scale),
+    ]
+
+
+def best_time(fn, repeat: int):
+    """run `fn` `repeat` times, return the fastest time and the last result"""
+    best = None
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            result = fn()
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best, result
+
+
+def run_case(cfg: CFG, word_length: int, repeat: int, seed: int = 0) -> dict:
+    """time every stage on one grammar, return a dict of stage name -> seconds"""
+    timings = {}
+    text_format = cfg.min_format()
+    word_converter = {
+        "char": tools.cfg_parse.chars_to_word,
+        "spaced": tools.cfg_parse.spaced_to_word,
+        "spaced!": tools.cfg_parse.spaced_exclam_to_word,
+    }[text_format]
+    parse_lines, _ = tools.fromtext.text_to_lines_lists(cfg.to_format(text_format))
+    timings["parse"], parsed = best_time(
+        lambda: tools.cfg_parse.lines_to_cfg(parse_lines, word_converter), repeat
+    )
+
+    converted = parsed
+    for name, need_fn, phase_fn in CNF_PHASES:
+
+        def run_phase(cfg=converted, need_fn=need_fn, phase_fn=phase_fn):
+            while need_fn(cfg):
+                cfg = phase_fn(cfg)
+            return cfg
+
+        timings[name], converted = best_time(run_phase, repeat)
+
+    timings["compare"], (_, difference, _) = best_time(
+        lambda: compare_cfgs(parsed, converted, COMPARE_MAX_LENGTH, 5, seed), repeat
+    )
+    if difference is not None:
+        raise Exception(
+            f"CNF and input differ at length {difference[0]}: "
+            f"{word_to_str(difference[1])}"
+        )
+
+    word = generators.sample_word(cfg, word_length, seed)
+    accepted = False
+    if len(word) > 0:
+        timings["make_cyk_table"], table = best_time(
+            lambda: cyk.make_cyk_table(converted, word), repeat
+        )
+        accepted = converted.start_variable in table.get_letters(table.final_pos())
+    if len(word) > 0:
+        # every prefix of the word, the best case for sharing chart columns
+        prefixes = [word[:i] for i in range(1, len(word) + 1)]
+        timings["cyk_batch"], batch_results = best_time(
+            lambda: cyk_batch.batch_accepts(converted, prefixes), repeat
+        )
+        if batch_results[-1] != accepted:
+            raise Exception(f"Batch CYK and CYK disagree on {word_to_str(word)}!")
+        # re-parse after replacing the middle letter, with the same letter
+        chart = cyk_chart.CYKChart(converted, word)
+        middle = len(word) // 2
+        timings["cyk_edit"], _ = best_time(
+            lambda: chart.replace(middle, word[middle]), repeat
+        )
+        if chart.accepted() != accepted:
+            raise Exception(
+                f"Edited CYK chart and CYK disagree on {word_to_str(word)}!"
+            )
+    if len(word) > 0:
+        # the binarized grammar keeps its unit and e rules
+        timings["bnf"], binarized = best_time(lambda: bnf.to_bnf(parsed), repeat)
+        timings["cyk_bnf"], bnf_chart = best_time(
+            lambda: cyk_bnf.UnitClosureChart(binarized[0], word), repeat
+        )
+        if bnf_chart.accepted() != accepted:
+            raise Exception(
+                f"Unit-closure CYK and CYK disagree on {word_to_str(word)}!"
+            )
+    if accepted:
+        timings["cyk_table_to_tree"], _ = best_time(
+            lambda: cyk.cyk_table_to_tree(table, converted), repeat
+        )
+    timings["to_pda"], _ = best_time(lambda: pda.to_pda(parsed), repeat)
+    pda_object = pda.cfg_to_pda(parsed)
+    timings["pda_run"], run = best_time(
+        lambda: pda_run.run_pda(pda_object, word, PDA_MAX_CONFIGURATIONS), repeat
+    )
+    if len(word) > 0 and not run.gave_up and run.accepted != accepted:
+        raise Exception(f"PDA and CYK disagree on {word_to_str(word)}!")
+    return {
+        "rules": len(cfg.rules),
+        "cnf_rules": len(converted.rules),
+        "word_length": len(word),
+        "accepted": accepted,
+        "timings": timings,
+    }
+
+
+def compare(
+    results: dict, baseline: dict, threshold: float, min_time: float = 0.001
+) -> list[str]:
+    """return a line for every stage that got slower than `threshold` times the baseline
+
+    stages faster than `min_time` seconds in the baseline are too noisy to compare"""
+    regressions = []
+    for case, data in results["cases"].items():
+        old_case = baseline["cases"].get(case)
+        if old_case is None:
+            continue
+        for stage, seconds in data["timings"].items():
+            old_seconds = old_case["timings"].get(stage)
+            if old_seconds is None or old_seconds < min_time:
+                continue
+            ratio = seconds / old_seconds
+            line = f"{case}.{stage}: {old_seconds:.4f}s -> {seconds:.4f}s ({ratio:.2f}x)"
+            print("  " + line)
+            if ratio > threshold:
+                regressions.append(line)
+    return regressions
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Benchmark the CFG tools.")
+    ap.add_argument("--output", type=Path, help="Write results to this JSON file")
+    ap.add_argument("--baseline", type=Path, help="Compare results to this JSON file")
+    ap.add_argument("--scale", type=int, default=1, help="Grammar and word size multiplier")
+    ap.add_argument("--repeat", type=int, default=3, help="Runs per stage, best time is kept")
+    ap.add_argument(
+        "--threshold",
+        type=float,
+        default=1.25,
+        help="Slowdown ratio over the baseline that counts as a regression",
+    )
+    ap.add_argument(
+        "--min-time",
+        type=float,
+        default=0.001,
+        help="Ignore stages faster than this many seconds in the baseline",
+    )
+    ap.add_argument("--case", action="append", help="Only run cases with this name")
+    args = ap.parse_args(argv)
+
+    results = {
+        "python": platform.python_version(),
+        "scale": args.scale,
+        "repeat": args.repeat,
+        "cases": {},
+    }
+    for name, cfg, word_length in suite(args.scale):
+        if args.case and name not in args.case:
+            continue
+        print(f"Running {name}...")
+        results["cases"][name] = run_case(cfg, word_length, args.repeat)
+        for stage, seconds in results["cases"][name]["timings"].items():
+            print(f"  {stage}: {seconds:.4f}s")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"Results written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        print(f"Comparing to {args.baseline}...")
+        regressions = compare(results, baseline, args.threshold, args.min_time)
+        if regressions:
+            print("Regressions found:")
+            for line in regressions:
+                print("  " + line)
+            return 1
+        print("No regressions found!")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
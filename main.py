@@ -1,47 +1,36 @@
 import argparse
+import glob
+import io
+import json
+import os
+import sys
+import time
+import traceback
 import tools.fromtext
 import tools.cfg_parse
 import processors_cfg.clone
 import processors_cfg.latex
 import processors_cfg.interactive
 import processors_cfg.cnf
+import processors_cfg.bnf
 import processors_cfg.pda
+import processors_cfg.pda_run
 import processors_cfg.cyk
+import processors_cfg.cyk_batch
+import processors_cfg.cyk_correct
+import processors_cfg.cyk_spans
+import processors_cfg.cyk_bnf
+import processors_cfg.regular
+import processors_cfg.compare
+import processors_cfg.auto
+import processors_cfg.witness
+from tools import options, profiling
+from tools.common import path_with_suffix
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from contextlib import nullcontext, redirect_stdout
 from pathlib import Path
 
-# get cmd arguments
-ap = argparse.ArgumentParser(
-    description="Processes a *.txt file containing graph information."
-)
-ap.add_argument(
-    "path", metavar="txt_path", type=Path, help="Path to the *.txt file to process"
-)
-cmd_args = ap.parse_args()
-
-# load file
-with open(cmd_args.path, encoding="utf8") as f:
-    full_text = f.read()
-
-parse_lines, meta_lines = tools.fromtext.text_to_lines_lists(full_text)
-meta_data = tools.fromtext.parse_meta_lines(meta_lines)
-
-# quit if meta data isn't enough
-if len(meta_data["format"]) == 0:
-    print(f"Format is unspecified! Include `format xxx` in the text file.")
-    quit()
-
-# define parsers and processors
-parsers = {
-    "char": lambda pl: tools.cfg_parse.lines_to_cfg(
-        pl, tools.cfg_parse.chars_to_word
-    ),
-    "spaced": lambda pl: tools.cfg_parse.lines_to_cfg(
-        pl, tools.cfg_parse.spaced_to_word
-    ),
-    "spaced!": lambda pl: tools.cfg_parse.lines_to_cfg(
-        pl, tools.cfg_parse.spaced_exclam_to_word
-    ),
-}
+# define processors
 processors = {
     "clone": processors_cfg.clone.process,
     "clone_char": lambda cfg, path: processors_cfg.clone.process(cfg, path, "char"),
@@ -54,37 +43,302 @@ processors = {
     "latex": processors_cfg.latex.process,
     "interactive": processors_cfg.interactive.process,
     "cnf": processors_cfg.cnf.process,
+    "bnf": processors_cfg.bnf.process,
     "pda": processors_cfg.pda.process,
+    "pda_run": processors_cfg.pda_run.process,
     "cyk": processors_cfg.cyk.process,
+    "cyk_batch": processors_cfg.cyk_batch.process,
+    "cyk_correct": processors_cfg.cyk_correct.process,
+    "cyk_spans": processors_cfg.cyk_spans.process,
+    "cyk_bnf": processors_cfg.cyk_bnf.process,
+    "dfa": processors_cfg.regular.process,
+    "compare": processors_cfg.compare.process,
+    "auto": processors_cfg.auto.process,
+    "witness": processors_cfg.witness.process,
 }
 
-# parse input lines
-print("Parsing input file...")
-try:
-    parse_fn = parsers[meta_data["format"][0]]
-except KeyError:
-    raise tools.fromtext.MetaError(
-        f"Unknown format {meta_data['format'][0]}"
+# actions that only make sense with someone at the keyboard, skipped when many
+# files are processed
+INTERACTIVE_ACTIONS = ("interactive",)
+
+
+def parse_args(argv=None):
+    ap = argparse.ArgumentParser(
+        description="Processes *.txt files containing graph information."
+    )
+    ap.add_argument(
+        "paths",
+        metavar="txt_path",
+        nargs="+",
+        help="Paths or glob patterns (e.g. 'examples/**/*.txt') of the *.txt files "
+        "to process",
+    )
+    ap.add_argument(
+        "--profile",
+        action="store_true",
+        help="Record time, peak memory and counters per action into a JSON report",
+    )
+    ap.add_argument(
+        "--profile-output",
+        metavar="json_path",
+        type=Path,
+        help="Path of the JSON report, default is *_profile.json next to the input",
+    )
+    ap.add_argument(
+        "--cprofile",
+        metavar="action",
+        action="append",
+        default=[],
+        help="Dump cProfile stats of the given action to *_ACTION.prof",
+    )
+    ap.add_argument(
+        "-O",
+        "--option",
+        metavar="key[=value]",
+        action="append",
+        default=[],
+        help="Set an option, overriding `option` lines in the input file",
+    )
+    ap.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=os.cpu_count() or 1,
+        help="Number of files to process at once, default is the number of CPUs",
+    )
+    ap.add_argument(
+        "--summary-output",
+        metavar="json_path",
+        type=Path,
+        help="Path of the JSON timing summary when there are many files, "
+        "default is summary.json in the folder of the inputs",
+    )
+    return ap, ap.parse_args(argv)
+
+
+def expand_paths(patterns: list[str]) -> list[Path]:
+    """return the files that the paths and glob patterns match, each file once"""
+    paths = []
+    seen = set()
+    for pattern in patterns:
+        if glob.has_magic(pattern):
+            matches = sorted(glob.glob(pattern, recursive=True))
+        else:
+            matches = [pattern]
+        for match in matches:
+            path = Path(match)
+            if path.is_dir() or path.resolve() in seen:
+                continue
+            seen.add(path.resolve())
+            paths.append(path)
+    return paths
+
+
+def run_file(
+    path: Path,
+    option_args: list[str],
+    profile: bool = False,
+    profile_output: Path = None,
+    cprofile: list[str] = (),
+    batch: bool = False,
+    result: dict = None,
+) -> dict:
+    """parse an input file and run its actions
+
+    return the seconds each action took, in `result` if given, so the actions
+    done so far are known if one fails. with `batch`, files without a format
+    line are skipped and interactive actions are skipped"""
+    if result is None:
+        result = {}
+    result.update({"path": str(path), "status": "ok", "actions": {}})
+    start = time.perf_counter()
+    if profile:
+        profiling.reset()
+        profiling.enable()
+
+    # load file
+    with open(path, encoding="utf8") as f:
+        full_text = f.read()
+
+    parse_lines, meta_lines = tools.fromtext.text_to_lines_lists(full_text)
+    meta_data = tools.fromtext.parse_meta_lines(meta_lines)
+
+    options.set_options(
+        {
+            **tools.fromtext.parse_option_lines(meta_data["option"]),
+            **tools.fromtext.parse_option_args(option_args),
+        }
     )
 
-parsed_thing = parse_fn(parse_lines)
-print("Parsing success!")
+    # quit if meta data isn't enough
+    if len(meta_data["format"]) == 0:
+        print(f"Format is unspecified! Include `format xxx` in the text file.")
+        result["status"] = "skipped"
+        result["seconds"] = time.perf_counter() - start
+        return result
+
+    # parse input lines
+    print("Parsing input file...")
+    word_converter = tools.cfg_parse.format_to_word_converter(meta_data["format"][0])
+
+    with profiling.phase("parse"):
+        parsed_thing = tools.cfg_parse.lines_to_cfg(parse_lines, word_converter)
+    print("Parsing success!")
 
-for action in meta_data["action"]:
-    action = action.lower()
+    for action in meta_data["action"]:
+        action = action.lower()
+        try:
+            action_fn = processors[action]
+        except KeyError:
+            print(f"Unknown action '{action}'")
+            continue
+        action: str
+        if batch and action in INTERACTIVE_ACTIONS:
+            print(f"{action.capitalize()}: Skipped, it's interactive")
+            continue
+        print(f"{action.capitalize()}: Starting...")
+        result["action"] = action
+        if action in cprofile:
+            cprofile_path = path_with_suffix(path, action).with_suffix(".prof")
+            cprofile_context = profiling.cprofile_to(cprofile_path)
+        else:
+            cprofile_context = nullcontext()
+        action_start = time.perf_counter()
+        with profiling.phase(f"action_{action}"), cprofile_context:
+            action_fn(parsed_thing, path)
+        result["actions"][action] = time.perf_counter() - action_start
+        del result["action"]
+        print(f"{action.capitalize()}: Success!")
+
+    if profile:
+        report_path = profile_output or path_with_suffix(path, "profile").with_suffix(
+            ".json"
+        )
+        profiling.write_report(report_path)
+        print(f"Profile written to {report_path}")
+    result["seconds"] = time.perf_counter() - start
+    return result
+
+
+def run_file_quietly(path: Path, *args) -> dict:
+    """`run_file` in batch mode, with the printed output and errors kept in the
+    result instead"""
+    output = io.StringIO()
+    result = {}
+    start = time.perf_counter()
+    # nobody can answer prompts here, `input()` gets EOFError instead of waiting
+    stdin = sys.stdin
+    sys.stdin = io.StringIO()
     try:
-        action_fn = processors[action]
-    except KeyError:
-        print(f"Unknown action '{action}'")
-        continue
-    action: str
-    print(f"{action.capitalize()}: Starting...")
-    action_fn(parsed_thing, cmd_args.path)
-    print(f"{action.capitalize()}: Success!")
-
-# print(parsed_thing)
-# print(parsed_thing.rules)
-
-# print(parsed_thing.min_format())
-# print(parsed_thing.to_latex())
-# a = parsed_thing
+        with redirect_stdout(output):
+            run_file(path, *args, batch=True, result=result)
+    except EOFError:
+        result["status"] = "failed"
+        result["error"] = "It asked for input, give it with options instead"
+    except Exception as e:
+        result["status"] = "failed"
+        result["error"] = f"{type(e).__name__}: {e}"
+        result["traceback"] = traceback.format_exc()
+    finally:
+        sys.stdin = stdin
+    if "action" in result:
+        result["error"] = f"{result['action']}: {result['error']}"
+    result.setdefault("seconds", time.perf_counter() - start)
+    result["output"] = output.getvalue()
+    return result
+
+
+def run_batch(paths: list[Path], jobs: int, run_args: tuple) -> list[dict]:
+    """run every file in a pool of `jobs` processes, printing progress as they
+    finish"""
+    results = []
+
+    def report(result: dict):
+        results.append(result)
+        line = f"[{len(results)}/{len(paths)}] {result['path']}: {result['status']}"
+        print(f"{line} ({result['seconds']:.2f}s)")
+        if result["status"] == "failed":
+            print(f"  {result['error']}")
+
+    if jobs <= 1:
+        for path in paths:
+            report(run_file_quietly(path, *run_args))
+        return results
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        futures = [executor.submit(run_file_quietly, p, *run_args) for p in paths]
+        for future in as_completed(futures):
+            report(future.result())
+    return results
+
+
+def summarize(results: list[dict], seconds: float) -> dict:
+    statuses = {}
+    action_seconds = {}
+    for result in results:
+        statuses[result["status"]] = statuses.get(result["status"], 0) + 1
+        for action, action_time in result["actions"].items():
+            action_seconds[action] = action_seconds.get(action, 0) + action_time
+    slowest = sorted(results, key=lambda r: r["seconds"], reverse=True)
+    return {
+        "files": len(results),
+        "statuses": statuses,
+        "wall_seconds": seconds,
+        "cpu_seconds": sum(r["seconds"] for r in results),
+        "action_seconds": action_seconds,
+        "slowest": [{"path": r["path"], "seconds": r["seconds"]} for r in slowest[:10]],
+        "failed": [
+            {
+                k: r[k]
+                for k in ("path", "action", "error", "traceback", "output")
+                if k in r
+            }
+            for r in results
+            if r["status"] == "failed"
+        ],
+        "results": [
+            {k: r[k] for k in ("path", "status", "seconds", "actions")}
+            for r in sorted(results, key=lambda r: r["path"])
+        ],
+    }
+
+
+def main(argv=None):
+    ap, cmd_args = parse_args(argv)
+    paths = expand_paths(cmd_args.paths)
+    if len(paths) == 0:
+        ap.error("no input files match")
+    if len(paths) == 1:
+        run_file(
+            paths[0],
+            cmd_args.option,
+            cmd_args.profile,
+            cmd_args.profile_output,
+            cmd_args.cprofile,
+        )
+        return
+    if cmd_args.profile_output is not None:
+        ap.error("--profile-output only works with one input file")
+    run_args = (cmd_args.option, cmd_args.profile, None, cmd_args.cprofile)
+
+    start = time.perf_counter()
+    results = run_batch(paths, cmd_args.jobs, run_args)
+    summary = summarize(results, time.perf_counter() - start)
+    counts = ", ".join(f"{n} {status}" for status, n in summary["statuses"].items())
+    print(f"{summary['files']} files: {counts} in {summary['wall_seconds']:.2f}s")
+    for action, action_time in sorted(
+        summary["action_seconds"].items(), key=lambda item: item[1], reverse=True
+    ):
+        print(f"  {action}: {action_time:.2f}s")
+    summary_path = cmd_args.summary_output
+    if summary_path is None:
+        folder = os.path.commonpath([p.resolve().parent for p in paths])
+        summary_path = Path(folder) / "summary.json"
+    with open(summary_path, "w", encoding="utf-8") as f:
+        json.dump(summary, f, indent=2)
+    print(f"Summary written to {summary_path}")
+    if summary["statuses"].get("failed"):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
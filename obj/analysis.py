@@ -0,0 +1,423 @@
+from collections import defaultdict, deque
+from typing import Optional
+from obj.cfg import CFG, Letter, Rule, rule_to_str
+
+# FOLLOW sets contain this marker for variables that can end the word
+END_MARKER = Letter("$", False)
+
+
+def cached(method):
+    """compute a property of the grammar on the first call, then reuse it"""
+    name = method.__name__
+
+    def wrapper(self):
+        if name not in self._cache:
+            self._cache[name] = method(self)
+        return self._cache[name]
+
+    wrapper.__name__ = name
+    wrapper.__doc__ = method.__doc__
+    return wrapper
+
+
+class GrammarAnalysis:
+    """properties of a CFG, each one computed once on first use
+
+    get one with `CFG.analysis()`, which makes a new one whenever the rules or
+    the start variable change. the results are shared, so don't modify them"""
+
+    def __init__(self, cfg: CFG):
+        self.cfg = cfg
+        self._cache = {}
+
+    @cached
+    def rules_map(self) -> dict[Letter, list[Rule]]:
+        return self.cfg.rules_map()
+
+    @cached
+    def all_letters(self) -> set[Letter]:
+        return self.cfg.all_letters()
+
+    @cached
+    def all_variables(self) -> set[Letter]:
+        return set(l for l in self.all_letters() if l.is_variable)
+
+    @cached
+    def all_alphabet(self) -> set[Letter]:
+        return set(l for l in self.all_letters() if not l.is_variable)
+
+    @cached
+    def min_format(self) -> str:
+        return self.cfg.min_format()
+
+    @cached
+    def terminal_classes(self) -> dict[Letter, frozenset[Letter]]:
+        """letter -> the variables with a rule `A -> letter`, letters with the same
+        variables share one frozenset, letters without any are missing"""
+        producers = defaultdict(set)
+        for rule in self.cfg.rules:
+            output_word = rule.output_word
+            if len(output_word) == 1 and not output_word[0].is_variable:
+                producers[output_word[0]].add(rule.input_letter)
+        classes = {}
+        result = {}
+        for letter, variables in producers.items():
+            variables = frozenset(variables)
+            result[letter] = classes.setdefault(variables, variables)
+        return result
+
+    @cached
+    def nullable(self) -> set[Letter]:
+        """variables that can produce the empty word"""
+        return set(self.null_rules())
+
+    @cached
+    def null_rules(self) -> dict[Letter, Rule]:
+        """a rule for every variable that can produce the empty word
+
+        each rule only uses variables that became nullable before it, so
+        following the rules always terminates. a rule is used once all of its
+        variables are nullable, found with a count of the variables left per
+        rule, so every rule is looked at once per letter"""
+        # rule number -> variables of the rule not known to be nullable yet
+        left = []
+        # variable -> rule numbers, once per time it appears in the rule
+        uses = defaultdict(list)
+        rules = sorted(self.cfg.rules, key=rule_to_str)
+        queue = deque()
+        for i, rule in enumerate(rules):
+            output_word = rule.output_word
+            left.append(len(output_word))
+            if any(not l.is_variable for l in output_word):
+                continue
+            for letter in output_word:
+                uses[letter].append(i)
+            if not output_word:
+                queue.append(i)
+        result = {}
+        while queue:
+            rule = rules[queue.popleft()]
+            variable = rule.input_letter
+            if variable in result:
+                continue
+            result[variable] = rule
+            for i in uses[variable]:
+                left[i] -= 1
+                if left[i] == 0:
+                    queue.append(i)
+        return result
+
+    @cached
+    def generating(self) -> set[Letter]:
+        """variables that produce at least one word"""
+        return set(self.min_yield())
+
+    @cached
+    def reachable(self) -> set[Letter]:
+        """variables that appear in some sentential form of the start variable"""
+        start = self.cfg.start_variable
+        if start is None:
+            return set()
+        rules_map = self.rules_map()
+        reachable = {start}
+        stack = [start]
+        while stack:
+            variable = stack.pop()
+            for rule in rules_map.get(variable, ()):
+                for letter in rule.output_word:
+                    if letter.is_variable and letter not in reachable:
+                        reachable.add(letter)
+                        stack.append(letter)
+        return reachable
+
+    @cached
+    def first(self) -> dict[Letter, set[Letter]]:
+        """letters that the words of each variable can start with"""
+        nullable = self.nullable()
+        first = {v: set() for v in self.all_variables()}
+        changed = True
+        while changed:
+            changed = False
+            for rule in self.cfg.rules:
+                letters = first[rule.input_letter]
+                size = len(letters)
+                for letter in rule.output_word:
+                    if not letter.is_variable:
+                        letters.add(letter)
+                        break
+                    letters |= first[letter]
+                    if letter not in nullable:
+                        break
+                if len(letters) != size:
+                    changed = True
+        return first
+
+    @cached
+    def follow(self) -> dict[Letter, set[Letter]]:
+        """letters that can come right after each variable in a sentential form of
+        the start variable, `END_MARKER` if the variable can end the word"""
+        nullable = self.nullable()
+        first = self.first()
+        follow = {v: set() for v in self.all_variables()}
+        if self.cfg.start_variable is not None:
+            follow[self.cfg.start_variable].add(END_MARKER)
+        changed = True
+        while changed:
+            changed = False
+            for rule in self.cfg.rules:
+                # letters that can follow the current position, right to left
+                trailer = set(follow[rule.input_letter])
+                for letter in reversed(rule.output_word):
+                    if not letter.is_variable:
+                        trailer = {letter}
+                        continue
+                    size = len(follow[letter])
+                    follow[letter] |= trailer
+                    if len(follow[letter]) != size:
+                        changed = True
+                    if letter in nullable:
+                        trailer = trailer | first[letter]
+                    else:
+                        trailer = set(first[letter])
+        return follow
+
+    @cached
+    def min_yield(self) -> dict[Letter, int]:
+        """length of the shortest word of each generating variable"""
+        from processors_cfg.witness import min_lengths
+
+        return min_lengths(self.cfg)
+
+    @cached
+    def max_yield(self) -> dict[Letter, int]:
+        """length of the longest word of each generating variable, None if there
+        is no longest word"""
+        generating = self.generating()
+        # rules that produce words, the other rules don't affect the lengths
+        rules = [
+            r
+            for r in self.cfg.rules
+            if all(l in generating for l in r.output_word if l.is_variable)
+        ]
+        lengths = {v: 0 for v in generating}
+
+        def relax() -> set[Letter]:
+            changed = set()
+            for rule in rules:
+                total = sum(
+                    lengths[l] if l.is_variable else 1 for l in rule.output_word
+                )
+                if total > lengths[rule.input_letter]:
+                    lengths[rule.input_letter] = total
+                    changed.add(rule.input_letter)
+            return changed
+
+        # lengths are final after one round per variable, unless a variable can
+        # produce itself with more letters around it
+        for _ in range(len(generating)):
+            if not relax():
+                break
+        unbounded = relax()
+        changed = True
+        while changed:
+            changed = False
+            for rule in rules:
+                if rule.input_letter in unbounded:
+                    continue
+                if any(l in unbounded for l in rule.output_word):
+                    unbounded.add(rule.input_letter)
+                    changed = True
+        return {v: None if v in unbounded else lengths[v] for v in generating}
+
+    @cached
+    def min_context(self) -> dict[Letter, int]:
+        """fewest letters around each variable in a sentential form of the start
+        variable that can still produce a word, variables without one are missing"""
+        min_yield = self.min_yield()
+        start = self.cfg.start_variable
+        if start not in min_yield:
+            return {}
+        context = {start: 0}
+        changed = True
+        while changed:
+            changed = False
+            for rule in self.cfg.rules:
+                outer = context.get(rule.input_letter)
+                if outer is None:
+                    continue
+                lengths = [
+                    min_yield.get(l) if l.is_variable else 1 for l in rule.output_word
+                ]
+                if None in lengths:
+                    continue
+                total = sum(lengths)
+                for letter, length in zip(rule.output_word, lengths):
+                    if not letter.is_variable:
+                        continue
+                    new_context = outer + total - length
+                    if letter not in context or new_context < context[letter]:
+                        context[letter] = new_context
+                        changed = True
+        return context
+
+    @cached
+    def variable_classes(self) -> dict[Letter, Letter]:
+        """variable -> the variable that can replace it, for variables with the
+        same rules once the variables that replace each other are treated as one
+
+        all variables start in one block except the start variable, and blocks
+        are split by their rules until no block splits. each block is replaced
+        by its variable with the shortest name"""
+        rules_map = self.rules_map()
+        start = self.cfg.start_variable
+        variables = sorted(self.all_variables(), key=lambda v: (len(v.name), v.name))
+        blocks = {v: int(v == start) for v in variables}
+        num_blocks = len(set(blocks.values()))
+        while True:
+            signatures = {}
+            new_blocks = {}
+            for variable in variables:
+                outputs = frozenset(
+                    tuple(blocks[l] if l.is_variable else l for l in r.output_word)
+                    for r in rules_map.get(variable, ())
+                )
+                signature = (blocks[variable], outputs)
+                new_blocks[variable] = signatures.setdefault(signature, len(signatures))
+            blocks = new_blocks
+            if len(signatures) == num_blocks:
+                break
+            num_blocks = len(signatures)
+        representatives = {}
+        return {v: representatives.setdefault(blocks[v], v) for v in variables}
+
+    @cached
+    def components(self) -> list[frozenset[Letter]]:
+        """strongly connected components of the variables, where a variable is
+        linked to the variables in its rules. components come after the
+        components they use (Tarjan)"""
+        rules_map = self.rules_map()
+        successors = {
+            v: [l for r in rules_map.get(v, ()) for l in r.output_word if l.is_variable]
+            for v in self.all_variables()
+        }
+        index = {}
+        low = {}
+        stack = []
+        on_stack = set()
+        result = []
+        for root in sorted(successors, key=lambda v: v.name):
+            if root in index:
+                continue
+            index[root] = low[root] = len(index)
+            stack.append(root)
+            on_stack.add(root)
+            # stack of (variable, iterator over its successors)
+            work = [(root, iter(successors[root]))]
+            while work:
+                variable, remaining = work[-1]
+                for successor in remaining:
+                    if successor not in index:
+                        index[successor] = low[successor] = len(index)
+                        stack.append(successor)
+                        on_stack.add(successor)
+                        work.append((successor, iter(successors[successor])))
+                        break
+                    if successor in on_stack:
+                        low[variable] = min(low[variable], index[successor])
+                else:
+                    work.pop()
+                    if work:
+                        parent = work[-1][0]
+                        low[parent] = min(low[parent], low[variable])
+                    if low[variable] == index[variable]:
+                        component = set()
+                        while True:
+                            member = stack.pop()
+                            on_stack.discard(member)
+                            component.add(member)
+                            if member == variable:
+                                break
+                        result.append(frozenset(component))
+        return result
+
+    @cached
+    def component_directions(self) -> dict[Letter, str]:
+        """variable -> where the rules of its component use the component
+
+        - "none": the variable can't produce itself
+        - "right": only as the last letter of the rules of the component
+        - "left": only as the first letter
+        - None: anywhere else, the component isn't regular on its own"""
+        rules_map = self.rules_map()
+        directions = {}
+        for component in self.components():
+            rules = [r for v in component for r in rules_map.get(v, ())]
+            recursive = len(component) > 1 or any(
+                l in component for r in rules for l in r.output_word
+            )
+            right = left = True
+            for rule in rules:
+                positions = [
+                    i for i, l in enumerate(rule.output_word) if l in component
+                ]
+                if any(i != len(rule.output_word) - 1 for i in positions):
+                    right = False
+                if any(i != 0 for i in positions):
+                    left = False
+            if not recursive:
+                direction = "none"
+            elif right:
+                direction = "right"
+            elif left:
+                direction = "left"
+            else:
+                direction = None
+            for variable in component:
+                directions[variable] = direction
+        return directions
+
+    @cached
+    def regular_kind(self) -> Optional[str]:
+        """how the variables reachable from the start variable make a regular
+        language: "right-linear", "left-linear" or "strongly regular" (every
+        component is right- or left-linear on its own), None if they don't"""
+        if self.cfg.start_variable is None:
+            return None
+        directions = self.component_directions()
+        reachable = self.reachable()
+        if any(directions.get(v, "none") is None for v in reachable):
+            return None
+        rules = [r for r in self.cfg.rules if r.input_letter in reachable]
+        letters = [[l.is_variable for l in r.output_word] for r in rules]
+        if all(not any(flags[:-1]) for flags in letters):
+            return "right-linear"
+        if all(not any(flags[1:]) for flags in letters):
+            return "left-linear"
+        return "strongly regular"
+
+    @cached
+    def cnf_violations(self) -> dict[str, int]:
+        """number of rules that each CNF step would change
+
+        - start: rules with the start variable on the right side
+        - bin: rules with more than 2 letters
+        - del: empty rules of other variables than the start variable
+        - unit: rules with a single variable
+        - term: rules with 2 letters where one of them isn't a variable"""
+        start = self.cfg.start_variable
+        counts = defaultdict(int)
+        for rule in self.cfg.rules:
+            output_word = rule.output_word
+            if start in output_word:
+                counts["start"] += 1
+            if len(output_word) > 2:
+                counts["bin"] += 1
+            elif len(output_word) == 2:
+                if not all(l.is_variable for l in output_word):
+                    counts["term"] += 1
+            elif len(output_word) == 1:
+                if output_word[0].is_variable:
+                    counts["unit"] += 1
+            elif rule.input_letter != start:
+                counts["del"] += 1
+        return {k: counts[k] for k in ("start", "bin", "del", "unit", "term")}
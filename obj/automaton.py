@@ -0,0 +1,97 @@
+from array import array
+from typing import Iterable, Optional
+from obj.cfg import Letter
+
+
+class NFA:
+    """a nondeterministic finite automaton with numbered states, transitions on
+    None read nothing"""
+
+    def __init__(self):
+        self.start_state: int = None
+        self.accept_states: set[int] = set()
+        # state -> {letter or None: target states}
+        self.transitions: list[dict[Optional[Letter], list[int]]] = []
+
+    def __repr__(self) -> str:
+        return f"<NFA: {self.num_states} states>"
+
+    @property
+    def num_states(self) -> int:
+        return len(self.transitions)
+
+    def add_state(self) -> int:
+        self.transitions.append({})
+        return len(self.transitions) - 1
+
+    def add_transition(self, start: int, letter: Optional[Letter], end: int):
+        self.transitions[start].setdefault(letter, []).append(end)
+
+    def alphabet(self) -> set[Letter]:
+        return set(l for t in self.transitions for l in t if l is not None)
+
+    def epsilon_closure(self, states: Iterable[int]) -> frozenset[int]:
+        """return the states reachable from the given states without reading"""
+        closure = set(states)
+        stack = list(closure)
+        while stack:
+            state = stack.pop()
+            for target in self.transitions[state].get(None, ()):
+                if target not in closure:
+                    closure.add(target)
+                    stack.append(target)
+        return frozenset(closure)
+
+
+class DFA:
+    """a deterministic finite automaton whose transitions are one flat array of
+    `num_states * len(alphabet)` targets, -1 is the dead state
+
+    a DFA without states accepts nothing"""
+
+    def __init__(self, alphabet: list[Letter], num_states: int, start_state: int):
+        self.alphabet = list(alphabet)
+        self.columns: dict[Letter, int] = {l: i for i, l in enumerate(self.alphabet)}
+        self.num_states = num_states
+        self.start_state = start_state
+        self.table = array("i", [-1]) * (num_states * len(self.alphabet))
+        self.accepting = bytearray(num_states)
+
+    def __repr__(self) -> str:
+        return f"<DFA: {self.num_states} states, {len(self.alphabet)} letters>"
+
+    def set_transition(self, start: int, letter: Letter, end: int):
+        self.table[start * len(self.alphabet) + self.columns[letter]] = end
+
+    def target(self, start: int, letter: Letter) -> int:
+        column = self.columns.get(letter)
+        if column is None:
+            return -1
+        return self.table[start * len(self.alphabet) + column]
+
+    def transitions(self):
+        """yield every (start, letter, end) that doesn't go to the dead state"""
+        width = len(self.alphabet)
+        for start in range(self.num_states):
+            for column, letter in enumerate(self.alphabet):
+                end = self.table[start * width + column]
+                if end >= 0:
+                    yield start, letter, end
+
+    def accepts(self, word: Iterable[Letter]) -> bool:
+        """run the word through the DFA, which can be any iterable of letters, so
+        a word read lazily only needs constant memory"""
+        state = self.start_state
+        if state < 0:
+            return False
+        table = self.table
+        columns = self.columns
+        width = len(self.alphabet)
+        for letter in word:
+            column = columns.get(letter)
+            if column is None:
+                return False
+            state = table[state * width + column]
+            if state < 0:
+                return False
+        return bool(self.accepting[state])
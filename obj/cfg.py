@@ -51,12 +51,26 @@ class CFG:
         self.start_variable = None
         self.rules: set[Rule]
         self.rules = set()
+        # bumped on every change, so cached analysis results can be reused
+        self.version = 0
+        self._analysis = None
         for rule in rules:
             self.add_rule(rule)
 
     def set_start_variable(self, variable: Letter) -> None:
+        if variable != self.start_variable:
+            self.version += 1
         self.start_variable = variable
 
+    def analysis(self):
+        """return the cached `GrammarAnalysis` of this cfg, made again after changes"""
+        from obj.analysis import GrammarAnalysis
+
+        key = (self.version, self.start_variable)
+        if self._analysis is None or self._analysis[0] != key:
+            self._analysis = (key, GrammarAnalysis(self))
+        return self._analysis[1]
+
     def to_string(
         self,
         word_converter: Callable,
@@ -91,7 +105,7 @@ class CFG:
 
     def clone(self):
         new_cfg = CFG(self.rules.copy())
-        new_cfg.start_variable = self.start_variable
+        new_cfg.set_start_variable(self.start_variable)
         return new_cfg
 
     def __str__(self) -> str:
@@ -101,10 +115,13 @@ class CFG:
         return f"<CFG: {len(self.rules)} rules>"
 
     def add_rule(self, rule: Rule):
+        if rule not in self.rules:
+            self.version += 1
         self.rules.add(rule)
 
     def remove_rule(self, rule: Rule):
         self.rules.remove(rule)
+        self.version += 1
 
     # def sort_rules(self):
     #     def sorter(rule: Rule):
@@ -124,7 +141,7 @@ class CFG:
             all_letters.add(self.start_variable)
         for rule in self.rules:
             all_letters.add(rule.input_letter)
-            all_letters = all_letters.union(set(rule.output_word))
+            all_letters.update(rule.output_word)
         return all_letters
 
     def all_variables(self) -> set[Letter]:
@@ -177,7 +194,7 @@ class CFG:
 
     def to_format(self, format):
         if format == "min":
-            min_format = self.min_format()
+            min_format = self.analysis().min_format()
             return self.to_format(min_format)
 
         elif format == "char":
@@ -0,0 +1,297 @@
+import random
+
+
+class LeafIndex:
+    """an ordered sequence of leaf nodes, stored as an implicit treap
+
+    every leaf has a weight of 1 if it's a variable and 0 otherwise, so the
+    k-th variable and the number of variables before a leaf can be found in
+    O(log n). replacing a leaf with its children (and undoing that) takes
+    O(log n) per child
+
+    leaves are identified by their (hashable) node, e.g. a `CFGParseTree` node id"""
+
+    def __init__(self, leaves=(), is_variable=lambda leaf: False, seed: int = 0):
+        self.is_variable = is_variable
+        self.rng = random.Random(seed)
+        self.left = {}
+        self.right = {}
+        self.parent = {}
+        self.priority = {}
+        self.size = {}
+        self.variables = {}
+        # 1 for variable leaves, 0 for the others
+        self.weight = {}
+        self.root = self._build(leaves)
+
+    def __len__(self) -> int:
+        return self._size(self.root)
+
+    def __iter__(self):
+        return self.iter_from(0)
+
+    def __contains__(self, leaf) -> bool:
+        return leaf in self.size
+
+    # --- treap internals ---
+
+    def _size(self, t) -> int:
+        return 0 if t is None else self.size[t]
+
+    def _variables(self, t) -> int:
+        return 0 if t is None else self.variables[t]
+
+    def _new(self, leaf):
+        if leaf in self.size:
+            raise Exception(f"Leaf {leaf} is already in the index!")
+        self.left[leaf] = None
+        self.right[leaf] = None
+        self.parent[leaf] = None
+        self.priority[leaf] = self.rng.random()
+        self.size[leaf] = 1
+        self.weight[leaf] = 1 if self.is_variable(leaf) else 0
+        self.variables[leaf] = self.weight[leaf]
+        return leaf
+
+    def _forget(self, leaf):
+        for table in (
+            self.left,
+            self.right,
+            self.parent,
+            self.priority,
+            self.size,
+            self.variables,
+            self.weight,
+        ):
+            del table[leaf]
+
+    def _pull(self, t):
+        """recalculate the counts of `t` from its children"""
+        # this is the hottest function, so the helpers are inlined
+        size, variables = self.size, self.variables
+        l, r = self.left[t], self.right[t]
+        total_size = 1
+        total_variables = self.weight[t]
+        if l is not None:
+            total_size += size[l]
+            total_variables += variables[l]
+            self.parent[l] = t
+        if r is not None:
+            total_size += size[r]
+            total_variables += variables[r]
+            self.parent[r] = t
+        size[t] = total_size
+        variables[t] = total_variables
+
+    def _rotate_up(self, t):
+        """rotate `t` above its parent, keeping the order of the leaves"""
+        p = self.parent[t]
+        g = self.parent[p]
+        if self.left[p] == t:
+            moved = self.right[t]
+            self.left[p] = moved
+            self.right[t] = p
+        else:
+            moved = self.left[t]
+            self.right[p] = moved
+            self.left[t] = p
+        if moved is not None:
+            self.parent[moved] = p
+        self.parent[t] = g
+        if g is None:
+            self.root = t
+        elif self.left[g] == p:
+            self.left[g] = t
+        else:
+            self.right[g] = t
+        self._pull(p)
+        self._pull(t)
+
+    def _add_to_ancestors(self, t, size_delta: int, variables_delta: int):
+        t = self.parent[t]
+        while t is not None:
+            self.size[t] += size_delta
+            self.variables[t] += variables_delta
+            t = self.parent[t]
+
+    def _swap(self, old, new):
+        """put `new` in the place of `old` in the treap"""
+        self._new(new)
+        l, r, p = self.left[old], self.right[old], self.parent[old]
+        self.left[new], self.right[new], self.parent[new] = l, r, p
+        self.priority[new] = self.priority[old]
+        if l is not None:
+            self.parent[l] = new
+        if r is not None:
+            self.parent[r] = new
+        if p is None:
+            self.root = new
+        elif self.left[p] == old:
+            self.left[p] = new
+        else:
+            self.right[p] = new
+        delta = self.weight[new] - self.weight[old]
+        self.size[new] = self.size[old]
+        self.variables[new] = self.variables[old] + delta
+        self._forget(old)
+        if delta:
+            self._add_to_ancestors(new, 0, delta)
+
+    def _insert_after(self, previous, leaf):
+        """insert a new leaf right after `previous`"""
+        self._new(leaf)
+        if self.right[previous] is None:
+            self.right[previous] = leaf
+            self.parent[leaf] = previous
+        else:
+            t = self.right[previous]
+            while self.left[t] is not None:
+                t = self.left[t]
+            self.left[t] = leaf
+            self.parent[leaf] = t
+        self._add_to_ancestors(leaf, 1, self.weight[leaf])
+        while (
+            self.parent[leaf] is not None
+            and self.priority[self.parent[leaf]] < self.priority[leaf]
+        ):
+            self._rotate_up(leaf)
+
+    def _delete(self, leaf):
+        # rotate the leaf down until it has no children, then cut it off
+        while True:
+            l, r = self.left[leaf], self.right[leaf]
+            if l is None and r is None:
+                break
+            if r is None or (l is not None and self.priority[l] > self.priority[r]):
+                self._rotate_up(l)
+            else:
+                self._rotate_up(r)
+        self._add_to_ancestors(leaf, -1, -self.weight[leaf])
+        p = self.parent[leaf]
+        if p is None:
+            self.root = None
+        elif self.left[p] == leaf:
+            self.left[p] = None
+        else:
+            self.right[p] = None
+        self._forget(leaf)
+
+    def _build(self, leaves):
+        """build a treap from leaves in order in O(n), using a right spine stack"""
+        spine = []
+        for leaf in leaves:
+            t = self._new(leaf)
+            last = None
+            while spine and self.priority[spine[-1]] < self.priority[t]:
+                last = spine.pop()
+                self._pull(last)
+            self.left[t] = last
+            if spine:
+                self.right[spine[-1]] = t
+            spine.append(t)
+        for t in reversed(spine):
+            self._pull(t)
+        if not spine:
+            return None
+        self.parent[spine[0]] = None
+        return spine[0]
+
+    # --- queries ---
+
+    def position(self, leaf) -> int:
+        """return the index of the leaf in the sequence"""
+        pos = self._size(self.left[leaf])
+        t = leaf
+        while self.parent[t] is not None:
+            p = self.parent[t]
+            if self.right[p] == t:
+                pos += self._size(self.left[p]) + 1
+            t = p
+        return pos
+
+    def variables_before(self, leaf) -> int:
+        """return the number of variable leaves before this leaf"""
+        count = self._variables(self.left[leaf])
+        t = leaf
+        while self.parent[t] is not None:
+            p = self.parent[t]
+            if self.right[p] == t:
+                count += self._variables(self.left[p]) + self.weight[p]
+            t = p
+        return count
+
+    def variable_count(self) -> int:
+        return self._variables(self.root)
+
+    def variable_at(self, k: int):
+        """return the k-th variable leaf, counting from 0"""
+        if not (0 <= k < self.variable_count()):
+            raise IndexError(f"Variable index {k} out of range!")
+        t = self.root
+        while True:
+            left_count = self._variables(self.left[t])
+            if k < left_count:
+                t = self.left[t]
+                continue
+            k -= left_count
+            if self.weight[t]:
+                if k == 0:
+                    return t
+                k -= 1
+            t = self.right[t]
+
+    def leaf_at(self, position: int):
+        if not (0 <= position < len(self)):
+            raise IndexError(f"Position {position} out of range!")
+        t = self.root
+        while True:
+            left_size = self._size(self.left[t])
+            if position < left_size:
+                t = self.left[t]
+            elif position == left_size:
+                return t
+            else:
+                position -= left_size + 1
+                t = self.right[t]
+
+    def iter_from(self, position: int):
+        """iterate through the leaves in order, starting at the given position"""
+        stack = []
+        t = self.root
+        # descend to the starting leaf, keeping the ancestors still to visit
+        while t is not None:
+            left_size = self._size(self.left[t])
+            if position < left_size:
+                stack.append(t)
+                t = self.left[t]
+            elif position == left_size:
+                stack.append(t)
+                break
+            else:
+                position -= left_size + 1
+                t = self.right[t]
+        while stack:
+            t = stack.pop()
+            yield t
+            t = self.right[t]
+            while t is not None:
+                stack.append(t)
+                t = self.left[t]
+
+    # --- updates ---
+
+    def replace(self, leaf, new_leaves):
+        """replace a leaf with a non-empty sequence of new leaves"""
+        new_leaves = iter(new_leaves)
+        previous = next(new_leaves)
+        self._swap(leaf, previous)
+        for new_leaf in new_leaves:
+            self._insert_after(previous, new_leaf)
+            previous = new_leaf
+
+    def unreplace(self, leaf, new_leaves):
+        """undo `replace`, putting `leaf` back where `new_leaves` are"""
+        new_leaves = list(new_leaves)
+        for new_leaf in new_leaves[1:]:
+            self._delete(new_leaf)
+        self._swap(new_leaves[0], leaf)
@@ -0,0 +1,148 @@
+from typing import Hashable, NamedTuple, Optional
+from obj.cfg import Letter
+
+
+class PDATransition(NamedTuple):
+    """move from `start` to `end`, reading `read` from the input (None reads
+    nothing), popping `pop` off the stack (None pops nothing), then pushing
+    `push`, whose first symbol ends up on top"""
+
+    start: str
+    read: Optional[Letter]
+    pop: Optional[Hashable]
+    push: tuple
+    end: str
+
+    def __repr__(self) -> str:
+        return f"<PDATransition: {self.start} {self.read} {self.pop} {self.push} {self.end}>"
+
+
+class PDA:
+    """a pushdown automaton that accepts by final state
+
+    stack symbols can be any hashable object, e.g. `Letter`s and "$"
+
+    optional hints let a simulator drop configurations early:
+    - `costs`: maps stack symbols to the least number of input letters needed
+      to pop them. symbols that can never be popped can be left out
+    - `firsts`: maps stack symbols to the letters that can be read first while
+      popping them, only checked in the `form_states`, where the stack alone
+      has to produce the rest of the input"""
+
+    def __init__(
+        self,
+        start_state: str,
+        accept_states=(),
+        costs: dict = None,
+        firsts: dict = None,
+        form_states=(),
+    ):
+        self.start_state = start_state
+        self.accept_states: set[str] = set(accept_states)
+        self.costs = costs
+        self.firsts = firsts
+        self.form_states: set[str] = set(form_states)
+        self.transitions: list[PDATransition] = []
+        # state -> transitions leaving it
+        self.transitions_from: dict[str, list[PDATransition]] = {}
+
+    def __repr__(self) -> str:
+        return (
+            f"<PDA: {len(self.states())} states, {len(self.transitions)} transitions>"
+        )
+
+    def add_transition(self, transition: PDATransition):
+        self.transitions.append(transition)
+        self.transitions_from.setdefault(transition.start, []).append(transition)
+
+    def states(self) -> set[str]:
+        states = {self.start_state} | self.accept_states
+        for t in self.transitions:
+            states.add(t.start)
+            states.add(t.end)
+        return states
+
+    def stack_symbols(self) -> set:
+        symbols = set()
+        for t in self.transitions:
+            if t.pop is not None:
+                symbols.add(t.pop)
+            symbols.update(t.push)
+        return symbols
+
+
+class StackStore:
+    """interns stacks as integers, so configurations are cheap to hash and
+    stacks sharing a bottom part share memory
+
+    stack 0 is the empty stack, every other stack is a top symbol on top of a
+    smaller stack"""
+
+    def __init__(self, costs: dict = None, firsts: dict = None):
+        self.costs = costs
+        # letters are stored as bits, so the first letters of a stack are an int
+        self.letter_bits: dict[Letter, int] = {}
+        self.first_bits: dict = {}
+        for symbol, letters in (firsts or {}).items():
+            bits = 0
+            for letter in letters:
+                bits |= self.letter_bit(letter)
+            self.first_bits[symbol] = bits
+        self.top = [None]
+        self.rest = [None]
+        self.height = [0]
+        # total cost of the stack, see `PDA.costs`
+        self.cost = [0]
+        # letters the stack can start with, see `PDA.firsts`
+        self.first = [0]
+        self.ids: dict[tuple, int] = {}
+
+    def letter_bit(self, letter: Letter) -> int:
+        bit = self.letter_bits.get(letter)
+        if bit is None:
+            bit = self.letter_bits[letter] = 1 << len(self.letter_bits)
+        return bit
+
+    def __len__(self) -> int:
+        return len(self.top)
+
+    def push(self, stack: int, symbol) -> Optional[int]:
+        """return the stack with `symbol` on top of `stack`, None if the symbol
+        can never be popped"""
+        key = (symbol, stack)
+        stack_id = self.ids.get(key)
+        if stack_id is not None:
+            return stack_id
+        if self.costs is None:
+            cost = 0
+        elif symbol in self.costs:
+            cost = self.cost[stack] + self.costs[symbol]
+        else:
+            return None
+        stack_id = len(self.top)
+        self.ids[key] = stack_id
+        self.top.append(symbol)
+        self.rest.append(stack)
+        self.height.append(self.height[stack] + 1)
+        self.cost.append(cost)
+        first = self.first_bits.get(symbol, 0)
+        if self.costs is not None and self.costs[symbol] == 0:
+            first |= self.first[stack]
+        self.first.append(first)
+        return stack_id
+
+    def push_word(self, stack: int, word: tuple) -> Optional[int]:
+        """push a word so that its first symbol ends up on top"""
+        for symbol in reversed(word):
+            stack = self.push(stack, symbol)
+            if stack is None:
+                return None
+        return stack
+
+    def symbols(self, stack: int) -> list:
+        """return the symbols of a stack, top first"""
+        symbols = []
+        while stack != 0:
+            symbols.append(self.top[stack])
+            stack = self.rest[stack]
+        return symbols
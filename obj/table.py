@@ -4,11 +4,24 @@ from obj.cfg import Letter
 
 # table implementation stolen from fsa-tools-2
 class Table:
-    def __init__(self, headers: list[str]):
+    """a table with named columns
+
+    `table[column name, value]` lookups use a hash index of the column, built on
+    the first lookup and kept up to date by `add_row`. rows must not be changed
+    in place after they're indexed.
+
+    with `columnar=True` the values are stored per column instead of per row,
+    `rows` then returns copies of the rows"""
+
+    def __init__(self, headers: list[str], columnar: bool = False):
         self.labels = headers
         self.num_columns = len(headers)
-        self.rows: list[list]
-        self.rows = []
+        self.columnar = columnar
+        self._rows: list[list] = []
+        self._columns: list[list] = [[] for _ in range(self.num_columns)]
+        self.num_rows = 0
+        # column index -> {value: row ids}, None for columns with unhashable values
+        self._indexes: dict[int, dict] = {}
         self.label_index = None  # initialized later
         self._labels_to_index()
 
@@ -17,19 +30,56 @@ class Table:
         for i, label in enumerate(self.labels):
             self.label_index[label] = i
 
+    @property
+    def rows(self) -> list[list]:
+        if self.columnar:
+            return [list(row) for row in zip(*self._columns)]
+        return self._rows
+
+    def row(self, row_id: int) -> list:
+        if self.columnar:
+            return [column[row_id] for column in self._columns]
+        return self._rows[row_id]
+
+    def value(self, row_id: int, index: int):
+        if self.columnar:
+            return self._columns[index][row_id]
+        return self._rows[row_id][index]
+
+    def _index(self, index: int):
+        """return the hash index of a column, building it if needed"""
+        if index in self._indexes:
+            return self._indexes[index]
+        column_index = {}
+        try:
+            for row_id in range(self.num_rows):
+                column_index.setdefault(self.value(row_id, index), []).append(row_id)
+        except TypeError:
+            # unhashable values, fall back to scanning the column
+            column_index = None
+        self._indexes[index] = column_index
+        return column_index
+
+    def find(self, label, value) -> list[int]:
+        """return the ids of the rows with the value in the column"""
+        index = self.index_of(label)
+        column_index = self._index(index)
+        if column_index is None:
+            return [i for i in range(self.num_rows) if self.value(i, index) == value]
+        try:
+            return column_index.get(value, [])
+        except TypeError:
+            return []
+
     def __getitem__(self, arg):
         """table lookup, return all matching rows
 
         table[column name, value] -> list of rows"""
         assert len(arg) == 2
         label, value = arg
-        index = self.index_of(label)
-        matches = []
-        for row in self.rows:
-            if row[index] == value:
-                matches.append(row)
+        matches = self.find(label, value)
         if matches:
-            return tuple(matches)
+            return tuple(self.row(i) for i in matches)
         else:
             raise KeyError(f"Can't find value {value} in column {label}.")
 
@@ -66,7 +116,20 @@ class Table:
     def add_row(self, row):
         if len(row) != self.num_columns:
             raise Exception("Given row doesn't have same number of columns as table!")
-        self.rows.append(list(row))
+        row_id = self.num_rows
+        if self.columnar:
+            for column, value in zip(self._columns, row):
+                column.append(value)
+        else:
+            self._rows.append(list(row))
+        self.num_rows += 1
+        for index, column_index in self._indexes.items():
+            if column_index is None:
+                continue
+            try:
+                column_index.setdefault(row[index], []).append(row_id)
+            except TypeError:
+                self._indexes[index] = None
 
     def index_of(self, label):
         """return index of given label"""
@@ -74,13 +137,11 @@ class Table:
 
     def copy_column(self, label=None, index=None):
         """input either column name or column index"""
-
-        def row_get_val(row, index):
-            return row[index]
-
         if label:
             index = self.index_of(label)
-        return tuple(map(lambda row, i=index: row_get_val(row, i), self.rows))
+        if self.columnar:
+            return tuple(self._columns[index])
+        return tuple(row[index] for row in self._rows)
 
 
 class CYKItem(NamedTuple):
@@ -112,7 +173,15 @@ class CYKTable(Table):
     def __init__(self, word: tuple[Letter]):
         headers = [l for l in word]
         super().__init__(headers)
+        # first CYKItem of each variable in each cell, for O(1) back-pointer lookups
+        self.cell_index: dict[tuple[int, int], dict[Letter, CYKItem]]
+        self.cell_index = {}
         num_columns = len(headers)
+        # row numbers of the non-empty cells starting at each letter index, and
+        # of the ones ending right before each letter index, in the order they
+        # were filled
+        self.rows_from: list[list[int]] = [[] for _ in range(num_columns + 1)]
+        self.rows_to: list[list[int]] = [[] for _ in range(num_columns + 1)]
         for i in range(num_columns):
             new_row = [set() for _ in range(i + 1)] + [None] * (num_columns - i - 1)
             new_row: list[set[CYKItem]]
@@ -218,6 +287,33 @@ class CYKTable(Table):
             for i in range(1, row_num):
                 yield (i, letter_idx), (row_num - i, letter_idx + i)
 
+    def generate_active_dest_pairs(self, lookup_args):
+        """like `generate_dest_pairs`, but only the pairs where both cells are
+        non-empty, found from the non-empty cells at the ends of the span
+
+        rows must be filled from the bottom up, and the cells below the row must
+        be done before this is called"""
+        row_num, letter_idx = lookup_args
+        assert row_num > 1
+        end_idx = letter_idx + row_num
+        starting = self.rows_from[letter_idx]
+        ending = self.rows_to[end_idx]
+        # go through the side with fewer non-empty cells, check the other side
+        if len(starting) <= len(ending):
+            for row_a in starting:
+                if row_a >= row_num:
+                    break
+                dest_b = (row_num - row_a, letter_idx + row_a)
+                if dest_b in self.cell_index:
+                    yield (row_a, letter_idx), dest_b
+        else:
+            for row_b in ending:
+                if row_b >= row_num:
+                    break
+                dest_a = (row_num - row_b, letter_idx)
+                if dest_a in self.cell_index:
+                    yield dest_a, (row_b, end_idx - row_b)
+
     def final_pos(self):
         return (self.num_columns, 0)
 
@@ -244,7 +340,12 @@ class CYKTable(Table):
                 (dest_pos_2, dest_var_2),
             ),
         )
+        if pos not in self.cell_index:
+            row_num, letter_idx = pos
+            self.rows_from[letter_idx].append(row_num)
+            self.rows_to[letter_idx + row_num].append(row_num)
         self[pos].add(item)
+        self.cell_index.setdefault(pos, {}).setdefault(variable, item)
 
     def iter_positions(self):
         """return an iterator that iterates through all positions in the table, starting from bottom left"""
@@ -252,6 +353,10 @@ class CYKTable(Table):
             for letter_idx in range(self.num_columns - row_num + 1):
                 yield row_num, letter_idx
 
+    def item_for(self, pos: tuple[int, int], variable: Letter) -> CYKItem:
+        """return a CYKItem of the given variable in the cell, raises KeyError if missing"""
+        return self.cell_index[pos][variable]
+
     def get_letters(self, pos: tuple[int, int]):
         cell = self[pos]
         cell_letters = set(item.var for item in cell)
@@ -0,0 +1,43 @@
+from pathlib import Path
+from obj.cfg import CFG, word_to_str
+from processors_cfg.earley import EarleyChart
+from processors_cfg.interactive import CFGConsole, CFGParseTree, write_diagram
+from tools import options, profiling
+from tools.cfg_parse import spaced_exclam_to_word
+from tools.common import path_with_suffix
+
+
+def process(cfg: CFG, original_path: Path):
+    """find a leftmost derivation of a word from the start variable
+
+    options:
+    - `target WORD`: the word to derive in "spaced!" format, asked for if missing
+    - `compact_derivation`: write the rules of the derivation instead of every step"""
+    if not cfg.start_variable:
+        print("Start variable required for this action!")
+        print("Please define `start xxx` in the input file")
+        return
+
+    target_str = options.get("target")
+    if target_str is None:
+        target = CFGConsole.get_input_word("Input the word to derive:")
+    else:
+        target = spaced_exclam_to_word(target_str)
+
+    with profiling.phase("auto_search"):
+        chart = EarleyChart(cfg, (cfg.start_variable,), target)
+    if not chart.accepted():
+        print(
+            f"{word_to_str(target)} can't be derived from the start variable "
+            f"{cfg.start_variable}"
+        )
+        return
+    ptree = CFGParseTree((cfg.start_variable,))
+    with profiling.phase("auto_tree"):
+        steps = ptree.expand_with(ptree.leaves()[0], chart.derivations()[0])
+    print(f"Found a derivation with {len(steps)} steps!")
+
+    derivation_path = path_with_suffix(original_path, "auto_derivation")
+    diagram_path = path_with_suffix(original_path, "auto_diagram").with_suffix(".dot")
+    ptree.write_derivation(derivation_path, options.flag("compact_derivation"))
+    write_diagram(ptree, diagram_path)
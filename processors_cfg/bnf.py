@@ -0,0 +1,62 @@
+from pathlib import Path
+from obj.cfg import CFG, Letter, Rule
+from processors_cfg.cnf import cnf_bin, need_bin, run_phase
+from tools.common import path_with_suffix, write_to_path
+
+
+def to_bnf(cfg: CFG) -> tuple[CFG, set[Letter]]:
+    """binarize a CFG, which is only the BIN step of CNF, unit and e rules are kept
+
+    return the new CFG and the variables that BIN added"""
+    bnf = run_phase(cfg, need_bin, cnf_bin, "bnf_bin")
+    return bnf, bnf.all_variables() - cfg.all_variables()
+
+
+def unbinarize(derivation, chain_variables: set[Letter]):
+    """turn a derivation in the binarized CFG back into one in the original CFG,
+    by putting the letters of the variables that BIN added back into their rules
+
+    a derivation is `(rule, [derivation of each letter in the rule])`, see
+    `CFGParseTree.expand_with`"""
+    # every node before its children
+    order = []
+    stack = [derivation]
+    while stack:
+        node = stack.pop()
+        order.append(node)
+        stack.extend(child for child in node[1] if child is not None)
+    # node id -> the converted node, or the (letter, derivation) pairs that a
+    # variable added by BIN stands for
+    results = {}
+    for node in reversed(order):
+        rule, children = node
+        pairs = []
+        for letter, child in zip(rule.output_word, children):
+            if child is None:
+                pairs.append((letter, None))
+            elif letter in chain_variables:
+                pairs.extend(results[id(child)])
+            else:
+                pairs.append((letter, results[id(child)]))
+        if rule.input_letter in chain_variables:
+            results[id(node)] = pairs
+        else:
+            output_word = tuple(letter for letter, _ in pairs)
+            results[id(node)] = (
+                Rule(rule.input_letter, output_word),
+                [child for _, child in pairs],
+            )
+    return results[id(derivation)]
+
+
+def process(cfg: CFG, original_path: Path):
+    """binarize the CFG, every rule gets at most 2 letters but unit and e rules
+    are kept, which is much smaller than CNF for big grammars"""
+    bnf, chain_variables = to_bnf(cfg)
+    print(bnf)
+    print(
+        f"Added {len(chain_variables)} variables, "
+        f"{len(cfg.rules)} rules -> {len(bnf.rules)} rules"
+    )
+    final_text = bnf.to_format("min") + "\n\n" + bnf.to_latex()
+    write_to_path(path_with_suffix(original_path, "bnf"), final_text)
@@ -6,6 +6,8 @@ if __name__ == "__main__":
 from obj.cfg import CFG, Letter, Rule, rule_to_str
 from pathlib import Path
 from tools.common import path_with_suffix, write_to_path
+from tools import options, profiling
+from collections import defaultdict
 import re
 from textwrap import indent
 
@@ -29,7 +31,7 @@ def unique_incremented_letters(
     input_letter: Letter, cfg: CFG, amount: str
 ) -> list[Letter]:
     new_letters = []
-    all_names = [l.name for l in cfg.all_letters()]
+    all_names = set(l.name for l in cfg.analysis().all_letters())
     previous_name = input_letter.name
     for _ in range(amount):
         new_name = increment_name(previous_name)
@@ -65,48 +67,80 @@ def process(cfg: CFG, original_path: Path, text_format: str = None):
     add_to_text("Initial CFG")
     print("Doing START...")
 
-    while need_start(cfg):
-        cfg = cnf_start(cfg)
+    cfg = run_phase(cfg, need_start, cnf_start, "cnf_start")
     print(cfg)
 
     add_to_text("START")
     print("Doing BIN...")
 
-    while need_bin(cfg):
-        cfg = cnf_bin(cfg)
+    cfg = run_phase(cfg, need_bin, cnf_bin, "cnf_bin")
     print(cfg)
 
     add_to_text("BIN")
     print("Doing DEL...")
 
-    while need_del(cfg):
-        cfg = cnf_del(cfg)
+    cfg = run_phase(cfg, need_del, cnf_del, "cnf_del")
     print(cfg)
 
     add_to_text("DEL")
     print("Doing UNIT...")
 
-    while need_unit(cfg):
-        cfg = cnf_unit(cfg)
+    cfg = run_phase(cfg, need_unit, cnf_unit, "cnf_unit")
     print(cfg)
 
     add_to_text("UNIT")
     print("Doing TERM...")
 
-    while need_term(cfg):
-        cfg = cnf_term(cfg)
+    cfg = run_phase(cfg, need_term, cnf_term, "cnf_term")
     print(cfg)
 
     add_to_text("TERM")
 
+    if options.get("cnf_merge") is None or options.flag("cnf_merge"):
+        print("Doing MERGE...")
+        old_variables = len(cfg.all_variables())
+        old_rules = len(cfg.rules)
+        cfg = run_phase(cfg, need_merge, cnf_merge, "cnf_merge")
+        print(cfg)
+        print(
+            f"Merged {old_variables - len(cfg.all_variables())} variables, "
+            f"{old_rules} rules -> {len(cfg.rules)} rules"
+        )
+
+        add_to_text("MERGE")
+
     export()
 
 
+def to_cnf(cfg: CFG, merge: bool = True) -> CFG:
+    """convert the CFG into CNF like `process`, without printing or writing the
+    steps. without `merge`, variables aren't replaced by others with the same
+    rules"""
+    cfg = run_phase(cfg, need_start, cnf_start, "cnf_start")
+    cfg = run_phase(cfg, need_bin, cnf_bin, "cnf_bin")
+    cfg = run_phase(cfg, need_del, cnf_del, "cnf_del")
+    cfg = run_phase(cfg, need_unit, cnf_unit, "cnf_unit")
+    cfg = run_phase(cfg, need_term, cnf_term, "cnf_term")
+    if merge:
+        cfg = run_phase(cfg, need_merge, cnf_merge, "cnf_merge")
+    return cfg
+
+
+def run_phase(cfg: CFG, need_fn, phase_fn, name: str) -> CFG:
+    """apply `phase_fn` until `need_fn` is false, recording it as a profiling phase"""
+    with profiling.phase(name) as record:
+        old_rules = cfg.rules
+        while need_fn(cfg):
+            cfg = phase_fn(cfg)
+            profiling.count("cnf_steps")
+        if record is not None:
+            profiling.count("cnf_rules_added", len(cfg.rules - old_rules))
+            profiling.count("cnf_rules_removed", len(old_rules - cfg.rules))
+    return cfg
+
+
 def need_start(cfg: CFG):
-    for r in cfg.rules:
-        if cfg.start_variable in r.output_word:
-            return True
-    return False
+    return cfg.analysis().cnf_violations()["start"] > 0
 
 
 def cnf_start(input_cfg: CFG):
@@ -122,49 +156,49 @@ def cnf_start(input_cfg: CFG):
 
 
 def need_bin(cfg: CFG):
-    for r in cfg.rules:
-        if len(r.output_word) > 2:
-            return True
-    return False
+    return cfg.analysis().cnf_violations()["bin"] > 0
 
 
 def cnf_bin(input_cfg: CFG):
+    cfg = input_cfg.clone()
+    taken_names = set(l.name for l in cfg.analysis().all_letters())
+    # suffix of a long rule -> the new variable that produces it, rules that end
+    # the same way share the variables
+    suffix_variables = {}
+
+    def new_variable(letter: Letter) -> Letter:
+        name = increment_name(letter.name)
+        while name in taken_names:
+            name = increment_name(name)
+        taken_names.add(name)
+        return Letter(name, True)
+
     def shorten_rule(rule: Rule):
-        starting_variable = rule.input_letter
         output_word = tuple(rule.output_word)
-        output_word_length = len(output_word)
-        assert output_word_length > 2
-        working_variables = [starting_variable] + unique_incremented_letters(
-            rule.input_letter, input_cfg, output_word_length - 2
-        )
+        assert len(output_word) > 2
         new_rules = []
-        for i in range(output_word_length - 1):
-            if i == output_word_length - 2:
-                new_rules.append(
-                    Rule(working_variables[i], tuple(output_word[i : i + 2]))
-                )
-            else:
-                new_rules.append(
-                    Rule(
-                        working_variables[i], (output_word[i], working_variables[i + 1])
-                    )
-                )
+        left = rule.input_letter
+        for i in range(len(output_word) - 2):
+            suffix = output_word[i + 1 :]
+            if suffix in suffix_variables:
+                # the rest of the chain already exists
+                new_rules.append(Rule(left, (output_word[i], suffix_variables[suffix])))
+                return new_rules
+            variable = new_variable(rule.input_letter)
+            suffix_variables[suffix] = variable
+            new_rules.append(Rule(left, (output_word[i], variable)))
+            left = variable
+        new_rules.append(Rule(left, output_word[-2:]))
         return new_rules
 
-    cfg = input_cfg.clone()
     to_remove = []
     to_add = []
-    for input_rule in cfg.rules:
+    # sorted so that the new variable names don't depend on the set order
+    for input_rule in sorted(cfg.rules, key=rule_to_str):
         if len(input_rule.output_word) <= 2:
             continue
         to_remove.append(input_rule)
-        new_rules = shorten_rule(input_rule)
-        for rule in new_rules:
-            to_add.append(rule)
-        break  # stop loop immediately.
-        # we need to add the new rules to the cfg before continuing
-        # otherwise unique_incremented_letters may generate duplicate names
-        # example cfg: S → aaaS | aab | b
+        to_add.extend(shorten_rule(input_rule))
     for rule in to_remove:
         cfg.remove_rule(rule)
     for rule in to_add:
@@ -174,12 +208,7 @@ def cnf_bin(input_cfg: CFG):
 
 
 def need_del(cfg: CFG):
-    for r in cfg.rules:
-        if r.input_letter == cfg.start_variable:
-            continue
-        if len(r.output_word) == 0:
-            return True
-    return False
+    return cfg.analysis().cnf_violations()["del"] > 0
 
 
 def cnf_del(input_cfg: CFG):
@@ -227,14 +256,12 @@ def cnf_del(input_cfg: CFG):
 
 
 def need_unit(cfg: CFG):
-    for r in cfg.rules:
-        if len(r.output_word) == 1 and r.output_word[0].is_variable:
-            return True
-    return False
+    return cfg.analysis().cnf_violations()["unit"] > 0
 
 
 def cnf_unit(input_cfg: CFG):
     cfg = input_cfg.clone()
+    rules_map = cfg.analysis().rules_map()
     to_add = []
     to_remove = []
     for r in cfg.rules:
@@ -244,7 +271,7 @@ def cnf_unit(input_cfg: CFG):
         if len(r.output_word) == 1 and r.output_word[0] == r.input_letter:
             # skip adding rules for rules like S -> S, X -> X etc
             continue
-        for external_rule in cfg.rules_map()[r.output_word[0]]:
+        for external_rule in rules_map.get(r.output_word[0], ()):
             new_rule = Rule(r.input_letter, external_rule.output_word)
             to_add.append(new_rule)
     for rule in to_remove:
@@ -255,45 +282,78 @@ def cnf_unit(input_cfg: CFG):
 
 
 def need_term(cfg: CFG):
-    for r in cfg.rules:
-        if len(r.output_word) == 2 and any(
-            [True for letter in r.output_word if not letter.is_variable]
-        ):
-            return True
-    return False
+    return cfg.analysis().cnf_violations()["term"] > 0
+
+
+def term_classes(cfg: CFG) -> dict[Letter, frozenset[Letter]]:
+    """group the letters in rules with 2 letters into classes of letters that can
+    replace each other in all of those rules, so that one variable can produce
+    the whole class. letters of the same class share the frozenset
+
+    a letter next to another letter is put in a class by itself"""
+    contexts = defaultdict(set)
+    alone = set()
+    for rule in cfg.rules:
+        if len(rule.output_word) != 2:
+            continue
+        a, b = rule.output_word
+        if not a.is_variable and not b.is_variable:
+            alone.update((a, b))
+            continue
+        if not a.is_variable:
+            contexts[a].add((rule.input_letter, 0, b))
+        if not b.is_variable:
+            contexts[b].add((rule.input_letter, 1, a))
+    groups = defaultdict(list)
+    for letter in alone:
+        groups[letter].append(letter)
+    for letter, context in contexts.items():
+        if letter not in alone:
+            groups[frozenset(context)].append(letter)
+    classes = {}
+    for letters in groups.values():
+        letters = frozenset(letters)
+        for letter in letters:
+            classes[letter] = letters
+    return classes
 
 
 def cnf_term(input_cfg: CFG):
     cfg = input_cfg.clone()
-    letter_map = dict()
+    classes = term_classes(cfg)
+    class_map = dict()
+    # existing variables that only produce single letters, by those letters
+    producers = {}
+    for variable, rules in cfg.analysis().rules_map().items():
+        if variable == cfg.start_variable:
+            # the start variable can't be on the right side of a rule
+            continue
+        if all(
+            len(r.output_word) == 1 and not r.output_word[0].is_variable for r in rules
+        ):
+            letters = frozenset(r.output_word[0] for r in rules)
+            producers.setdefault(letters, variable)
 
     to_add = []
     to_remove = []
 
     def letter_to_variable(letter: Letter) -> Letter:
+        letters = classes[letter]
         # rule already found
-        if letter in letter_map:
-            return letter_map[letter]
+        if letters in class_map:
+            return class_map[letters]
         # try finding existing rule
-        applicable_rules = [
-            r
-            for r in cfg.rules
-            if len(r.output_word) == 1 and r.output_word[0] == letter
-        ]
-        rules_map = cfg.rules_map()
-        applicable_rules = [
-            r for r in applicable_rules if len(rules_map[r.input_letter]) == 1
-        ]
-        if applicable_rules:
-            letter_map[letter] = applicable_rules[0].input_letter
-            return letter_map[letter]
-        # create new rule
-        new_variable = Letter(f"U{letter.name}", True)
-        if new_variable in cfg.all_letters():
+        if letters in producers:
+            class_map[letters] = producers[letters]
+            return class_map[letters]
+        # create new rule, named after the first letter of the class
+        first_letter = min(letters, key=lambda l: l.name)
+        new_variable = Letter(f"U{first_letter.name}", True)
+        if new_variable in cfg.analysis().all_letters():
             new_variable = unique_incremented_letters(new_variable, cfg, 1)[0]
-        letter_map[letter] = new_variable
-        new_rule = Rule(new_variable, (letter,))
-        to_add.append(new_rule)
+        class_map[letters] = new_variable
+        for class_letter in sorted(letters, key=lambda l: l.name):
+            to_add.append(Rule(new_variable, (class_letter,)))
         return new_variable
 
     for input_rule in cfg.rules:
@@ -311,3 +371,19 @@ def cnf_term(input_cfg: CFG):
     for rule in to_add:
         cfg.add_rule(rule)
     return cfg
+
+
+def need_merge(cfg: CFG):
+    classes = cfg.analysis().variable_classes()
+    return len(set(classes.values())) < len(classes)
+
+
+def cnf_merge(input_cfg: CFG):
+    """replace variables that have the same rules with one of them"""
+    classes = input_cfg.analysis().variable_classes()
+    cfg = CFG()
+    cfg.set_start_variable(input_cfg.start_variable)
+    for rule in input_cfg.rules:
+        output_word = tuple(classes.get(l, l) for l in rule.output_word)
+        cfg.add_rule(Rule(classes[rule.input_letter], output_word))
+    return cfg
@@ -0,0 +1,472 @@
+import random
+from pathlib import Path
+from typing import Optional
+from obj.cfg import CFG, Letter, Rule, rule_to_str, word_to_str
+from processors_cfg.bnf import to_bnf
+from processors_cfg.cyk_bnf import UnitClosureChart
+from tools import options, profiling
+from tools.cfg_parse import text_to_cfg
+from tools.common import path_with_suffix, write_to_path
+
+# defaults of the `compare_length`, `compare_samples` and `compare_exact` options
+MAX_LENGTH = 8
+SAMPLES = 20
+EXACT_WORDS = 20000
+
+
+def sumset(a: int, b: int, limit: int) -> int:
+    """the lengths i + j for i in `a` and j in `b`, as bitmasks of lengths, up to
+    `limit`"""
+    result = 0
+    i = 0
+    while a >> i:
+        if (a >> i) & 1:
+            result |= b << i
+        i += 1
+    return result & ((1 << (limit + 1)) - 1)
+
+
+class LengthIndex:
+    """which lengths up to `max_length` every variable produces, and which
+    letters appear in its words of each length
+
+    lengths are bitmasks, bit i is set if there's a word of length i. letters
+    are bitmasks of the positions of the letters in `letter_ids`. both are
+    found by applying the rules until nothing changes, every length and letter
+    keeps the first way it was found, so following them always terminates"""
+
+    def __init__(self, cfg: CFG, max_length: int, letter_ids: dict[Letter, int]):
+        self.cfg = cfg
+        self.max_length = max_length
+        self.letter_ids = letter_ids
+        self.rules = sorted(cfg.rules, key=rule_to_str)
+        self.rules_map: dict[Letter, list[Rule]] = {}
+        for rule in self.rules:
+            self.rules_map.setdefault(rule.input_letter, []).append(rule)
+        self.masks: dict[Letter, int] = {}
+        # (variable, length) -> (rule, lengths of its letters)
+        self.splits: dict[tuple[Letter, int], tuple[Rule, tuple[int]]] = {}
+        # variable -> letter bitmask per length
+        self.letters: dict[Letter, list[int]] = {}
+        # (variable, length, letter id) -> (rule, position, length at position)
+        self.letter_sources: dict[tuple[Letter, int, int], tuple[Rule, int, int]]
+        self.letter_sources = {}
+        with profiling.phase("compare_lengths"):
+            self._fill_lengths()
+        # the lengths are final now, rule -> its suffix masks
+        self.rule_suffixes: dict[Rule, list[int]] = {
+            rule: self.suffix_masks(tuple(rule.output_word)) for rule in self.rules
+        }
+        with profiling.phase("compare_letters"):
+            self._fill_letters()
+
+    def mask(self, letter: Letter) -> int:
+        if not letter.is_variable:
+            return 0b10 if self.max_length >= 1 else 0
+        return self.masks.get(letter, 0)
+
+    def suffix_masks(self, word: tuple[Letter]) -> list[int]:
+        """the lengths of `word[i:]` for every i, with the current masks"""
+        result = [1] * (len(word) + 1)
+        for i in range(len(word) - 1, -1, -1):
+            result[i] = sumset(self.mask(word[i]), result[i + 1], self.max_length)
+        return result
+
+    def split(
+        self, word: tuple[Letter], length: int, rng=None, suffixes=None
+    ) -> tuple[int]:
+        """lengths for every letter of `word` that add up to `length`, the
+        smallest possible first or random ones"""
+        if suffixes is None:
+            suffixes = self.suffix_masks(word)
+        lengths = []
+        for i, letter in enumerate(word):
+            mask = self.mask(letter)
+            choices = [
+                k
+                for k in range(length + 1)
+                if (mask >> k) & 1 and (suffixes[i + 1] >> (length - k)) & 1
+            ]
+            k = rng.choice(choices) if rng is not None else choices[0]
+            lengths.append(k)
+            length -= k
+        return tuple(lengths)
+
+    def _fill_lengths(self):
+        changed = True
+        while changed:
+            changed = False
+            for rule in self.rules:
+                output_word = tuple(rule.output_word)
+                variable = rule.input_letter
+                old = self.masks.get(variable, 0)
+                new = self.suffix_masks(output_word)[0] & ~old
+                if not new:
+                    continue
+                for length in range(self.max_length + 1):
+                    if (new >> length) & 1:
+                        split = self.split(output_word, length)
+                        self.splits[variable, length] = (rule, split)
+                self.masks[variable] = old | new
+                changed = True
+
+    def _letter_mask(self, letter: Letter, length: int) -> int:
+        if not letter.is_variable:
+            return 1 << self.letter_ids[letter] if length == 1 else 0
+        if letter not in self.letters:
+            return 0
+        return self.letters[letter][length]
+
+    def _fill_letters(self):
+        n = self.max_length
+        for variable in self.masks:
+            self.letters[variable] = [0] * (n + 1)
+        rules = [r for r in self.rules if self.rule_suffixes[r][0]]
+        changed = True
+        while changed:
+            changed = False
+            for rule in rules:
+                output_word = tuple(rule.output_word)
+                variable = rule.input_letter
+                found = self.letters[variable]
+                suffixes = self.rule_suffixes[rule]
+                prefix = 1
+                for i, letter in enumerate(output_word):
+                    # lengths the other letters of the rule can add up to
+                    others = sumset(prefix, suffixes[i + 1], n)
+                    prefix = sumset(prefix, self.mask(letter), n)
+                    if not others:
+                        continue
+                    for k in range(1, n + 1):
+                        letter_mask = self._letter_mask(letter, k)
+                        if not letter_mask:
+                            continue
+                        for extra in range(n + 1 - k):
+                            if not (others >> extra) & 1:
+                                continue
+                            new = letter_mask & ~found[k + extra]
+                            if not new:
+                                continue
+                            found[k + extra] |= new
+                            changed = True
+                            for letter_id in iter_bits(new):
+                                key = (variable, k + extra, letter_id)
+                                self.letter_sources[key] = (rule, i, k)
+
+    def produces(self, variable: Letter, length: int) -> bool:
+        return bool((self.mask(variable) >> length) & 1)
+
+    def word(
+        self,
+        variable: Letter,
+        length: int,
+        letter_id: Optional[int] = None,
+        rng: Optional[random.Random] = None,
+    ) -> tuple[Letter]:
+        """return a word of the given length from the variable
+
+        - `letter_id`: the word must contain this letter
+        - `rng`: make random choices, otherwise follow the first way each length
+          and letter was found. after 4 random rules per letter of the word, the
+          rest follow the first way too, so the word is always finished"""
+        budget = 4 * (length + 1)
+        word = []
+        # rightmost at the bottom, (letter, length, letter id or None)
+        stack = [(variable, length, letter_id)]
+        while stack:
+            letter, length, letter_id = stack.pop()
+            if not letter.is_variable:
+                word.append(letter)
+                continue
+            if letter_id is not None:
+                rule, position, position_length = self.letter_sources[
+                    letter, length, letter_id
+                ]
+                output_word = tuple(rule.output_word)
+                before = output_word[:position]
+                after = output_word[position + 1 :]
+                rest = length - position_length
+                before_mask = self.suffix_masks(before)[0]
+                after_mask = self.suffix_masks(after)[0]
+                before_length = min(
+                    k
+                    for k in range(rest + 1)
+                    if before_mask >> k & 1 and after_mask >> (rest - k) & 1
+                )
+                lengths = (
+                    self.split(before, before_length)
+                    + (position_length,)
+                    + self.split(after, rest - before_length)
+                )
+                ids = [None] * len(output_word)
+                ids[position] = letter_id
+            elif rng is not None and budget > 0:
+                budget -= 1
+                rules = [
+                    r
+                    for r in self.rules_map.get(letter, ())
+                    if self.rule_suffixes[r][0] >> length & 1
+                ]
+                rule = rng.choice(rules)
+                output_word = tuple(rule.output_word)
+                lengths = self.split(output_word, length, rng, self.rule_suffixes[rule])
+                ids = [None] * len(output_word)
+            else:
+                rule, lengths = self.splits[letter, length]
+                output_word = tuple(rule.output_word)
+                ids = [None] * len(output_word)
+            for item in reversed(list(zip(output_word, lengths, ids))):
+                stack.append(item)
+        return tuple(word)
+
+
+class TooManyWords(Exception):
+    pass
+
+
+class WordSets:
+    """every word of every variable of a `LengthIndex`, one length at a time,
+    for lengths with few possible words
+
+    the words of a length are found by applying the rules until nothing
+    changes, since unit rules and e rules make words of a variable from words
+    of the same length"""
+
+    def __init__(self, index: LengthIndex, max_words: int):
+        self.index = index
+        self.max_words = max_words
+        # variable -> words per length, filled up to `len(...) - 1`
+        self.words: dict[Letter, list[set[tuple[Letter]]]] = {
+            v: [] for v in index.masks
+        }
+        self.filled = -1
+
+    def of(self, variable: Letter, length: int) -> set[tuple[Letter]]:
+        """the words of the variable with this length, raise `TooManyWords` if a
+        variable has more than `max_words` of them"""
+        while self.filled < length:
+            self._fill(self.filled + 1)
+        if variable not in self.words:
+            return set()
+        return self.words[variable][length]
+
+    def _fill(self, length: int):
+        index = self.index
+        for sets in self.words.values():
+            sets.append(set())
+        rules = [r for r in index.rules if index.rule_suffixes[r][0] >> length & 1]
+        # rules that make words from words of the same length run until nothing
+        # changes, the others only need to run once
+        rules = [rule for rule in rules if self._apply(rule, length)[1]]
+        changed = True
+        while changed:
+            changed = False
+            for rule in rules:
+                if self._apply(rule, length)[0]:
+                    changed = True
+        self.filled = length
+
+    def _apply(self, rule: Rule, length: int) -> tuple[bool, bool]:
+        """add the words of this length that the rule makes, return whether
+        there are new ones, and whether it used words of the same length"""
+        found = self.words[rule.input_letter][length]
+        size = len(found)
+        same_length = False
+        output_word = tuple(rule.output_word)
+        for lengths in self._splits(output_word, length, rule):
+            words = [()]
+            for letter, k in zip(output_word, lengths):
+                if letter.is_variable:
+                    parts = self.words[letter][k]
+                    same_length = same_length or k == length
+                else:
+                    parts = ((letter,),)
+                words = [w + p for w in words for p in parts]
+                if len(words) > self.max_words:
+                    raise TooManyWords()
+            found.update(words)
+        if len(found) > self.max_words:
+            raise TooManyWords()
+        return len(found) > size, same_length
+
+    def _splits(self, word: tuple[Letter], length: int, rule: Rule):
+        """every way to give each letter of the word a length it produces, so
+        they add up to `length`"""
+        suffixes = self.index.rule_suffixes[rule]
+        # (position, length left, lengths so far)
+        stack = [(0, length, ())]
+        while stack:
+            i, rest, lengths = stack.pop()
+            if i == len(word):
+                yield lengths
+                continue
+            mask = self.index.mask(word[i])
+            for k in range(rest + 1):
+                if mask >> k & 1 and suffixes[i + 1] >> (rest - k) & 1:
+                    stack.append((i + 1, rest - k, lengths + (k,)))
+
+
+def iter_bits(mask: int):
+    i = 0
+    while mask >> i:
+        if (mask >> i) & 1:
+            yield i
+        i += 1
+
+
+def read_cfg(path: Path, text_format: str = None) -> CFG:
+    """read a CFG from a file, like an input file or the output of `cnf`. the
+    format is guessed if the file has no `format` line and `text_format` isn't
+    given"""
+    with open(path, encoding="utf8") as f:
+        return text_to_cfg(f.read(), text_format, guess=True)
+
+
+def compare_cfgs(
+    cfg: CFG,
+    other: CFG,
+    max_length: int,
+    samples: int,
+    seed: int = 0,
+    exact_words: int = EXACT_WORDS,
+) -> tuple[list[str], Optional[tuple[int, tuple[Letter], bool]], int]:
+    """compare the words of two CFGs length by length, up to `max_length`
+
+    lengths with at most `exact_words` possible words are compared exactly,
+    word by word. for longer lengths, the CFGs must both have words of that
+    length, the same letters must appear in them, and random words of each
+    must be accepted by the other. the first two are exact, the last is
+    sampled, so words that aren't sampled can differ without being found
+
+    return a line about each length, (length, word, whether the word is in
+    `cfg`) for the first word found in only one of them or None, and the
+    longest length up to which every length was compared exactly, -1 if none"""
+    letter_ids = {}
+    for letter in sorted(cfg.all_alphabet() | other.all_alphabet(), key=str):
+        letter_ids[letter] = len(letter_ids)
+    letters = sorted(letter_ids, key=letter_ids.get)
+    indexes = [
+        LengthIndex(cfg, max_length, letter_ids),
+        LengthIndex(other, max_length, letter_ids),
+    ]
+    starts = [cfg.start_variable, other.start_variable]
+    word_sets = [WordSets(index, exact_words) for index in indexes]
+    exact_length = -1
+    # sampled words are tested with CYK on the binarized CFGs
+    bnfs = None
+    rng = random.Random(seed)
+    lines = []
+    for length in range(max_length + 1):
+        produces = [index.produces(s, length) for index, s in zip(indexes, starts)]
+        if produces[0] != produces[1]:
+            side = produces.index(True)
+            word = indexes[side].word(starts[side], length)
+            lines.append(f"length {length}: only one CFG has words")
+            return lines, (length, word, side == 0), exact_length
+        if not produces[0]:
+            lines.append(f"length {length}: no words")
+            if exact_length == length - 1:
+                exact_length = length
+            continue
+        if exact_length == length - 1 and len(letters) ** length <= exact_words:
+            try:
+                with profiling.phase("compare_exact"):
+                    words = [w.of(s, length) for w, s in zip(word_sets, starts)]
+            except TooManyWords:
+                pass
+            else:
+                exact_length = length
+                if words[0] != words[1]:
+                    word = min(words[0] ^ words[1], key=word_to_str)
+                    lines.append(f"length {length}: a word is only in one CFG")
+                    return lines, (length, word, word in words[0]), exact_length
+                lines.append(f"length {length}: the same {len(words[0])} words")
+                continue
+        found = [index.letters[s][length] for index, s in zip(indexes, starts)]
+        if found[0] != found[1]:
+            side = 0 if found[0] & ~found[1] else 1
+            letter_id = next(iter_bits(found[side] & ~found[1 - side]))
+            word = indexes[side].word(starts[side], length, letter_id)
+            lines.append(f"length {length}: only one CFG uses {letters[letter_id]}")
+            return lines, (length, word, side == 0), exact_length
+        if bnfs is None:
+            bnfs = [to_bnf(cfg)[0], to_bnf(other)[0]]
+        with profiling.phase("compare_samples"):
+            for _ in range(samples):
+                for side in (0, 1):
+                    word = indexes[side].word(starts[side], length, rng=rng)
+                    profiling.count("compare_samples")
+                    if not UnitClosureChart(bnfs[1 - side], word).accepted():
+                        lines.append(
+                            f"length {length}: a sampled word is only in one CFG"
+                        )
+                        return lines, (length, word, side == 0), exact_length
+        lines.append(
+            f"length {length}: same letters, {samples} sampled words of each CFG "
+            "are in the other"
+        )
+    return lines, None, exact_length
+
+
+def process(cfg: CFG, original_path: Path):
+    """check that the input and another CFG have the same words up to some
+    length, e.g. to check the output of `cnf`
+
+    options:
+    - `compare_with PATH`: the other CFG, relative to the input file
+    - `compare_format FORMAT`: the format of the other CFG if it has no
+      `format` line, guessed otherwise
+    - `compare_length N`: the longest words to compare
+    - `compare_samples N`: random words of each CFG to test per length
+    - `compare_seed N`: the seed of the random words
+    - `compare_exact N`: compare every word of the lengths with at most N
+      possible words"""
+    if not cfg.start_variable:
+        print("Start variable required for this action!")
+        print("Please define `start xxx` in the input file")
+        return
+    other_path = options.get("compare_with")
+    if other_path is None:
+        raise Exception("Give the CFG to compare with the `compare_with` option!")
+    other = read_cfg(original_path.parent / other_path, options.get("compare_format"))
+    if not other.start_variable:
+        print(f"{other_path} has no start variable!")
+        return
+
+    max_length = options.get_int("compare_length", MAX_LENGTH)
+    samples = options.get_int("compare_samples", SAMPLES)
+    seed = options.get_int("compare_seed", 0)
+    exact_words = options.get_int("compare_exact", EXACT_WORDS)
+    lines, difference, exact_length = compare_cfgs(
+        cfg, other, max_length, samples, seed, exact_words
+    )
+    if exact_length >= 0:
+        exact = f"Every word up to length {exact_length} was compared. "
+    else:
+        exact = ""
+    if difference is None and exact_length == max_length:
+        result = f"The CFGs have the same words up to length {max_length}"
+    elif difference is None:
+        result = (
+            f"{exact}No difference in the lengths and letters up to length "
+            f"{max_length}, and {samples} sampled words per length of each CFG are "
+            "in the other. Words that weren't sampled can still differ"
+        )
+    else:
+        length, word, in_input = difference
+        where = "the input" if in_input else other_path
+        if length <= exact_length + 1:
+            # every shorter length was compared word by word
+            result = (
+                f"The CFGs first differ at length {length}: {word_to_str(word)} "
+                f"is only in {where}"
+            )
+        else:
+            result = (
+                f"{exact}The CFGs differ: {word_to_str(word)} (length {length}) is "
+                f"only in {where}, shorter words that weren't sampled can differ too"
+            )
+    print(result)
+    write_to_path(
+        path_with_suffix(original_path, "compare"), "\n".join(lines + [result])
+    )
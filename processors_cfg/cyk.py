@@ -1,12 +1,19 @@
 from tools.cfg_parse import spaced_exclam_to_word
-from processors_cfg.interactive import CFGParseTree
+from processors_cfg.interactive import CFGParseTree, write_diagram
+import processors_cfg.cyk_correct
+import processors_cfg.regular
 from obj.table import CYKItem, CYKTable
 from pathlib import Path
 from tools.common import path_with_suffix, write_to_path
+from tools import options, profiling
 from obj.cfg import CFG, Letter, quick_word, rule_to_str
 import itertools
 
 
+# words longer than this don't have their parse tree printed to the console
+MAX_SHOWN_TREE = 100
+
+
 def ask_yes_no():
     while True:
         choice = input("  > ").strip().lower()
@@ -21,16 +28,38 @@ def process(cfg: CFG, original_path: Path):
         print("Please define `start xxx` in the input file")
         return
 
-    while True:
-        print("Input the word to test: (Format is 'spaced!')")
-        word_str = input("  > ")
+    word_str = options.get("word")
+    if word_str is not None:
         word = spaced_exclam_to_word(word_str)
-        print("Is this the word you want to test? (y/n)")
-        print(word)
-        if ask_yes_no():
-            break
+    else:
+        while True:
+            print("Input the word to test: (Format is 'spaced!')")
+            word_str = input("  > ")
+            word = spaced_exclam_to_word(word_str)
+            print("Is this the word you want to test? (y/n)")
+            print(word)
+            if ask_yes_no():
+                break
 
-    cyktable = make_cyk_table(cfg, word)
+    if options.flag("cyk_dfa") and cfg.analysis().regular_kind() is not None:
+        # regular grammars can be tested in linear time with a DFA instead
+        try:
+            _, dfa = processors_cfg.regular.compile_dfa(cfg)
+        except Exception as e:
+            print(f"Can't compile the CFG to a DFA, using CYK: {e}")
+        else:
+            accepted = dfa.accepts(word)
+            print(
+                f"The CFG is {cfg.analysis().regular_kind()}, tested with a "
+                f"{dfa.num_states}-state DFA: {'accepted' if accepted else 'rejected'}"
+            )
+            print("Unset the `cyk_dfa` option to make the CYK table and parse tree")
+            if not accepted:
+                report_rejected(cfg, word, original_path)
+            return
+
+    with profiling.phase("cyk_table"):
+        cyktable = make_cyk_table(cfg, word, top_down=options.flag("cyk_prune"))
 
     print("Processed CYK table!")
     pretty = cyk_table_to_pretty(cyktable)
@@ -41,106 +70,190 @@ def process(cfg: CFG, original_path: Path):
         print(
             f"Start variable {cfg.start_variable} is in the final cell, creating parse tree..."
         )
-        tree = cyk_table_to_tree(cyktable, cfg)
+        with profiling.phase("cyk_tree"):
+            tree = cyk_table_to_tree(cyktable, cfg, show=len(word) <= MAX_SHOWN_TREE)
         print("Parse tree created!!!")
     else:
         print(
             f"Start variable {cfg.start_variable} is missing from the final cell! Did you run CNF on the CFG yet?"
         )
         tree = None
+        report_rejected(cfg, word, original_path)
 
     output_table = path_with_suffix(original_path, "cyk_table")
-    output_tree = path_with_suffix(original_path, "cyk_tree").with_suffix(".png")
+    output_tree = path_with_suffix(original_path, "cyk_tree").with_suffix(".dot")
     write_to_path(output_table, pretty)
     if tree:
-        tree.render(output_tree)
+        with profiling.phase("cyk_render"):
+            write_diagram(tree, output_tree)
     # content = cfg.to_latex()
     # write_to_path(output_path, content)
 
 
-def make_cyk_table(cfg: CFG, word: tuple[Letter]):
+def report_rejected(cfg: CFG, word: tuple[Letter], original_path: Path):
+    """find the closest accepted word if possible"""
+    try:
+        processors_cfg.cyk_correct.report(cfg, word, original_path)
+    except ImportError:
+        print("Install numpy to find the closest accepted word")
+    except Exception as e:
+        print(f"Can't find the closest accepted word: {e}")
+
+
+class CYKRules:
+    """the rules of a CFG in Chomsky normal form, grouped by the span lengths
+    their variables can produce, so CYK can skip splits that no rule fits
+
+    a variable can only produce spans between its shortest and longest word.
+    with `top_down`, variables that can't appear in a sentential form of the
+    start variable with room for the rest of the word are dropped too, which
+    also removes them from the CYK table"""
+
+    def __init__(self, cfg: CFG, word_length: int, top_down: bool = False):
+        analysis = cfg.analysis()
+        min_yield = analysis.min_yield()
+        max_yield = analysis.max_yield()
+        context = analysis.min_context() if top_down else None
+        # variable -> (shortest span, longest span) it can be in
+        self.bounds: dict[Letter, tuple[int, int]] = {}
+        for variable, shortest in min_yield.items():
+            longest = max_yield[variable]
+            if longest is None or longest > word_length:
+                longest = word_length
+            if top_down:
+                if variable not in context:
+                    continue
+                longest = min(longest, word_length - context[variable])
+            shortest = max(shortest, 1)
+            if shortest <= longest:
+                self.bounds[variable] = (shortest, longest)
+
+        # letter -> variables with a rule `A -> letter`, letters with the same
+        # variables share the list
+        self.letter_rules: dict[Letter, list[Letter]] = {}
+        class_rules = {}
+        for letter, variables in analysis.terminal_classes().items():
+            if variables not in class_rules:
+                class_rules[variables] = [v for v in variables if v in self.bounds]
+            if class_rules[variables]:
+                self.letter_rules[letter] = class_rules[variables]
+        # (bounds of B, bounds of C, bounds of A) -> {(B, C): [A, ...]}
+        self.pair_groups: dict[tuple, dict[tuple[Letter, Letter], list[Letter]]] = {}
+        for rule in cfg.rules:
+            output_word = tuple(rule.output_word)
+            variables = (rule.input_letter,) + output_word
+            if not all(v in self.bounds for v in variables if v.is_variable):
+                continue
+            if len(output_word) == 2 and all(l.is_variable for l in output_word):
+                key = tuple(self.bounds[v] for v in output_word + (rule.input_letter,))
+                group = self.pair_groups.setdefault(key, {})
+                group.setdefault(output_word, []).append(rule.input_letter)
+        self._split_groups = {}
+
+    def split_groups(self, left_length: int, right_length: int) -> list[dict]:
+        """return the rule groups that fit a split of a span into two spans of
+        these lengths, each as a dict of (B, C) -> [A, ...]"""
+        key = (left_length, right_length)
+        groups = self._split_groups.get(key)
+        if groups is None:
+            total = left_length + right_length
+            groups = [
+                group
+                for (left, right, whole), group in self.pair_groups.items()
+                if left[0] <= left_length <= left[1]
+                and right[0] <= right_length <= right[1]
+                and whole[0] <= total <= whole[1]
+            ]
+            self._split_groups[key] = groups
+        return groups
+
+
+def make_cyk_table(cfg: CFG, word: tuple[Letter], top_down: bool = False):
     cyktable = CYKTable(word)
+    rules = CYKRules(cfg, len(word), top_down)
+    # hot-path counters, reported once at the end
+    cells_filled = 0
+    splits_examined = 0
+    splits_skipped = 0
+    rule_lookups = 0
+    items_created = 0
     # do stuff for each cell in table
     for pos in cyktable.iter_positions():
-        dest_pos_pairs = cyktable.generate_dest_pairs(pos)
-        for dest_pos_pair in dest_pos_pairs:
-            # for each cell's possible destination
-            # this part is looped for each pair of destinations
-            if pos[0] == 1:
-                # first row, only single 1-destination, returns letters
-                dest_pos = dest_pos_pair[0]
-                dest = cyktable[dest_pos]
-                dest: Letter  # a letter from the header
-                for rule in cfg.rules:
-                    if tuple(rule.output_word) != (dest,):
-                        continue
-                    # found rule that produces the letter in header
-                    cyktable.mark_cell(pos, rule.input_letter, dest_pos, dest)
-
-            else:
-                # other rows, multiple 2-destinations, returns CYKItem instances, extract Letter from them first
-                destA_pos, destB_pos = dest_pos_pair
-                destA: set[CYKItem]
-                destB: set[CYKItem]
-                destA = cyktable[destA_pos]
-                destB = cyktable[destB_pos]
-                # skip if one of the dest has no variables / is empty
-                if len(destA) == 0 or len(destB) == 0:
-                    continue
-                # each dest can have multiple CYKItems, e.g. A = (X), b = (S, Y)
-                for item_pair in itertools.product(destA, destB):
-                    required_word = tuple(i.var for i in item_pair)
-                    for rule in cfg.rules:
-                        if tuple(rule.output_word) != required_word:
-                            continue
-                        # found rule that produces the letter in header
+        cells_filled += 1
+        if pos[0] == 1:
+            # first row, only single 1-destination, returns letters
+            dest_pos = (0, pos[1])
+            dest = cyktable[dest_pos]
+            dest: Letter  # a letter from the header
+            rule_lookups += 1
+            for variable in rules.letter_rules.get(dest, ()):
+                # found rule that produces the letter in header
+                cyktable.mark_cell(pos, variable, dest_pos, dest)
+                items_created += 1
+            continue
+
+        # other rows, multiple 2-destinations, returns CYKItem instances, extract Letter from them first
+        # only the pairs where both dests have variables
+        for destA_pos, destB_pos in cyktable.generate_active_dest_pairs(pos):
+            splits_examined += 1
+            # skip if no rule has variables that can produce spans of these lengths
+            groups = rules.split_groups(destA_pos[0], destB_pos[0])
+            if not groups:
+                splits_skipped += 1
+                continue
+            destA: set[CYKItem]
+            destB: set[CYKItem]
+            destA = cyktable[destA_pos]
+            destB = cyktable[destB_pos]
+            # each dest can have multiple CYKItems of the same variable, e.g. A = (X, X), b = (S, Y)
+            varsA = set(i.var for i in destA)
+            varsB = set(i.var for i in destB)
+            for required_word in itertools.product(varsA, varsB):
+                rule_lookups += 1
+                for group in groups:
+                    for variable in group.get(required_word, ()):
+                        # found rule that produces the pair of variables
                         cyktable.mark_cell(
                             pos,
-                            rule.input_letter,
+                            variable,
                             destA_pos,
                             required_word[0],
                             destB_pos,
                             required_word[1],
                         )
+                        items_created += 1
+    profiling.count("cyk_cells_filled", cells_filled)
+    profiling.count("cyk_splits_examined", splits_examined)
+    profiling.count("cyk_splits_skipped", splits_skipped)
+    profiling.count("cyk_rule_lookups", rule_lookups)
+    profiling.count("cyk_items_created", items_created)
     return cyktable
 
 
-def cyk_table_to_tree(cyktable: CYKTable, cfg: CFG):
+def cyk_table_to_tree(cyktable: CYKTable, cfg: CFG, show: bool = False):
+    """build the parse tree of the start variable in the final cell
+
+    back-pointers are followed with an explicit stack, so deep trees don't hit
+    the recursion limit, and the tree is only printed if `show` is true"""
     tree = CFGParseTree((cfg.start_variable,))
-    # find the starting CYKItem
-    start_item: CYKItem
-    start_item = next(
-        item
-        for item in cyktable[cyktable.final_pos()]
-        if item.var == cfg.start_variable
-    )
-    # find the start node
+    start_item = cyktable.item_for(cyktable.final_pos(), cfg.start_variable)
     start_node = tree.leaves()[0]
     node_item_pairs = [(start_node, start_item)]
 
-    def debug():
-        for node, item in node_item_pairs:
-            print(node, "==>", item.details())
-
-    for node, item in node_item_pairs:
+    while node_item_pairs:
+        node, item = node_item_pairs.pop()
         output_word = tuple(x[1] for x in item.dest if x[1] is not None)
-        tree.branch_word(node, output_word)
+        new_nodes = tree.branch_word(node, output_word, add_to_stack=False)
         if len(output_word) == 1 and not output_word[0].is_variable:
             # we reached row 1, we should terminate
             continue
-        last_added_nodes = tree.last_added_stack[-1]
-        # last added nodes should correspond exactly to item.dest
-        for new_node, new_tup in zip(last_added_nodes, item.dest):
-            # new_tup is a tuple with position and destination letter
-            # we need to convert it to a CYK item with its own destination data
-            new_pos, new_letter = new_tup
-            new_item = next(
-                item for item in cyktable[new_pos] if item.var == new_letter
-            )
+        # new nodes correspond exactly to item.dest
+        for new_node, (new_pos, new_letter) in zip(new_nodes, item.dest):
+            new_item = cyktable.item_for(new_pos, new_letter)
             node_item_pairs.append((new_node, new_item))
 
-    # debug()
-    tree.show()
+    if show:
+        tree.show()
     return tree
 
 
@@ -0,0 +1,169 @@
+from pathlib import Path
+from obj.cfg import CFG, Letter, word_to_str
+from tools import options, profiling
+from tools.cfg_parse import spaced_exclam_to_word
+from tools.common import path_with_suffix, write_to_path
+
+
+class CNFIndex:
+    """the rules of a CFG in Chomsky normal form, indexed by their output"""
+
+    def __init__(self, cfg: CFG):
+        self.start_variable = cfg.start_variable
+        # letter -> variables with a rule `A -> letter`, letters with the same
+        # variables share the set, so don't modify it
+        self.letter_rules: dict[Letter, frozenset[Letter]]
+        self.letter_rules = cfg.analysis().terminal_classes()
+        # letter -> the first letter of its class, letters of the same class
+        # give the same chart columns
+        self.class_letters: dict[Letter, Letter] = {}
+        firsts = {}
+        for letter in sorted(self.letter_rules, key=lambda l: l.name):
+            variables = self.letter_rules[letter]
+            self.class_letters[letter] = firsts.setdefault(variables, letter)
+        # (B, C) -> variables with a rule `A -> B C`
+        self.pair_rules: dict[tuple[Letter, Letter], set[Letter]] = {}
+        self.accepts_empty = False
+        for rule in cfg.rules:
+            output_word = tuple(rule.output_word)
+            if len(output_word) == 0:
+                if rule.input_letter == cfg.start_variable:
+                    self.accepts_empty = True
+            elif len(output_word) == 1 and not output_word[0].is_variable:
+                continue
+            elif len(output_word) == 2 and all(l.is_variable for l in output_word):
+                self.pair_rules.setdefault(output_word, set()).add(rule.input_letter)
+            else:
+                raise Exception(f"Rule isn't in Chomsky normal form: {rule}")
+
+    def class_word(self, word: tuple[Letter]) -> tuple[Letter]:
+        """replace every letter with the first letter of its class, letters that
+        no variable produces become None"""
+        return tuple(self.class_letters.get(letter) for letter in word)
+
+    def next_column(self, columns: list[list[set]], letter: Letter) -> list[set]:
+        """return the chart column of the next letter
+
+        `columns[j][i]` holds the variables that produce letters i to j-1 of the
+        word, with an empty `columns[0]`. only the columns of the prefix before
+        the letter are needed"""
+        j = len(columns)
+        column = [None] * j
+        column[j - 1] = set(self.letter_rules.get(letter, ()))
+        for i in range(j - 2, -1, -1):
+            column[i] = self.split_cell(columns, column, i)
+        return column
+
+    def split_cell(self, columns: list[list[set]], column: list[set], i: int) -> set:
+        """return the variables that produce letters i to j-1, where j is the
+        length of `column`, from the cells of shorter spans
+
+        `column[k]` must be filled for every k > i"""
+        pair_rules = self.pair_rules
+        cell = set()
+        for k in range(i + 1, len(column)):
+            left = columns[k][i]
+            right = column[k]
+            if not left or not right:
+                continue
+            for b in left:
+                for c in right:
+                    produced = pair_rules.get((b, c))
+                    if produced:
+                        cell |= produced
+        return cell
+
+
+class WordTrie:
+    """a trie of words, each node remembers which words end there"""
+
+    def __init__(self, words=()):
+        self.children: dict[Letter, WordTrie] = {}
+        self.ends: list[int] = []
+        for i, word in enumerate(words):
+            self.insert(word, i)
+
+    def insert(self, word: tuple[Letter], word_id: int):
+        node = self
+        for letter in word:
+            child = node.children.get(letter)
+            if child is None:
+                child = node.children[letter] = WordTrie()
+            node = child
+        node.ends.append(word_id)
+
+
+def batch_accepts(
+    cfg: CFG, words: list[tuple[Letter]], index: CNFIndex = None
+) -> list[bool]:
+    """CYK membership of many words, sharing the chart columns of common prefixes
+
+    - `index`: the `CNFIndex` of the CFG, to reuse one made before
+
+    the words are put in a trie, which is walked depth first. the chart column
+    of a letter only depends on the prefix before it, so it's computed once per
+    trie node, and only the columns on the current trie path are kept. letters
+    produced by the same variables are the same letter to the trie"""
+    if index is None:
+        index = CNFIndex(cfg)
+    start = cfg.start_variable
+    results = [False] * len(words)
+    trie = WordTrie(index.class_word(word) for word in words)
+    for word_id in trie.ends:
+        results[word_id] = index.accepts_empty
+    columns_computed = 0
+    # columns[j] is the column of the j-th letter on the current path, the
+    # dummy column 0 keeps the indices lined up with word positions
+    columns = [[]]
+    # stack of (depth of the node, letter leading to it, node)
+    stack = [(1, letter, child) for letter, child in trie.children.items()]
+    while stack:
+        depth, letter, node = stack.pop()
+        del columns[depth:]
+        columns.append(index.next_column(columns, letter))
+        columns_computed += 1
+        if node.ends:
+            accepted = start in columns[depth][0]
+            for word_id in node.ends:
+                results[word_id] = accepted
+        for next_letter, child in node.children.items():
+            stack.append((depth + 1, next_letter, child))
+    profiling.count("cyk_batch_columns", columns_computed)
+    profiling.count("cyk_batch_letters", sum(len(w) for w in words))
+    return results
+
+
+def get_words(original_path: Path) -> list[tuple[Letter]]:
+    """return the words of the `cyk_words` or `cyk_words_file` options"""
+    words_path = options.get("cyk_words_file")
+    if words_path is not None:
+        words_path = original_path.parent / words_path
+        with open(words_path, encoding="utf8") as f:
+            lines = [line.strip() for line in f]
+        return [spaced_exclam_to_word(line) for line in lines if line]
+    words_str = options.get("cyk_words")
+    if words_str is not None:
+        return [spaced_exclam_to_word(w) for w in words_str.split(",")]
+    raise Exception("Give the words to test with `cyk_words` or `cyk_words_file`!")
+
+
+def process(cfg: CFG, original_path: Path):
+    """test many words with CYK, the CFG must be in Chomsky normal form
+
+    options:
+    - `cyk_words WORD1,WORD2,...`: the words to test in "spaced!" format
+    - `cyk_words_file PATH`: a file with one word per line (relative to the
+      input file), used instead of `cyk_words`"""
+    if not cfg.start_variable:
+        print("Start variable required for this action!")
+        print("Please define `start xxx` in the input file")
+        return
+
+    words = get_words(original_path)
+    with profiling.phase("cyk_batch"):
+        results = batch_accepts(cfg, words)
+    lines = []
+    for word, accepted in zip(words, results):
+        lines.append(f"{word_to_str(word)}: {'accepted' if accepted else 'rejected'}")
+    print(f"{sum(results)} of {len(words)} words accepted")
+    write_to_path(path_with_suffix(original_path, "cyk_batch"), "\n".join(lines))
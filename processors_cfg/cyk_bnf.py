@@ -0,0 +1,176 @@
+from collections import defaultdict, deque
+from pathlib import Path
+from obj.cfg import CFG, Letter, Rule, word_to_str
+from processors_cfg.bnf import to_bnf, unbinarize
+from processors_cfg.interactive import CFGParseTree, write_diagram
+from processors_cfg.witness import shortest_rules, witness_derivation
+from tools import options, profiling
+from tools.cfg_parse import spaced_exclam_to_word
+from tools.common import path_with_suffix, write_to_path
+
+
+class UnitClosureChart:
+    """CYK for a CFG whose rules have at most 2 letters, without removing unit and
+    e rules (Lange & Leiß)
+
+    a letter or variable Y "unit-produces" A if there's a rule `A -> Y`, or
+    `A -> Y Z` or `A -> Z Y` with a nullable Z. `cells[i, j]` holds the letters
+    and variables that produce letters i to j-1 of the word, found from the
+    binary rules and then closed under this relation. the closure of each letter
+    and variable is computed once and shared by all cells"""
+
+    def __init__(self, cfg: CFG, word: tuple[Letter]):
+        self.cfg = cfg
+        self.word = tuple(word)
+        self.nullable = cfg.analysis().nullable()
+        # Y -> [(rule, position of Y in the rule)] for each rule that Y unit-produces
+        self.unit_rules: dict[Letter, list[tuple[Rule, int]]] = defaultdict(list)
+        # Y -> [(Z, rule)] for each rule `A -> Y Z`
+        self.pair_rules: dict[Letter, list[tuple[Letter, Rule]]] = defaultdict(list)
+        for rule in cfg.rules:
+            output_word = tuple(rule.output_word)
+            if len(output_word) == 1:
+                self.unit_rules[output_word[0]].append((rule, 0))
+            elif len(output_word) == 2:
+                self.pair_rules[output_word[0]].append((output_word[1], rule))
+                if output_word[1] in self.nullable:
+                    self.unit_rules[output_word[0]].append((rule, 0))
+                if output_word[0] in self.nullable:
+                    self.unit_rules[output_word[1]].append((rule, 1))
+            elif len(output_word) > 2:
+                raise Exception(f"Rule has more than 2 letters, use bnf first: {rule}")
+        self._closures = {}
+        self._fill()
+
+    def closure(self, symbol: Letter) -> dict[Letter, tuple[Rule, int, Letter]]:
+        """return the variables that a letter or variable unit-produces in one or
+        more steps, as variable -> (rule, position, the previous step)"""
+        result = self._closures.get(symbol)
+        if result is None:
+            result = {}
+            queue = deque([symbol])
+            while queue:
+                current = queue.popleft()
+                for rule, position in self.unit_rules.get(current, ()):
+                    variable = rule.input_letter
+                    if variable != symbol and variable not in result:
+                        result[variable] = (rule, position, current)
+                        queue.append(variable)
+            self._closures[symbol] = result
+        return result
+
+    def _close(self, cell: dict):
+        for symbol in list(cell):
+            for variable in self.closure(symbol):
+                if variable not in cell:
+                    cell[variable] = ("unit", symbol)
+
+    def _fill(self):
+        n = len(self.word)
+        # (i, j) -> {letter or variable: how it produces the span}
+        self.cells: dict[tuple[int, int], dict] = {}
+        for i, letter in enumerate(self.word):
+            cell = {letter: None}
+            self._close(cell)
+            self.cells[i, i + 1] = cell
+        pair_rules = self.pair_rules
+        for length in range(2, n + 1):
+            for i in range(n - length + 1):
+                j = i + length
+                cell = {}
+                for k in range(i + 1, j):
+                    left = self.cells[i, k]
+                    right = self.cells[k, j]
+                    if not left or not right:
+                        continue
+                    for y in left:
+                        for z, rule in pair_rules.get(y, ()):
+                            if z in right and rule.input_letter not in cell:
+                                cell[rule.input_letter] = ("pair", rule, k)
+                self._close(cell)
+                self.cells[i, j] = cell
+        profiling.count("cyk_bnf_cells", len(self.cells))
+
+    def accepted(self) -> bool:
+        start = self.cfg.start_variable
+        if len(self.word) == 0:
+            return start in self.nullable
+        return start in self.cells[0, len(self.word)]
+
+    def derivation(self):
+        """return the derivation of the word from the start variable, see
+        `CFGParseTree.expand_with`"""
+        if not self.accepted():
+            raise Exception("The word isn't accepted!")
+        start = self.cfg.start_variable
+        # for the nullable letters next to unit steps
+        best = shortest_rules(self.cfg)
+        if len(self.word) == 0:
+            return witness_derivation(best, start)
+        root = [None]
+        # stack of (list to put the derivation in, index, symbol, start, end)
+        stack = [(root, 0, start, 0, len(self.word))]
+        while stack:
+            output, index, symbol, i, j = stack.pop()
+            how = self.cells[i, j][symbol]
+            if how is None:
+                # a letter of the word
+                continue
+            if how[0] == "unit":
+                # follow the unit steps down to the symbol they started from
+                base = how[1]
+                closure = self.closure(base)
+                while symbol != base:
+                    rule, position, previous = closure[symbol]
+                    children = [None] * len(rule.output_word)
+                    for k, letter in enumerate(rule.output_word):
+                        if k != position:
+                            children[k] = witness_derivation(best, letter)
+                    output[index] = (rule, children)
+                    output, index, symbol = children, position, previous
+                if self.cells[i, j][symbol] is not None:
+                    stack.append((output, index, symbol, i, j))
+                continue
+            _, rule, k = how
+            children = [None, None]
+            output[index] = (rule, children)
+            y, z = rule.output_word
+            if y.is_variable:
+                stack.append((children, 0, y, i, k))
+            if z.is_variable:
+                stack.append((children, 1, z, k, j))
+        return root[0]
+
+
+def process(cfg: CFG, original_path: Path):
+    """test a word with CYK on the binarized CFG, without converting to CNF, and
+    draw the parse tree in the original CFG
+
+    options:
+    - `word WORD`: the word to test in "spaced!" format, asked for if missing"""
+    if not cfg.start_variable:
+        print("Start variable required for this action!")
+        print("Please define `start xxx` in the input file")
+        return
+    word_str = options.get("word")
+    if word_str is None:
+        print("Input the word to test: (Format is 'spaced!')")
+        word_str = input("  > ")
+    word = spaced_exclam_to_word(word_str)
+
+    with profiling.phase("bnf"):
+        bnf, chain_variables = to_bnf(cfg)
+    with profiling.phase("cyk_bnf"):
+        chart = UnitClosureChart(bnf, word)
+    accepted = chart.accepted()
+    result = f"{word_to_str(word)}: {'accepted' if accepted else 'rejected'}"
+    print(result)
+    write_to_path(path_with_suffix(original_path, "cyk_bnf"), result)
+    if not accepted:
+        return
+    with profiling.phase("cyk_bnf_tree"):
+        derivation = unbinarize(chart.derivation(), chain_variables)
+    ptree = CFGParseTree((cfg.start_variable,))
+    ptree.expand_with(ptree.leaves()[0], derivation)
+    tree_path = path_with_suffix(original_path, "cyk_bnf_tree").with_suffix(".dot")
+    write_diagram(ptree, tree_path)
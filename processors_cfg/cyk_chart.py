@@ -0,0 +1,85 @@
+from obj.cfg import CFG, Letter
+from processors_cfg.cyk_batch import CNFIndex
+from tools import profiling
+
+
+class CYKChart:
+    """the CYK chart of a word that can be edited, for a CFG in Chomsky normal form
+
+    `columns[j][i]` holds the variables that produce letters i to j-1 of the
+    word, `columns[0]` is empty. after an edit, only the cells whose span
+    overlaps the edit are recomputed, the other cells are reused as they are"""
+
+    def __init__(self, cfg_or_index: CFG | CNFIndex, word: tuple[Letter]):
+        if isinstance(cfg_or_index, CNFIndex):
+            self.index = cfg_or_index
+        else:
+            self.index = CNFIndex(cfg_or_index)
+        self.word = tuple(word)
+        self.columns: list[list[set]] = [[]]
+        for letter in self.word:
+            self.columns.append(self.index.next_column(self.columns, letter))
+
+    def __len__(self) -> int:
+        return len(self.word)
+
+    def cell(self, start: int, end: int) -> set[Letter]:
+        """return the variables that produce letters `start` to `end - 1`"""
+        return self.columns[end][start]
+
+    def accepted(self) -> bool:
+        if len(self.word) == 0:
+            return self.index.accepts_empty
+        return self.index.start_variable in self.columns[len(self.word)][0]
+
+    def replace(self, pos: int, letter: Letter) -> int:
+        """replace the letter at `pos`, return the number of recomputed cells"""
+        self._check_pos(pos, len(self.word))
+        return self.edit(pos, 1, (letter,))
+
+    def insert(self, pos: int, letter: Letter) -> int:
+        """insert a letter before `pos`, return the number of recomputed cells"""
+        self._check_pos(pos, len(self.word) + 1)
+        return self.edit(pos, 0, (letter,))
+
+    def delete(self, pos: int) -> int:
+        """delete the letter at `pos`, return the number of recomputed cells"""
+        self._check_pos(pos, len(self.word))
+        return self.edit(pos, 1, ())
+
+    def _check_pos(self, pos: int, limit: int):
+        if not (0 <= pos < limit):
+            raise IndexError(f"Position {pos} out of range!")
+
+    def edit(self, pos: int, num_deleted: int, new_letters: tuple[Letter]) -> int:
+        """replace `num_deleted` letters at `pos` with `new_letters`
+
+        cells ending before the edit are kept, cells starting after the edit are
+        moved by the change in length, and the cells overlapping the edit are
+        recomputed from the others. return the number of recomputed cells"""
+        old_columns = self.columns
+        edit_end = pos + len(new_letters)
+        shift = len(new_letters) - num_deleted
+        self.word = (
+            self.word[:pos] + tuple(new_letters) + self.word[pos + num_deleted :]
+        )
+        letter_rules = self.index.letter_rules
+        # columns ending before the edit don't change at all
+        columns = old_columns[: pos + 1]
+        recomputed = 0
+        for j in range(pos + 1, len(self.word) + 1):
+            column = [None] * j
+            for i in range(j - 1, -1, -1):
+                if i >= edit_end:
+                    # the span is after the edit, it only moved
+                    column[i] = old_columns[j - shift][i - shift]
+                    continue
+                recomputed += 1
+                if i == j - 1:
+                    column[i] = set(letter_rules.get(self.word[i], ()))
+                    continue
+                column[i] = self.index.split_cell(columns, column, i)
+            columns.append(column)
+        self.columns = columns
+        profiling.count("cyk_cells_recomputed", recomputed)
+        return recomputed
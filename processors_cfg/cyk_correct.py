@@ -0,0 +1,279 @@
+from pathlib import Path
+from obj.cfg import CFG, Letter, Rule, rule_to_str, word_to_str
+from processors_cfg.interactive import CFGParseTree, write_diagram
+from processors_cfg.witness import shortest_rules, witness_derivation, witness_word
+from tools import options, profiling
+from tools.cfg_parse import spaced_exclam_to_word
+from tools.common import path_with_suffix, write_to_path
+
+# cost of spans that no variable can cover, small enough that sums don't overflow
+INFINITY = 1 << 20
+
+
+class CorrectionChart:
+    """error-correcting CYK (Aho & Peterson) for a CFG in Chomsky normal form
+
+    `cost[i, j, v]` is the least number of insertions, deletions and
+    substitutions that turn letters i to j-1 of the word into a word of
+    variable v. every input letter belongs to the span of exactly one leaf of
+    the parse tree, so:
+
+    - empty spans cost the shortest yield of the variable (all inserted)
+    - `A -> a` costs the span length, minus 1 if `a` is in the span
+    - `A -> B C` costs the cheapest split, where either side can be empty
+
+    spans of the same length are filled at once with numpy"""
+
+    def __init__(self, cfg: CFG, word: tuple[Letter]):
+        import numpy as np
+
+        self.cfg = cfg
+        self.word = tuple(word)
+        self.best = shortest_rules(cfg)
+        self.variables = sorted(cfg.all_variables(), key=lambda v: v.name)
+        self.variable_ids = {v: i for i, v in enumerate(self.variables)}
+        self._index_rules(np)
+        self._fill(np)
+
+    def _index_rules(self, np):
+        cfg = self.cfg
+        self.letter_rules: dict[Letter, list[Rule]] = {}
+        self.pair_rules: dict[Letter, list[Rule]] = {}
+        self.empty_rules: set[Letter] = set()
+        right_variables = set()
+        for rule in sorted(cfg.rules, key=rule_to_str):
+            output_word = tuple(rule.output_word)
+            if len(output_word) == 0:
+                self.empty_rules.add(rule.input_letter)
+            elif len(output_word) == 1 and not output_word[0].is_variable:
+                self.letter_rules.setdefault(rule.input_letter, []).append(rule)
+            elif len(output_word) == 2 and all(l.is_variable for l in output_word):
+                self.pair_rules.setdefault(rule.input_letter, []).append(rule)
+                right_variables.update(output_word)
+            else:
+                raise Exception(f"Rule isn't in Chomsky normal form: {rule}")
+        if self.empty_rules - {cfg.start_variable} or (
+            self.empty_rules and cfg.start_variable in right_variables
+        ):
+            raise Exception(
+                "Only a start variable that isn't used in other rules can produce e!"
+            )
+
+        ids = self.variable_ids
+        # binary rules grouped by input variable, for `np.minimum.reduceat`
+        inputs, lefts, rights = [], [], []
+        for variable, rules in self.pair_rules.items():
+            for rule in rules:
+                inputs.append(ids[variable])
+                lefts.append(ids[rule.output_word[0]])
+                rights.append(ids[rule.output_word[1]])
+        order = sorted(range(len(inputs)), key=lambda r: inputs[r])
+        self.rule_inputs = np.array([inputs[r] for r in order], dtype=np.intp)
+        self.rule_lefts = np.array([lefts[r] for r in order], dtype=np.intp)
+        self.rule_rights = np.array([rights[r] for r in order], dtype=np.intp)
+        starts = [
+            r
+            for r in range(len(order))
+            if r == 0 or self.rule_inputs[r] != self.rule_inputs[r - 1]
+        ]
+        self.group_starts = np.array(starts, dtype=np.intp)
+        self.group_inputs = self.rule_inputs[self.group_starts]
+
+        # letter -> variables, as a matrix
+        self.alphabet = sorted(cfg.all_alphabet(), key=lambda l: l.name)
+        letter_ids = {l: i for i, l in enumerate(self.alphabet)}
+        self.produces = np.zeros((len(self.alphabet), len(self.variables)), np.int32)
+        for variable, rules in self.letter_rules.items():
+            for rule in rules:
+                self.produces[letter_ids[rule.output_word[0]], ids[variable]] = 1
+        self.has_letter_rule = np.zeros(len(self.variables), bool)
+        self.has_letter_rule[[ids[v] for v in self.letter_rules]] = True
+        self.has_empty_rule = np.zeros(len(self.variables), bool)
+        self.has_empty_rule[[ids[v] for v in self.empty_rules]] = True
+        self.min_length = np.full(len(self.variables), INFINITY, np.int32)
+        for variable, (length, _) in self.best.items():
+            self.min_length[ids[variable]] = length
+        # prefix counts of each letter in the word
+        counts = np.zeros((len(self.word) + 1, len(self.alphabet)), np.int32)
+        for pos, letter in enumerate(self.word):
+            counts[pos + 1] = counts[pos]
+            if letter in letter_ids:
+                counts[pos + 1, letter_ids[letter]] += 1
+        self.letter_counts = counts
+
+    def _reduce(self, np, candidates):
+        """minimum of each rule group, `candidates` has one column per rule"""
+        return np.minimum.reduceat(candidates, self.group_starts, axis=1)
+
+    def _fill(self, np):
+        n = len(self.word)
+        num_variables = len(self.variables)
+        cost = np.full((n + 1, n + 1, num_variables), INFINITY, np.int32)
+        for i in range(n + 1):
+            cost[i, i] = self.min_length
+        has_rules = len(self.rule_inputs) > 0
+        groups = self.group_inputs
+        for length in range(1, n + 1):
+            starts = np.arange(n - length + 1)
+            ends = starts + length
+            # `A -> a`: match one letter if possible, delete the rest
+            present = (self.letter_counts[ends] - self.letter_counts[starts]) > 0
+            matched = (present.astype(np.int32) @ self.produces) > 0
+            cell = np.where(self.has_letter_rule, length - matched, INFINITY)
+            cell = np.where(self.has_empty_rule, np.minimum(cell, length), cell)
+            cell = cell.astype(np.int32)
+            if has_rules and length >= 2:
+                # `A -> B C` with both sides non-empty
+                splits = starts[:, None] + np.arange(1, length)[None, :]
+                left = cost[starts[:, None], splits]
+                right = cost[splits, ends[:, None]]
+                candidates = (
+                    left[:, :, self.rule_lefts] + right[:, :, self.rule_rights]
+                ).min(axis=1)
+                cell[:, groups] = np.minimum(
+                    cell[:, groups], self._reduce(np, candidates)
+                )
+            if has_rules:
+                # `A -> B C` with an empty side inserted, repeat until nothing changes
+                while True:
+                    candidates = np.minimum(
+                        cell[:, self.rule_lefts] + self.min_length[self.rule_rights],
+                        self.min_length[self.rule_lefts] + cell[:, self.rule_rights],
+                    )
+                    improved = np.minimum(cell[:, groups], self._reduce(np, candidates))
+                    if (improved == cell[:, groups]).all():
+                        break
+                    cell[:, groups] = improved
+            cost[starts, ends] = cell
+        self.cost = cost
+
+    def distance(self) -> int:
+        """least number of edits that make the word accepted, None if no word is"""
+        start = self.cfg.start_variable
+        if start not in self.variable_ids:
+            return None
+        value = int(self.cost[0, len(self.word), self.variable_ids[start]])
+        return None if value >= INFINITY else value
+
+    def _cost(self, i: int, j: int, variable: Letter) -> int:
+        return int(self.cost[i, j, self.variable_ids[variable]])
+
+    def correction(self):
+        """return the derivation of the closest accepted word and the edits
+
+        the derivation is `(rule, [derivation of each letter in the rule])`,
+        see `CFGParseTree.expand_with`. each edit is a string"""
+        if self.distance() is None:
+            raise Exception("The grammar doesn't accept any words!")
+        word = self.word
+        edits = []
+        root = [None]
+        # stack of (list to put the derivation in, index, start, end, variable)
+        stack = [(root, 0, 0, len(word), self.cfg.start_variable)]
+        while stack:
+            output, index, i, j, variable = stack.pop()
+            target = self._cost(i, j, variable)
+            if i == j:
+                output[index] = witness_derivation(self.best, variable)
+                for letter in witness_word(self.best, variable):
+                    edits.append(f"insert {letter} before position {i}")
+                continue
+            span = word[i:j]
+            found = False
+            for rule in self.letter_rules.get(variable, ()):
+                letter = rule.output_word[0]
+                if letter in span:
+                    if j - i - 1 != target:
+                        continue
+                    keep = i + span.index(letter)
+                else:
+                    if j - i != target:
+                        continue
+                    keep = i
+                    edits.append(f"substitute {word[i]} at position {i} with {letter}")
+                for pos in range(i, j):
+                    if pos != keep:
+                        edits.append(f"delete {word[pos]} at position {pos}")
+                output[index] = (rule, [None])
+                found = True
+                break
+            if not found and variable in self.empty_rules and j - i == target:
+                for pos in range(i, j):
+                    edits.append(f"delete {word[pos]} at position {pos}")
+                output[index] = (Rule(variable, ()), [])
+                found = True
+            if not found:
+                for rule in self.pair_rules.get(variable, ()):
+                    b, c = rule.output_word
+                    for k in range(i, j + 1):
+                        if self._cost(i, k, b) + self._cost(k, j, c) == target:
+                            children = [None, None]
+                            output[index] = (rule, children)
+                            stack.append((children, 1, k, j, c))
+                            stack.append((children, 0, i, k, b))
+                            found = True
+                            break
+                    if found:
+                        break
+            if not found:
+                raise Exception(
+                    f"No rule of {variable} matches its cost, this is a bug!"
+                )
+        # the stack is last in first out, so the edits come out left to right
+        return root[0], edits
+
+
+def derivation_yield(derivation) -> tuple[Letter]:
+    """return the word produced by a derivation"""
+    word = []
+    stack = [(None, derivation)]
+    while stack:
+        letter, derivation = stack.pop()
+        if derivation is None:
+            word.append(letter)
+            continue
+        rule, children = derivation
+        stack.extend(reversed(list(zip(rule.output_word, children))))
+    return tuple(word)
+
+
+def report(cfg: CFG, word: tuple[Letter], original_path: Path):
+    """find the closest accepted word, print it and write it with its parse tree"""
+    with profiling.phase("cyk_correct"):
+        chart = CorrectionChart(cfg, word)
+    distance = chart.distance()
+    if distance is None:
+        print("The grammar doesn't accept any words!")
+        return
+    derivation, edits = chart.correction()
+    corrected = derivation_yield(derivation)
+    lines = [
+        f"word: {word_to_str(word)}",
+        f"edit distance: {distance}",
+        f"corrected word: {word_to_str(corrected)}",
+        "edits:",
+    ] + [f"  {edit}" for edit in edits]
+    content = "\n".join(lines)
+    print(content)
+    write_to_path(path_with_suffix(original_path, "cyk_correct"), content)
+    ptree = CFGParseTree((cfg.start_variable,))
+    ptree.expand_with(ptree.leaves()[0], derivation)
+    tree_path = path_with_suffix(original_path, "cyk_correct_tree").with_suffix(".dot")
+    write_diagram(ptree, tree_path)
+
+
+def process(cfg: CFG, original_path: Path):
+    """find the fewest insertions, deletions and substitutions that make a word
+    accepted, the CFG must be in Chomsky normal form. requires numpy
+
+    options:
+    - `word WORD`: the word to correct in "spaced!" format, asked for if missing"""
+    if not cfg.start_variable:
+        print("Start variable required for this action!")
+        print("Please define `start xxx` in the input file")
+        return
+    word_str = options.get("word")
+    if word_str is None:
+        print("Input the word to correct: (Format is 'spaced!')")
+        word_str = input("  > ")
+    report(cfg, spaced_exclam_to_word(word_str), original_path)
@@ -0,0 +1,210 @@
+from collections import deque
+from pathlib import Path
+from typing import Iterator
+from obj.cfg import CFG, Letter, word_to_str
+from processors_cfg.cyk_batch import CNFIndex
+from tools import options, profiling
+from tools.cfg_parse import spaced_exclam_to_word
+from tools.common import path_with_suffix
+
+SPAN_MODES = ("all", "maximal", "non_overlapping")
+
+
+def iter_hits(
+    index: CNFIndex,
+    text: tuple[Letter],
+    targets: set[Letter],
+    max_span: int = None,
+    variables: set[Letter] = None,
+) -> Iterator[tuple[int, int, Letter]]:
+    """yield every (start, end, variable) where a target variable produces
+    letters start to end-1 of the text, ordered by end then by length
+
+    only the chart columns of the last `max_span` letters are kept, and spans
+    longer than `max_span` aren't searched. with `variables`, the other
+    variables are left out of the chart"""
+    pair_rules = index.pair_rules
+    # columns of the previous letters, newest last. `column[d]` holds the
+    # variables that produce the span of length d+1 ending at the column
+    window = deque()
+    for j, letter in enumerate(text, 1):
+        limit = j if max_span is None else min(j, max_span)
+        cell = set(index.letter_rules.get(letter, ()))
+        if variables is not None:
+            cell &= variables
+        column = [cell]
+        for length in range(2, limit + 1):
+            # the span [j - length, j), split into [j - length, k) and [k, j)
+            cell = set()
+            for right_length in range(1, length):
+                right = column[right_length - 1]
+                if not right:
+                    continue
+                # the column ending at k is `right_length` columns back
+                left = window[-right_length][length - right_length - 1]
+                if not left:
+                    continue
+                for b in left:
+                    for c in right:
+                        produced = pair_rules.get((b, c))
+                        if produced:
+                            cell |= produced
+            if variables is not None:
+                cell &= variables
+            column.append(cell)
+        for length, cell in enumerate(column, 1):
+            for variable in sorted(cell & targets, key=lambda v: v.name):
+                yield j - length, j, variable
+        window.append(column)
+        if max_span is not None and len(window) > max_span:
+            window.popleft()
+
+
+def span_limit(cfg: CFG, targets: set[Letter], max_span: int = None) -> int:
+    """return the longest span that can be a hit: `max_span`, or the longest
+    word of the targets. None if neither limits it"""
+    max_yield = cfg.analysis().max_yield()
+    lengths = [max_yield[t] for t in targets if t in max_yield]
+    if None in lengths:
+        return max_span
+    # targets without words have no hits, any window works
+    longest = max(lengths, default=1)
+    return longest if max_span is None else min(longest, max_span)
+
+
+def target_variables(cfg: CFG, targets: set[Letter]) -> set[Letter]:
+    """return the variables that can appear in a derivation of a target"""
+    rules_map = cfg.analysis().rules_map()
+    found = set(targets)
+    stack = list(targets)
+    while stack:
+        variable = stack.pop()
+        for rule in rules_map.get(variable, ()):
+            for letter in rule.output_word:
+                if letter.is_variable and letter not in found:
+                    found.add(letter)
+                    stack.append(letter)
+    return found
+
+
+def search_spans(
+    cfg: CFG,
+    index: CNFIndex,
+    text: tuple[Letter],
+    targets: set[Letter],
+    mode: str = "all",
+    max_span: int = None,
+) -> Iterator[tuple[int, int, Letter]]:
+    """yield the hits of the targets of the given mode, keeping only the chart
+    columns and variables that the targets need"""
+    limit = span_limit(cfg, targets, max_span)
+    hits = iter_hits(index, text, targets, limit, target_variables(cfg, targets))
+    if mode == "maximal":
+        return maximal_hits(hits, limit)
+    if mode == "non_overlapping":
+        return non_overlapping_hits(hits, limit)
+    return hits
+
+
+def maximal_hits(hits, max_span: int = None) -> Iterator[tuple[int, int, Letter]]:
+    """yield the hits whose span isn't inside the span of another hit, ordered
+    by start
+
+    `hits` must be ordered by end then by length, like `iter_hits` gives them.
+    a hit is yielded once no hit of at most `max_span` letters ending later
+    can contain it, so without `max_span` they are all yielded at the end"""
+    # [start, end, variables] of the hits not inside another hit so far, with
+    # increasing starts and ends
+    pending = deque()
+    for start, end, variable in hits:
+        if max_span is not None:
+            # later hits end at `end` or after, so start at `end - max_span` or after
+            while pending and pending[0][0] < end - max_span:
+                first_start, first_end, variables = pending.popleft()
+                yield from ((first_start, first_end, v) for v in variables)
+        if pending and pending[-1][:2] == [start, end]:
+            pending[-1][2].append(variable)
+            continue
+        # a longer hit contains the hits that start at or after its start
+        while pending and pending[-1][0] >= start:
+            pending.pop()
+        pending.append([start, end, [variable]])
+    for start, end, variables in pending:
+        yield from ((start, end, v) for v in variables)
+
+
+def non_overlapping_hits(
+    hits, max_span: int = None
+) -> Iterator[tuple[int, int, Letter]]:
+    """yield the leftmost-longest hits that don't overlap each other, see
+    `maximal_hits`"""
+    taken_until = 0
+    last_span = None
+    for start, end, variable in maximal_hits(hits, max_span):
+        if (start, end) == last_span:
+            yield start, end, variable
+        elif start >= taken_until:
+            yield start, end, variable
+            taken_until = end
+            last_span = (start, end)
+
+
+def get_text(original_path: Path) -> tuple[Letter]:
+    """return the text of the `text_file` or `text` options"""
+    text_path = options.get("text_file")
+    if text_path is not None:
+        with open(original_path.parent / text_path, encoding="utf8") as f:
+            return spaced_exclam_to_word(" ".join(f.read().split()))
+    text_str = options.get("text")
+    if text_str is not None:
+        return spaced_exclam_to_word(text_str)
+    raise Exception("Give the text to search with `text` or `text_file`!")
+
+
+def get_targets(cfg: CFG) -> set[Letter]:
+    """return the variables named by the `span_targets` option"""
+    variables = {v.name: v for v in cfg.all_variables()}
+    names = options.get("span_targets")
+    if names is None:
+        if cfg.start_variable is None:
+            raise Exception("Give the variables to search for with `span_targets`!")
+        return {cfg.start_variable}
+    targets = set()
+    for name in names.split(","):
+        name = name.strip().rstrip("!")
+        if name not in variables:
+            raise Exception(f"Unknown variable {name}!")
+        targets.add(variables[name])
+    return targets
+
+
+def process(cfg: CFG, original_path: Path):
+    """find the parts of a text that target variables produce, the CFG must be
+    in Chomsky normal form
+
+    options:
+    - `text WORD` or `text_file PATH`: the text in "spaced!" format, the file
+      is relative to the input file
+    - `span_targets A,B,...`: the variables to look for, default is the start variable
+    - `span_mode MODE`: "all" hits, "maximal" hits that aren't inside another
+      hit, or leftmost-longest "non_overlapping" hits
+    - `max_span N`: only look for spans up to N letters"""
+    mode = options.get("span_mode", "all")
+    if mode not in SPAN_MODES:
+        raise Exception(f"Unknown span mode {mode}, use one of {', '.join(SPAN_MODES)}")
+    text = get_text(original_path)
+    targets = get_targets(cfg)
+    max_span = options.get_int("max_span")
+    index = CNFIndex(cfg)
+    limit = span_limit(cfg, targets, max_span)
+    if limit is None:
+        print("The targets have no longest word, the whole CYK chart is kept")
+
+    output_path = path_with_suffix(original_path, "cyk_spans")
+    count = 0
+    with profiling.phase("cyk_spans"), open(output_path, "w", encoding="utf-8") as f:
+        hits = search_spans(cfg, index, text, targets, mode, max_span)
+        for start, end, variable in hits:
+            f.write(f"{start} {end} {variable}: {word_to_str(text[start:end])}\n")
+            count += 1
+    print(f"Found {count} spans, written to {output_path}")
@@ -0,0 +1,148 @@
+from obj.cfg import CFG, Letter, Rule, rule_to_str
+
+# rule number of the extra rule `GOAL -> form`
+GOAL = 0
+
+
+class EarleyChart:
+    """Earley chart of a sentential form against a target word
+
+    the form can contain variables and letters, the target only letters.
+    every item keeps the first back-pointer it was created with, so following
+    back-pointers always reaches older items and never loops"""
+
+    def __init__(self, cfg: CFG, form: tuple[Letter], target: tuple[Letter]):
+        self.form = tuple(form)
+        self.target = tuple(target)
+        self.nullable = cfg.analysis().null_rules()
+        # rule 0 is `GOAL -> form`, the other rules are sorted for stable results
+        self.rules: list[Rule] = [Rule(None, self.form)] + sorted(
+            cfg.rules, key=rule_to_str
+        )
+        self.rules_of: dict[Letter, list[int]] = {}
+        for i, rule in enumerate(self.rules):
+            if i != GOAL:
+                self.rules_of.setdefault(rule.input_letter, []).append(i)
+        n = len(self.target)
+        # sets[j] maps an item (rule number, dot, origin) to its back-pointer
+        self.sets: list[dict] = [dict() for _ in range(n + 1)]
+        # waiting[j][variable] lists the items in set j with the dot before the variable
+        self.waiting: list[dict] = [dict() for _ in range(n + 1)]
+        self._fill()
+
+    def _add(self, j: int, item, back_pointer, agenda=None):
+        items = self.sets[j]
+        if item in items:
+            return
+        items[item] = back_pointer
+        rule_num, dot, _ = item
+        output_word = self.rules[rule_num].output_word
+        if dot < len(output_word) and output_word[dot].is_variable:
+            self.waiting[j].setdefault(output_word[dot], []).append(item)
+        if agenda is not None:
+            agenda.append(item)
+
+    def _fill(self):
+        rules = self.rules
+        target = self.target
+        n = len(target)
+        self._add(0, (GOAL, 0, 0), None)
+        for j in range(n + 1):
+            agenda = list(self.sets[j])
+            i = 0
+            while i < len(agenda):
+                item = agenda[i]
+                i += 1
+                rule_num, dot, origin = item
+                output_word = rules[rule_num].output_word
+                if dot < len(output_word):
+                    letter = output_word[dot]
+                    if letter.is_variable:
+                        # predict
+                        for predicted in self.rules_of.get(letter, ()):
+                            self._add(j, (predicted, 0, j), None, agenda)
+                        if letter in self.nullable:
+                            # skip nullable variables right away (Aycock & Horspool)
+                            back_pointer = (item, j, ("null", letter))
+                            self._add(
+                                j, (rule_num, dot + 1, origin), back_pointer, agenda
+                            )
+                    elif j < n and target[j] == letter:
+                        # scan
+                        self._add(j + 1, (rule_num, dot + 1, origin), (item, j, None))
+                elif rule_num != GOAL:
+                    # complete
+                    variable = rules[rule_num].input_letter
+                    for waiting in list(self.waiting[origin].get(variable, ())):
+                        w_rule, w_dot, w_origin = waiting
+                        back_pointer = (waiting, origin, ("item", item))
+                        self._add(
+                            j, (w_rule, w_dot + 1, w_origin), back_pointer, agenda
+                        )
+
+    def accepted(self) -> bool:
+        return (GOAL, len(self.form), 0) in self.sets[len(self.target)]
+
+    def _children(self, item, j: int) -> list:
+        """return what each letter in the item's rule was derived from, left to right
+
+        - None: a letter from the target
+        - ("null", variable): the variable produces the empty word
+        - ("item", completed item, set number): the variable was parsed by that item"""
+        children = []
+        while item[1] > 0:
+            previous, previous_set, child = self.sets[j][item]
+            if child is not None and child[0] == "item":
+                child = ("item", child[1], j)
+            children.append(child)
+            item, j = previous, previous_set
+        children.reverse()
+        return children
+
+    def _null_derivation(self, variable: Letter):
+        """return a derivation of the empty word from the variable"""
+        root = [None]
+        # stack of (list to put the derivation in, index, variable)
+        stack = [(root, 0, variable)]
+        while stack:
+            output, i, variable = stack.pop()
+            rule = self.nullable[variable]
+            children = [None] * len(rule.output_word)
+            output[i] = (rule, children)
+            for k, letter in enumerate(rule.output_word):
+                stack.append((children, k, letter))
+        return root[0]
+
+    def derivations(self) -> list:
+        """return a derivation for each letter of the form, None for letters
+
+        a derivation is `(rule, [derivation of each letter in the rule])`.
+        raises an Exception if the target isn't derivable"""
+        if not self.accepted():
+            raise Exception("Target word can't be derived from the form!")
+        n = len(self.target)
+        root_children = []
+        # stack of (list to put the derivation in, index, child descriptor)
+        stack = []
+        for i, child in enumerate(self._children((GOAL, len(self.form), 0), n)):
+            root_children.append(None)
+            stack.append((root_children, i, child))
+        while stack:
+            output, i, child = stack.pop()
+            if child is None:
+                continue
+            if child[0] == "null":
+                output[i] = self._null_derivation(child[1])
+                continue
+            _, item, j = child
+            rule = self.rules[item[0]]
+            sub_children = [None] * len(rule.output_word)
+            output[i] = (rule, sub_children)
+            for k, sub_child in enumerate(self._children(item, j)):
+                stack.append((sub_children, k, sub_child))
+        return root_children
+
+
+def accepts(cfg: CFG, word: tuple[Letter]) -> bool:
+    """return whether the start variable derives the word, works on any CFG"""
+    return EarleyChart(cfg, (cfg.start_variable,), word).accepted()
@@ -1,96 +1,231 @@
 # if __name__ == "__main__": import sys, os ; sys.path.insert(1, os.path.join(sys.path[0], '..'))
 
-from collections import namedtuple
+import itertools
 from pathlib import Path
 
-from anytree.render import RenderTree
 from tools.common import path_with_suffix, write_to_path
+from tools import options, profiling
+import tools.dot
 from obj.cfg import CFG, Letter, Rule, rule_to_str, word_to_str
+from obj.leaf_index import LeafIndex
+from processors_cfg.earley import EarleyChart
 from tools.cfg_parse import spaced_exclam_to_word
-from anytree import Node, PreOrderIter
-from anytree.exporter import UniqueDotExporter
 
 
 class CFGParseTree:
-    LetterData = namedtuple("LetterData", ["order", "letter"])
+    """a parse tree stored as parallel arrays, nodes are integer ids
+
+    node 0 is the root. children of a node are always created together by
+    `branch_word`, so they have consecutive ids starting at `first_child[node]`.
+    `anytree` nodes are only created when the tree is shown or rendered"""
 
     LETTER, META = range(2)
     ROOT_NAME = "root"
-
-    def __init__(self, starting_word: tuple[Letter]) -> None:
-        self.root = Node(self.ROOT_NAME, type=self.META)
-        # store the last-added nodes
-        self.last_added_stack = list()
-        self.tl_root_node = None
-        self.branch_word(self.root, starting_word, add_to_stack=False)
-
-    @classmethod
-    def termination_node(cls, parent=None):
-        """create new node indicating end of expansion
-
-        used when a rule produces epsilon"""
-        name = "ε"
-        return Node(name, type=cls.META, parent=parent)
-
-    @classmethod
-    def new_letter_node(cls, letter: Letter, parent=None) -> Node:
-        """create a new node given the letter and the sort order
-
-        sort order is needed because the tree is based on `dict`s, which are unordered"""
-        name = str(letter)
-        return Node(name, type=cls.LETTER, letter=letter, parent=parent)
-
-    @classmethod
-    def new_word_nodes(cls, word: tuple[Letter], parent=None) -> tuple[Node]:
+    EPSILON_NAME = "ε"
+    ROOT = 0
+
+    def __init__(self, starting_word: tuple[Letter], indexed: bool = False) -> None:
+        self.parent: list[int] = [-1]
+        self.first_child: list[int] = [-1]
+        self.num_children: list[int] = [0]
+        # the letter of each node, None for meta nodes (the root and epsilons)
+        self.symbol: list[Letter] = [None]
+        # store the parents of the last-added nodes
+        self.last_added_stack: list[int] = list()
+        # leaf lists are cached until the tree changes
+        self._leaves = None
+        self._variable_leaves = None
+        # the most recently changed leaf, used as the focus of the state display
+        self.last_changed: int = None
+        self.leaf_index: LeafIndex = None
+        new_nodes = self.branch_word(self.ROOT, starting_word, add_to_stack=False)
+        if indexed:
+            # an order-maintained index of all leaves, updated in O(log n) by
+            # `branch_word` and `undo` instead of walking the tree
+            self.leaf_index = LeafIndex(new_nodes, self.is_variable)
+
+    def __len__(self) -> int:
+        return len(self.parent)
+
+    def letter(self, node: int) -> Letter:
+        """return the letter of a node, None for meta nodes"""
+        return self.symbol[node]
+
+    def is_variable(self, node: int) -> bool:
+        letter = self.symbol[node]
+        return letter is not None and letter.is_variable
+
+    def node_type(self, node: int) -> int:
+        return self.META if self.symbol[node] is None else self.LETTER
+
+    def node_name(self, node: int) -> str:
+        letter = self.symbol[node]
+        if letter is not None:
+            return str(letter)
+        return self.ROOT_NAME if node == self.ROOT else self.EPSILON_NAME
+
+    def children(self, node: int) -> range:
+        first = self.first_child[node]
+        return range(first, first + self.num_children[node])
+
+    def expand_tree_nodes(self):
+        """iterate through all nodes in pre-order"""
+        stack = [self.ROOT]
+        while stack:
+            node = stack.pop()
+            yield node
+            stack.extend(reversed(self.children(node)))
+
+    def leaves(self) -> list[int]:
+        """return the letter leaves from left to right, excluding epsilons"""
+        if self._leaves is None:
+            self._leaves = [
+                n
+                for n in self.expand_tree_nodes()
+                if self.num_children[n] == 0 and self.symbol[n] is not None
+            ]
+        return self._leaves
+
+    def variable_leaves(self) -> list[int]:
+        if self._variable_leaves is None:
+            symbol = self.symbol
+            self._variable_leaves = [
+                n for n in self.leaves() if symbol[n].is_variable
+            ]
+        return self._variable_leaves
+
+    def variable_count(self) -> int:
+        if self.leaf_index is not None:
+            return self.leaf_index.variable_count()
+        return len(self.variable_leaves())
+
+    def variable_leaf(self, variable_index: int) -> int:
+        """return the leaf of the n-th variable, counting from 0"""
+        if self.leaf_index is not None:
+            return self.leaf_index.variable_at(variable_index)
+        return self.variable_leaves()[variable_index]
+
+    def branch_word(self, node: int, word: tuple[Letter], add_to_stack=True) -> range:
+        """branch a leaf node to the given word, return the new nodes"""
+        if self.num_children[node] != 0:
+            raise Exception(f"Node {self.node_name(node)} is already branched!")
         if len(word) == 0:
-            return [cls.termination_node(parent=parent)]
-        return [cls.new_letter_node(letter, parent=parent) for letter in word]
-
-    def expand_tree_nodes(self, *args, **kwargs):
-        for n in PreOrderIter(self.root):
-            yield n
-
-    def leaves(self) -> list[Node]:
-        return [n for n in self.root.leaves if n.type == self.LETTER]
-
-    def variable_leaves(self):
-        return [
-            n for n in self.leaves() if n.type == self.LETTER and n.letter.is_variable
-        ]
-
-    def branch_word(self, node: Node, word: tuple[Letter], add_to_stack=True):
-        """branch a node to the given word"""
-        word_nodes = self.new_word_nodes(word, parent=node)
+            # a meta node marks the end of the expansion
+            word = (None,)
+        first = len(self.parent)
+        count = len(word)
+        self.parent.extend([node] * count)
+        self.first_child.extend([-1] * count)
+        self.num_children.extend([0] * count)
+        self.symbol.extend(word)
+        self.first_child[node] = first
+        self.num_children[node] = count
         if add_to_stack:
-            self.last_added_stack.append(word_nodes)
-
-    def show(self):
-        print(RenderTree(self.root).by_attr())
+            self.last_added_stack.append(node)
+        self._leaves = None
+        self._variable_leaves = None
+        new_nodes = range(first, first + count)
+        if self.leaf_index is not None:
+            self.leaf_index.replace(node, new_nodes)
+        self.last_changed = first
+        return new_nodes
+
+    def expand_with(self, node: int, derivation) -> list[Rule]:
+        """branch a leaf and its new leaves following a derivation, in leftmost order
+
+        a derivation is `(rule, [derivation of each letter in the rule])`, with
+        None for letters. return the rules applied, each one is a separate step
+        for `undo`"""
+        applied = []
+        stack = [(node, derivation)]
+        while stack:
+            node, derivation = stack.pop()
+            if derivation is None:
+                continue
+            rule, children = derivation
+            new_nodes = self.branch_word(node, rule.output_word)
+            applied.append(rule)
+            if len(rule.output_word) == 0:
+                continue
+            stack.extend(reversed(list(zip(new_nodes, children))))
+        return applied
 
     def undo(self):
-        newest_nodes = self.last_added_stack.pop()
-        for n in newest_nodes:
-            n.parent = None
-
-    def render(self, filename="temp.png"):
-        def nodeattrfunc(node):
-            if node.type == CFGParseTree.META:
-                return f'shape=plain, label="{node.name}"'
+        """remove the last-added nodes, raise IndexError if there's nothing to undo"""
+        node = self.last_added_stack.pop()
+        first = self.first_child[node]
+        # the last branch always owns the newest nodes
+        assert first + self.num_children[node] == len(self.parent)
+        if self.leaf_index is not None:
+            self.leaf_index.unreplace(node, self.children(node))
+        del self.parent[first:]
+        del self.first_child[first:]
+        del self.num_children[first:]
+        del self.symbol[first:]
+        self.first_child[node] = -1
+        self.num_children[node] = 0
+        self._leaves = None
+        self._variable_leaves = None
+        self.last_changed = node
+
+    def to_anytree(self):
+        """convert the tree to `anytree` nodes, return the root node"""
+        from anytree import Node
+
+        nodes = []
+        for n in range(len(self.parent)):
+            parent = nodes[self.parent[n]] if n != self.ROOT else None
+            if self.symbol[n] is None:
+                new_node = Node(self.node_name(n), type=self.META, parent=parent)
             else:
-                return f'shape=plain, label="{node.letter.name}"'
+                new_node = Node(
+                    self.node_name(n),
+                    type=self.LETTER,
+                    letter=self.symbol[n],
+                    parent=parent,
+                )
+            nodes.append(new_node)
+        return nodes[self.ROOT]
+
+    def show(self):
+        from anytree.render import RenderTree
+
+        print(RenderTree(self.to_anytree()).by_attr())
 
-        num_root_children = len(self.root.children)
-        if num_root_children == 1:
-            starting_node = self.root.children[0]
-        elif num_root_children > 1:
-            starting_node = self.root
+    def diagram_roots(self) -> list[int]:
+        """the nodes a diagram starts from, the root is skipped if it has only one child"""
+        root_children = self.children(self.ROOT)
+        if len(root_children) == 1:
+            return [root_children[0]]
+        elif len(root_children) > 1:
+            return [self.ROOT]
         else:
             raise Exception("Root has no children!")
-        de = UniqueDotExporter(
-            starting_node,
-            nodeattrfunc=nodeattrfunc,
+
+    def diagram_label(self, node: int) -> str:
+        letter = self.symbol[node]
+        if letter is None:
+            return self.node_name(node)
+        return letter.name
+
+    def write_dot(self, path: Path, max_depth: int = None, max_nodes: int = None):
+        """stream the tree to a DOT file (gzip-compressed if it ends with `.gz`)
+
+        return the number of nodes written, see `tools.dot.write_tree` for the limits"""
+        return tools.dot.write_tree(
+            path,
+            self.diagram_roots(),
+            self.children,
+            self.diagram_label,
+            max_depth=max_depth,
+            max_nodes=max_nodes,
         )
-        de.to_picture(filename)
+
+    def render(self, filename="temp.png", max_depth: int = None, max_nodes: int = None):
+        """write the tree to a DOT file next to `filename`, then rasterize it with Graphviz"""
+        dot_path = Path(filename).with_suffix(".dot")
+        self.write_dot(dot_path, max_depth, max_nodes)
+        tools.dot.rasterize(dot_path, filename)
 
     def indexed_state(self) -> str:
         """return a string representing the leaves of the parse tree, with variables numbered
@@ -99,10 +234,34 @@ class CFGParseTree:
             0   1
         ```
         """
-        letters = [n.letter for n in self.leaves()]
+        letters = [self.symbol[n] for n in self.leaves()]
+        return self._state_lines(letters, 0)
+
+    def indexed_state_around(self, node: int, width: int) -> str:
+        """like `indexed_state`, but only show up to `width` leaves around the given leaf
+
+        requires the leaf index, runs in O(width + log n) instead of O(n)"""
+        index = self.leaf_index
+        center = index.position(node)
+        start = max(0, min(center - width // 2, len(index) - width))
+        first_var = index.variables_before(index.leaf_at(start))
+        leaves = itertools.islice(index.iter_from(start), width)
+        letters = [self.symbol[n] for n in leaves if self.symbol[n] is not None]
+        before = start > 0
+        after = start + width < len(index)
+        return self._state_lines(letters, first_var, before, after)
+
+    @staticmethod
+    def _state_lines(
+        letters: list[Letter], first_var: int, before=False, after=False
+    ) -> str:
+        """render letters with numbered variables, "..." marks letters cut off"""
         names = list()
         labels = list()
-        var_index = 0
+        if before:
+            names.append("...")
+            labels.append("   ")
+        var_index = first_var
         for letter in letters:
             name = letter.name
             if letter.is_variable:
@@ -113,61 +272,104 @@ class CFGParseTree:
             width = max(len(name), len(label))
             names.append(name.rjust(width))
             labels.append(label.rjust(width))
+        if after:
+            names.append("...")
         line_names = " ".join(names)
         line_labels = " ".join(labels)
         return line_names + "\n" + line_labels
 
-    def node_derivation(self) -> list[list[Node]]:
-        """create leftmost derivation of the parsetree as a list of Nodes"""
+    def iter_node_derivation(self):
+        """generate the leftmost derivation of the parsetree, one list of nodes per step
 
-        def expand_first_variable(node_list: list[Node]):
-            new_node_list = node_list.copy()
-            for i, node in enumerate(new_node_list):
-                children = node.children
-                if len(children) != 0:
-                    new_node_list[i : i + 1] = children
-                    return new_node_list
-            return None
-
-        steps = []
-        steps.append(list(self.root.children))
+        the same list is modified in place between steps, copy it to keep it"""
+        step = list(self.children(self.ROOT))
+        yield step
+        # everything left of `i` is a leaf, so the search for the next node to
+        # expand never goes backwards
+        i = 0
+        num_children = self.num_children
         while True:
-            new_step = expand_first_variable(steps[-1])
-            if new_step == None:
-                return steps
-            steps.append(new_step)
+            while i < len(step) and num_children[step[i]] == 0:
+                i += 1
+            if i == len(step):
+                return
+            step[i : i + 1] = self.children(step[i])
+            yield step
+
+    def node_derivation(self) -> list[list[int]]:
+        """create leftmost derivation of the parsetree as a list of nodes"""
+        return [step.copy() for step in self.iter_node_derivation()]
+
+    def iter_letter_derivation(self):
+        """generate the leftmost derivation of the parsetree, one word per step"""
+        symbol = self.symbol
+        for nodes in self.iter_node_derivation():
+            yield tuple(symbol[n] for n in nodes if symbol[n] is not None)
 
     def letter_derivation(self) -> list[tuple[Letter]]:
         """create leftmost derivation of the parsetree as a list of Letters"""
-
-        def node_list_to_word(nodes) -> tuple[Letter]:
-            return tuple(n.letter for n in nodes if n.type == self.LETTER)
-
-        derivation = self.node_derivation()
-        return [node_list_to_word(nodes) for nodes in derivation]
+        return list(self.iter_letter_derivation())
 
     def str_derivation(self) -> str:
-        ld = self.letter_derivation()
-        str_steps = [" ".join([l.name for l in w]) for w in ld]
+        str_steps = (
+            " ".join([l.name for l in w]) for w in self.iter_letter_derivation()
+        )
         return " -> ".join(str_steps)
 
+    def iter_rule_derivation(self):
+        """generate the rules applied by the leftmost derivation of the parsetree
+
+        unlike the words of each step, the total size of this is linear"""
+        for node in self.expand_tree_nodes():
+            if node == self.ROOT or self.num_children[node] == 0:
+                continue
+            output_word = tuple(
+                self.symbol[n] for n in self.children(node) if self.symbol[n] is not None
+            )
+            yield Rule(self.symbol[node], output_word)
+
+    def write_derivation(self, path: Path, compact: bool = False):
+        """stream `str_derivation` to a file, one step at a time
+
+        if `compact` is true, write the applied rules instead, one per line"""
+        with open(path, "w", encoding="utf-8") as f:
+            if compact:
+                for rule in self.iter_rule_derivation():
+                    f.write(rule_to_str(rule) + "\n")
+                return
+            for i, word in enumerate(self.iter_letter_derivation()):
+                if i != 0:
+                    f.write(" -> ")
+                f.write(" ".join([l.name for l in word]))
+
 
 class CFGConsole:
+    # bigger states only show this many leaves around the last change
+    STATE_WIDTH = 60
+
     def __init__(self, cfg: CFG, pt: CFGParseTree) -> None:
         self.cfg = cfg
-        self.rules = cfg.rules_map()
+        # rules are numbered in this order, both in the console and replay files
+        self.rules = {
+            var: sorted(rules, key=lambda r: rule_to_str(r))
+            for var, rules in cfg.rules_map().items()
+        }
         self.pt = pt
+        # the choices made so far, in the replay file format
+        self.history: list[str] = []
 
     def ask_choice(self):
         """return a variable number, or 'u' / 'q'"""
-        state = self.pt.indexed_state()
-        var_count = len(self.pt.variable_leaves())
+        state = self.state()
+        var_count = self.pt.variable_count()
         while True:
             print(state)
-            print("Select a variable: (undo with 'u', quit with 'q')")
+            print(
+                "Select a variable: (undo with 'u', derive a word with 'a', quit with 'q')"
+            )
             choice = self.input().lower()
 
-            if choice in ("u", "q"):
+            if choice in ("u", "a", "q"):
                 return choice
 
             try:
@@ -180,6 +382,12 @@ class CFGConsole:
                 continue
             return var_num
 
+    def state(self) -> str:
+        pt = self.pt
+        if pt.leaf_index is None or len(pt.leaf_index) <= self.STATE_WIDTH:
+            return pt.indexed_state()
+        return pt.indexed_state_around(pt.last_changed, self.STATE_WIDTH)
+
     def perform_choice(self, choice):
         """return true/false indicating whether to exit"""
         if isinstance(choice, int):
@@ -188,37 +396,107 @@ class CFGConsole:
             if choice == "u":
                 try:
                     self.pt.undo()
+                    self.history.append("u")
                 except IndexError:
                     print("Cannot undo!")
+            elif choice == "a":
+                self.auto_derive(self.get_input_word("Input the word to derive:"))
             elif choice == "q":
                 return True
         return False
 
+    def auto_derive(self, target: tuple[Letter]) -> bool:
+        """expand every variable so that the leaves become the target word
+
+        the steps are added in leftmost order, so each one expands variable 0"""
+        leaves = self.pt.leaves()
+        form = tuple(self.pt.letter(n) for n in leaves)
+        chart = EarleyChart(self.cfg, form, target)
+        if not chart.accepted():
+            print(f"Can't derive {word_to_str(target)} from {word_to_str(form)}!")
+            return False
+        for node, derivation in zip(leaves, chart.derivations()):
+            for rule in self.pt.expand_with(node, derivation):
+                rule_num = self.rules[rule.input_letter].index(rule)
+                self.history.append(f"0 {rule_num}")
+        print(f"Derived {word_to_str(target)}!")
+        return True
+
     def expand_variable(self, variable_index: int):
         variable_node = self.get_variable(variable_index)
-        variable_letter = variable_node.letter
-        var_rules = self.rules.get(variable_node.letter, list())
+        variable_letter = self.pt.letter(variable_node)
+        var_rules = self.rules.get(variable_letter, list())
         if len(var_rules) == 0:
             print(f"No rules found for {variable_letter}")
             return
         elif len(var_rules) == 1:
             print(f"Only 1 rule for {variable_letter}. Applying...")
-            rule = var_rules[0]
+            rule_num = 0
         else:
-            var_rules = sorted(var_rules, key=lambda r: rule_to_str(r))
-            rule = self.ask_rule(var_rules)
-        self.pt.branch_word(variable_node, rule.output_word)
+            rule_num = self.ask_rule(var_rules)
+        self.pt.branch_word(variable_node, var_rules[rule_num].output_word)
+        self.history.append(f"{variable_index} {rule_num}")
+
+    def replay(self, lines) -> int:
+        """apply recorded choices without asking or printing, return the number of steps
+
+        each line is one of:
+        - `VARIABLE_INDEX RULE_NUMBER`, rules are numbered like in the console
+        - `VARIABLE_INDEX -> WORD`, the output word of the rule in "spaced!" format
+        - `VARIABLE_INDEX`, for variables with only 1 rule
+        - `u`, undo the last step
+
+        empty lines and lines starting with `#` are skipped"""
+        # output word -> rule, for rules given as words
+        rules_by_word = {
+            var: {r.output_word: r for r in rules} for var, rules in self.rules.items()
+        }
+        steps = 0
+        for line_num, line in enumerate(lines, start=1):
+            line = line.strip()
+            if len(line) == 0 or line.startswith("#"):
+                continue
+            try:
+                if line == "u":
+                    self.pt.undo()
+                    self.history.append("u")
+                    steps += 1
+                    continue
+                if "->" in line:
+                    var_str, word_str = line.split("->", maxsplit=1)
+                    rule_str = None
+                else:
+                    var_str, _, rule_str = line.partition(" ")
+                    rule_str = rule_str.strip()
+                variable_index = int(var_str)
+                variable_node = self.pt.variable_leaf(variable_index)
+                variable_letter = self.pt.letter(variable_node)
+                var_rules = self.rules[variable_letter]
+                if rule_str is None:
+                    rule = rules_by_word[variable_letter][spaced_exclam_to_word(word_str)]
+                    rule_num = var_rules.index(rule)
+                elif rule_str == "" and len(var_rules) == 1:
+                    rule_num = 0
+                else:
+                    rule_num = int(rule_str)
+                rule = var_rules[rule_num]
+            except (IndexError, ValueError, KeyError) as e:
+                raise Exception(f"Invalid replay line {line_num}: '{line}' ({e!r})")
+            self.pt.branch_word(variable_node, rule.output_word)
+            self.history.append(f"{variable_index} {rule_num}")
+            steps += 1
+        return steps
 
     def get_variable(self, variable_index: int):
-        return self.pt.variable_leaves()[variable_index]
+        return self.pt.variable_leaf(variable_index)
 
-    def ask_rule(self, rules: list[Rule]) -> Rule:
+    def ask_rule(self, rules: list[Rule]) -> int:
+        """return the number of the chosen rule"""
         num_rules = len(rules)
         print("Select a rule:")
         for i, rule in enumerate(rules):
             print(str(i).rjust(3) + ". " + rule_to_str(rule))
-        rule_num = self.get_input_range(0, num_rules - 1)
-        return rules[rule_num]
+        return self.get_input_range(0, num_rules - 1)
 
     @staticmethod
     def input():
@@ -244,12 +522,10 @@ class CFGConsole:
                 print("   Invalid input, please input a number!")
 
     @classmethod
-    def get_input_word(cls):
+    def get_input_word(cls, prompt: str = "Input a word to start from:"):
         stop = False
         while not stop:
-            print(
-                "Input a word to start from: (format is 'spaced!', include '!' for variables)"
-            )
+            print(f"{prompt} (format is 'spaced!', include '!' for variables)")
             str_word = cls.input()
             word = spaced_exclam_to_word(str_word)
             print("Is this word ok? (y/n)")
@@ -258,23 +534,64 @@ class CFGConsole:
         return word
 
 
+def write_diagram(tree: CFGParseTree, dot_path: Path):
+    """write the DOT file of a parse tree, then rasterize it only if requested
+
+    options:
+    - `png`: also render a PNG image with Graphviz
+    - `dot_gz`: gzip the DOT file
+    - `dot_max_depth`, `dot_max_nodes`: truncate big trees"""
+    image_path = dot_path.with_suffix(".png")
+    if options.flag("dot_gz"):
+        dot_path = dot_path.with_suffix(".dot.gz")
+    written = tree.write_dot(
+        dot_path,
+        max_depth=options.get_int("dot_max_depth"),
+        max_nodes=options.get_int("dot_max_nodes"),
+    )
+    print(f"Wrote {written} nodes to {dot_path}")
+    if options.flag("png"):
+        tools.dot.rasterize(dot_path, image_path)
+        print(f"Rendered {image_path}")
+
+
 def process(cfg: CFG, original_path: Path):
+    """options:
+    - `replay PATH`: apply the choices in a replay file instead of asking for them
+    - `compact_derivation`: write the rules of the leftmost derivation instead
+      of every step, for long derivations"""
+    replay_path = options.get("replay")
     if cfg.start_variable:
         start_word = (cfg.start_variable,)
+    elif replay_path:
+        print("Start variable required for replaying!")
+        print("Please define `start xxx` in the input file")
+        return
     else:
         print("You didn't define a start variable, so enter a starting variable now:")
         start_word = CFGConsole.get_input_word()
-    ptree = CFGParseTree(start_word)
+    ptree = CFGParseTree(start_word, indexed=True)
     console = CFGConsole(cfg, ptree)
-    while True:
-        choice = console.ask_choice()
-        stop = console.perform_choice(choice)
-        if stop:
-            break
+    if replay_path:
+        replay_path = original_path.parent / replay_path
+        print(f"Replaying {replay_path}...")
+        with profiling.phase("interactive_replay"):
+            with open(replay_path, encoding="utf8") as f:
+                steps = console.replay(f)
+        print(f"Replayed {steps} steps!")
+    else:
+        while True:
+            choice = console.ask_choice()
+            stop = console.perform_choice(choice)
+            if stop:
+                break
+        replay_out_path = path_with_suffix(original_path, "interactive_replay")
+        write_to_path(replay_out_path, "\n".join(console.history) + "\n")
     derivation_path = path_with_suffix(original_path, "interactive_derivation")
     diagram_path = path_with_suffix(original_path, "interactive_diagram").with_suffix(
-        ".png"
+        ".dot"
     )
-    derivation = ptree.str_derivation()
-    write_to_path(derivation_path, derivation)
-    ptree.render(diagram_path)
+    with profiling.phase("interactive_derivation"):
+        ptree.write_derivation(derivation_path, options.flag("compact_derivation"))
+    with profiling.phase("interactive_render"):
+        write_diagram(ptree, diagram_path)
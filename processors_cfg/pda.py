@@ -2,6 +2,8 @@ from pathlib import Path
 from typing import NamedTuple, Union
 from tools.common import path_with_suffix, write_to_path
 from obj.cfg import CFG, Letter
+from obj.pda import PDA, PDATransition
+from processors_cfg.witness import min_lengths
 
 from pprint import pprint
 
@@ -30,6 +32,7 @@ STATE_MAIN = "main"
 STATE_END = "ed"
 STATE_ALPHA_PREFIX = "alpha"  # prefix for accepting alphabet
 STATE_VARIABLE_PREFIX = "var"  # prefix for substituting variables
+STACK_BOTTOM = "$"
 
 
 def html_tagger(
@@ -64,32 +67,84 @@ end ed
 """
 
 
-def to_pda(cfg: CFG):
-    transitions = []
+def first_letters(cfg: CFG, lengths: dict[Letter, int]) -> dict[Letter, set[Letter]]:
+    """return the letters that the words of each variable can start with
+
+    - `lengths`: the shortest yield of every generating variable, a length of 0
+      means the variable is nullable"""
+    firsts = {var: set() for var in cfg.all_variables()}
+    changed = True
+    while changed:
+        changed = False
+        for rule in cfg.rules:
+            first = firsts[rule.input_letter]
+            size = len(first)
+            for letter in rule.output_word:
+                if not letter.is_variable:
+                    first.add(letter)
+                    break
+                first.update(firsts[letter])
+                if lengths.get(letter) != 0:
+                    break
+            if len(first) != size:
+                changed = True
+    return firsts
+
+
+def cfg_to_pda(cfg: CFG) -> PDA:
+    """build the PDA of a CFG, with the same states and transitions as `to_pda`
+
+    the stack costs are the shortest yields of the symbols, see `PDA.costs`.
+    in the main state, the stack holds the rest of the sentential form"""
     start = cfg.start_variable
     alphabet = cfg.all_alphabet()
     rules_map = cfg.rules_map()
+    lengths = min_lengths(cfg)
+    costs = {STACK_BOTTOM: 0}
+    costs.update(lengths)
+    costs.update({al: 1 for al in alphabet})
+    firsts = first_letters(cfg, lengths)
+    firsts.update({al: {al} for al in alphabet})
+    pda = PDA(STATE_START, [STATE_END], costs, firsts, [STATE_MAIN])
 
-    def add(start, content, end):
-        transitions.append(Transition(start, content, end))
+    def add(start, read, pop, push, end):
+        pda.add_transition(PDATransition(start, read, pop, tuple(push), end))
 
-    pprint(rules_map)
     # initial setup
-    add(STATE_START, html_tagger([start, "$"], "push"), STATE_MAIN)
-    add(STATE_MAIN, html_tagger(["$"], "pop"), STATE_END)
+    add(STATE_START, None, None, (start, STACK_BOTTOM), STATE_MAIN)
+    add(STATE_MAIN, None, STACK_BOTTOM, (), STATE_END)
     # rules
     for var, rules in rules_map.items():
         state_name = STATE_VARIABLE_PREFIX + var.name
-        content = html_tagger([var.name], "pop")
-        add(STATE_MAIN, content, state_name)
+        add(STATE_MAIN, None, var, (), state_name)
         for rule in rules:
-            content = html_tagger(rule.output_word, "push")
-            add(state_name, content, STATE_MAIN)
+            add(state_name, None, None, rule.output_word, STATE_MAIN)
     # alphabet
     for al in alphabet:
         state_name = STATE_ALPHA_PREFIX + al.name
-        add(STATE_MAIN, html_tagger([al], "pop"), state_name)
-        add(state_name, al.name, STATE_MAIN)
+        add(STATE_MAIN, None, al, (), state_name)
+        add(state_name, al, None, (), STATE_MAIN)
+    return pda
+
+
+def transition_to_text(transition: PDATransition) -> Transition:
+    """convert a transition to the format of FSA Tool 2, which can only read,
+    pop or push in one transition"""
+    start, read, pop, push, end = transition
+    if read is not None and pop is None and len(push) == 0:
+        content = read.name
+    elif read is None and pop is not None and len(push) == 0:
+        content = html_tagger([pop], "pop")
+    elif read is None and pop is None:
+        content = html_tagger(list(push), "push")
+    else:
+        raise Exception(f"Transition can't be converted to text: {transition}")
+    return Transition(start, content, end)
+
+
+def to_pda(cfg: CFG):
+    pprint(cfg.rules_map())
+    transitions = [transition_to_text(t) for t in cfg_to_pda(cfg).transitions]
 
     pda = template
     pda += "\n".join([str(t) for t in transitions])
@@ -0,0 +1,175 @@
+import time
+from collections import deque
+from pathlib import Path
+from typing import NamedTuple
+from obj.cfg import CFG, Letter, word_to_str
+from obj.pda import PDA, StackStore
+from processors_cfg.pda import cfg_to_pda
+from tools import options, profiling
+from tools.cfg_parse import spaced_exclam_to_word
+from tools.common import path_with_suffix, write_to_path
+
+# searches stop after this many configurations, override with the
+# `pda_max_configurations` option
+MAX_CONFIGURATIONS = 1000000
+
+
+class PDARun(NamedTuple):
+    accepted: bool
+    # configurations reached, each one is only expanded once
+    configurations: int
+    # configurations dropped because their stack needs more input than is left
+    pruned_cost: int
+    # configurations dropped by the stack depth bound
+    pruned_depth: int
+    # configurations dropped by the bound on pushes without reading input
+    pruned_epsilon: int
+    # configurations dropped because the stack can't start with the next letter
+    pruned_first: int
+    # whether the search stopped at `max_configurations` without an answer
+    gave_up: bool
+
+
+def run_pda(pda: PDA, word: tuple[Letter], max_configurations: int = None) -> PDARun:
+    """breadth-first search over the configurations (state, input position, stack)
+
+    a configuration is never expanded twice, so ε-moves that come back to the
+    same configuration stop there. ε-moves that keep pushing are cut by two
+    bounds that grow with the input length: the stack height, and the height
+    gained since the last letter was read. for the PDA of a CFG, a derivation
+    tree without repeated variables along a path with the same yield always
+    fits in both bounds.
+
+    the search can still visit exponentially many configurations, it gives up
+    after `max_configurations`"""
+    n = len(word)
+    symbols = pda.stack_symbols()
+    max_push = max((len(t.push) for t in pda.transitions), default=0)
+    # path length of such a derivation tree, times the pushes per step
+    per_letter = (len(symbols) + 1) * max(max_push, 1)
+    max_height = (n + 1) * per_letter + 1
+
+    stacks = StackStore(pda.costs, pda.firsts)
+    check_first = pda.firsts is not None and pda.costs is not None
+    word_bits = [stacks.letter_bit(letter) for letter in word]
+    start = (pda.start_state, 0, 0)
+    if pda.start_state in pda.accept_states and n == 0:
+        return PDARun(True, 1, 0, 0, 0, 0, False)
+    visited = {start}
+    # entries are (configuration, stack height when the last letter was read)
+    queue = deque([(start, 0)])
+    pruned_cost = 0
+    pruned_depth = 0
+    pruned_epsilon = 0
+    pruned_first = 0
+    accepted = False
+    gave_up = False
+    while queue and not accepted:
+        if max_configurations is not None and len(visited) >= max_configurations:
+            gave_up = True
+            break
+        (state, pos, stack), read_height = queue.popleft()
+        for t in pda.transitions_from.get(state, ()):
+            new_pos = pos
+            if t.read is not None:
+                if pos >= n or word[pos] != t.read:
+                    continue
+                new_pos += 1
+            new_stack = stack
+            if t.pop is not None:
+                if stack == 0 or stacks.top[stack] != t.pop:
+                    continue
+                new_stack = stacks.rest[stack]
+            if t.push:
+                new_stack = stacks.push_word(new_stack, t.push)
+                if new_stack is None:
+                    pruned_cost += 1
+                    continue
+            height = stacks.height[new_stack]
+            if pda.costs is not None and stacks.cost[new_stack] > n - new_pos:
+                pruned_cost += 1
+                continue
+            if height > max_height:
+                pruned_depth += 1
+                continue
+            new_read_height = height if t.read is not None else read_height
+            if height - new_read_height > (n - new_pos + 1) * per_letter:
+                pruned_epsilon += 1
+                continue
+            if (
+                check_first
+                and new_pos < n
+                and t.end in pda.form_states
+                and not word_bits[new_pos] & stacks.first[new_stack]
+            ):
+                pruned_first += 1
+                continue
+            config = (t.end, new_pos, new_stack)
+            if config in visited:
+                continue
+            visited.add(config)
+            if t.end in pda.accept_states and new_pos == n:
+                accepted = True
+                break
+            queue.append((config, new_read_height))
+    profiling.count("pda_configurations", len(visited))
+    profiling.count("pda_stacks", len(stacks))
+    return PDARun(
+        accepted,
+        len(visited),
+        pruned_cost,
+        pruned_depth,
+        pruned_epsilon,
+        pruned_first,
+        gave_up,
+    )
+
+
+def get_words() -> list[tuple[Letter]]:
+    """return the words of the `pda_words` option, or ask for them"""
+    words_str = options.get("pda_words")
+    if words_str is not None:
+        return [spaced_exclam_to_word(w) for w in words_str.split(",")]
+    words = []
+    print("Input the words to test, end with an empty line: (Format is 'spaced!')")
+    while True:
+        word_str = input("  > ").strip()
+        if len(word_str) == 0:
+            return words
+        words.append(spaced_exclam_to_word(word_str))
+
+
+def process(cfg: CFG, original_path: Path):
+    """test words against the PDA of the CFG, see `processors_cfg.pda`
+
+    options:
+    - `pda_words WORD1,WORD2,...`: the words to test in "spaced!" format, asked
+      for if missing
+    - `pda_max_configurations N`: give up on a word after N configurations"""
+    if not cfg.start_variable:
+        print("Start variable required for this action!")
+        print("Please define `start xxx` in the input file")
+        return
+
+    max_configurations = options.get_int("pda_max_configurations", MAX_CONFIGURATIONS)
+    pda = cfg_to_pda(cfg)
+    lines = []
+    for word in get_words():
+        start = time.perf_counter()
+        with profiling.phase("pda_run"):
+            result = run_pda(pda, word, max_configurations)
+        elapsed = time.perf_counter() - start
+        if result.gave_up:
+            verdict = "gave up"
+        elif result.accepted:
+            verdict = "accepted"
+        else:
+            verdict = "rejected"
+        lines.append(
+            f"{word_to_str(word)}: {verdict}, {result.configurations} configurations, "
+            f"pruned {result.pruned_cost} by cost, {result.pruned_first} by first "
+            f"letter, {result.pruned_depth} by depth, {result.pruned_epsilon} by "
+            f"ε-pushes, {elapsed:.4f}s"
+        )
+        print(lines[-1])
+    write_to_path(path_with_suffix(original_path, "pda_run"), "\n".join(lines))
@@ -0,0 +1,242 @@
+from collections import defaultdict, deque
+from pathlib import Path
+from typing import Iterator
+from obj.automaton import DFA, NFA
+from obj.cfg import CFG, Letter, word_to_str
+from tools import options, profiling
+from tools.cfg_parse import spaced_exclam_to_word
+from tools.common import path_with_suffix, write_to_path
+
+# grammars whose automata get bigger than this aren't compiled
+MAX_STATES = 100000
+
+
+def cfg_to_nfa(cfg: CFG, max_states: int = MAX_STATES) -> NFA:
+    """compile a strongly regular CFG into an NFA (Mohri & Nederhof)
+
+    variables that can't produce themselves are expanded in place. a component
+    of variables gets one state per variable: with right-linear rules, `A -> w B`
+    goes from A's state to B's state and `A -> w` goes to the end, left-linear
+    rules are the same backwards"""
+    analysis = cfg.analysis()
+    if analysis.regular_kind() is None:
+        raise Exception("The CFG isn't strongly regular!")
+    rules_map = analysis.rules_map()
+    directions = analysis.component_directions()
+    component_of = {v: c for c in analysis.components() for v in c}
+    nfa = NFA()
+    nfa.start_state = nfa.add_state()
+    end_state = nfa.add_state()
+    nfa.accept_states.add(end_state)
+    # stack of (start state, letters to read, end state)
+    work = [(nfa.start_state, (cfg.start_variable,), end_state)]
+    while work:
+        start, letters, end = work.pop()
+        if len(letters) == 0:
+            nfa.add_transition(start, None, end)
+        elif len(letters) > 1:
+            middle = nfa.add_state()
+            work.append((start, letters[:1], middle))
+            work.append((middle, letters[1:], end))
+        elif not letters[0].is_variable:
+            nfa.add_transition(start, letters[0], end)
+        elif directions[letters[0]] == "none":
+            for rule in rules_map.get(letters[0], ()):
+                work.append((start, tuple(rule.output_word), end))
+        else:
+            variable = letters[0]
+            component = component_of[variable]
+            right = directions[variable] == "right"
+            states = {v: nfa.add_state() for v in component}
+            for member in component:
+                for rule in rules_map.get(member, ()):
+                    output_word = tuple(rule.output_word)
+                    if right and output_word and output_word[-1] in component:
+                        work.append(
+                            (states[member], output_word[:-1], states[output_word[-1]])
+                        )
+                    elif right:
+                        work.append((states[member], output_word, end))
+                    elif output_word and output_word[0] in component:
+                        work.append(
+                            (states[output_word[0]], output_word[1:], states[member])
+                        )
+                    else:
+                        work.append((start, output_word, states[member]))
+            if right:
+                nfa.add_transition(start, None, states[variable])
+            else:
+                nfa.add_transition(states[variable], None, end)
+        if nfa.num_states > max_states:
+            raise Exception(f"The NFA has more than {max_states} states!")
+    return nfa
+
+
+def nfa_to_dfa(nfa: NFA, max_states: int = MAX_STATES) -> DFA:
+    """subset construction, only the subsets reachable from the start are made"""
+    alphabet = sorted(nfa.alphabet(), key=lambda l: l.name)
+    start = nfa.epsilon_closure([nfa.start_state])
+    subset_ids = {start: 0}
+    subsets = [start]
+    transitions = []
+    for subset_id, subset in enumerate(subsets):
+        moves = defaultdict(set)
+        for state in subset:
+            for letter, targets in nfa.transitions[state].items():
+                if letter is not None:
+                    moves[letter].update(targets)
+        for letter, targets in moves.items():
+            target = nfa.epsilon_closure(targets)
+            if target not in subset_ids:
+                subset_ids[target] = len(subsets)
+                subsets.append(target)
+                if len(subsets) > max_states:
+                    raise Exception(f"The DFA has more than {max_states} states!")
+            transitions.append((subset_id, letter, subset_ids[target]))
+    dfa = DFA(alphabet, len(subsets), 0)
+    for start, letter, end in transitions:
+        dfa.set_transition(start, letter, end)
+    for subset_id, subset in enumerate(subsets):
+        if subset & nfa.accept_states:
+            dfa.accepting[subset_id] = 1
+    return dfa
+
+
+def minimize_dfa(dfa: DFA) -> DFA:
+    """remove the states that can't reach an accepting state, then merge states
+    that accept the same words, refining the partition until it's stable"""
+    predecessors = defaultdict(list)
+    for start, _, end in dfa.transitions():
+        predecessors[end].append(start)
+    live = set(s for s in range(dfa.num_states) if dfa.accepting[s])
+    queue = deque(live)
+    while queue:
+        state = queue.popleft()
+        for previous in predecessors[state]:
+            if previous not in live:
+                live.add(previous)
+                queue.append(previous)
+    if dfa.start_state not in live:
+        return DFA(dfa.alphabet, 0, -1)
+
+    states = sorted(live)
+    blocks = {s: dfa.accepting[s] for s in states}
+    num_blocks = len(set(blocks.values()))
+    while True:
+        signatures = {}
+        new_blocks = {}
+        for state in states:
+            targets = tuple(
+                blocks.get(dfa.target(state, letter), -1) for letter in dfa.alphabet
+            )
+            signature = (blocks[state], targets)
+            new_blocks[state] = signatures.setdefault(signature, len(signatures))
+        blocks = new_blocks
+        if len(signatures) == num_blocks:
+            break
+        num_blocks = len(signatures)
+
+    # the start state is the first state, so its block is 0
+    alphabet = [
+        letter
+        for letter in dfa.alphabet
+        if any(dfa.target(s, letter) in live for s in states)
+    ]
+    minimal = DFA(alphabet, num_blocks, blocks[dfa.start_state])
+    for state in states:
+        if dfa.accepting[state]:
+            minimal.accepting[blocks[state]] = 1
+        for letter in alphabet:
+            target = dfa.target(state, letter)
+            if target in live:
+                minimal.set_transition(blocks[state], letter, blocks[target])
+    return minimal
+
+
+def compile_dfa(cfg: CFG, max_states: int = MAX_STATES) -> tuple[NFA, DFA]:
+    """return the NFA and the minimal DFA of a strongly regular CFG, kept until
+    the CFG changes"""
+    # the analysis is made again when the CFG changes, so the automata go with it
+    cache = cfg.analysis()._cache
+    key = ("compile_dfa", max_states)
+    if key not in cache:
+        cache[key] = make_dfa(cfg, max_states)
+    return cache[key]
+
+
+def make_dfa(cfg: CFG, max_states: int) -> tuple[NFA, DFA]:
+    with profiling.phase("regular_nfa"):
+        nfa = cfg_to_nfa(cfg, max_states)
+    with profiling.phase("regular_dfa"):
+        dfa = minimize_dfa(nfa_to_dfa(nfa, max_states))
+    profiling.count("regular_nfa_states", nfa.num_states)
+    profiling.count("regular_dfa_states", dfa.num_states)
+    return nfa, dfa
+
+
+def dfa_to_text(dfa: DFA) -> str:
+    lines = [f"start: {dfa.start_state}"]
+    accepting = [str(s) for s in range(dfa.num_states) if dfa.accepting[s]]
+    lines.append(f"accept: {' '.join(accepting)}")
+    for start, letter, end in dfa.transitions():
+        lines.append(f"{start} {letter} -> {end}")
+    return "\n".join(lines)
+
+
+def read_letters(path: Path, chunk_size: int = 1 << 16) -> Iterator[Letter]:
+    """yield the letters of a file in "spaced!" format, reading a chunk at a time"""
+    # the same letters come up again and again
+    parsed = {}
+    rest = ""
+    with open(path, encoding="utf8") as f:
+        while True:
+            chunk = f.read(chunk_size)
+            tokens = (rest + chunk).split()
+            # the last token can continue in the next chunk
+            rest = tokens.pop() if chunk and tokens and not chunk[-1].isspace() else ""
+            for token in tokens:
+                letters = parsed.get(token)
+                if letters is None:
+                    letters = parsed[token] = spaced_exclam_to_word(token)
+                yield from letters
+            if not chunk:
+                break
+
+
+def process(cfg: CFG, original_path: Path):
+    """compile a regular CFG into a minimal DFA, and test words with it in linear
+    time and constant memory
+
+    options:
+    - `word WORD`: a word to test in "spaced!" format
+    - `word_file PATH`: a file with one long word to test in "spaced!" format,
+      relative to the input file. it's read while it's tested
+    - `dfa_max_states N`: give up if an automaton gets more states than this"""
+    if not cfg.start_variable:
+        print("Start variable required for this action!")
+        print("Please define `start xxx` in the input file")
+        return
+    kind = cfg.analysis().regular_kind()
+    if kind is None:
+        print("The CFG isn't strongly regular, it can't be compiled to a DFA!")
+        return
+    max_states = options.get_int("dfa_max_states", MAX_STATES)
+    nfa, dfa = compile_dfa(cfg, max_states)
+    print(
+        f"The CFG is {kind}: {nfa.num_states} NFA states, {dfa.num_states} DFA states"
+    )
+    header = f"{kind} CFG, {nfa.num_states} NFA states, minimal DFA:"
+    write_to_path(
+        path_with_suffix(original_path, "dfa"), f"{header}\n{dfa_to_text(dfa)}"
+    )
+
+    word_str = options.get("word")
+    if word_str is not None:
+        word = spaced_exclam_to_word(word_str)
+        accepted = dfa.accepts(word)
+        print(f"{word_to_str(word)}: {'accepted' if accepted else 'rejected'}")
+    word_path = options.get("word_file")
+    if word_path is not None:
+        with profiling.phase("regular_run"):
+            accepted = dfa.accepts(read_letters(original_path.parent / word_path))
+        print(f"{word_path}: {'accepted' if accepted else 'rejected'}")
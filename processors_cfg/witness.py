@@ -0,0 +1,161 @@
+import heapq
+from pathlib import Path
+from obj.cfg import CFG, Letter, Rule, rule_to_str, word_to_str
+from processors_cfg.interactive import CFGParseTree, write_diagram
+from tools import options, profiling
+from tools.common import path_with_suffix, write_to_path
+
+# witnesses longer than this are only given by their length, override with the
+# `witness_max_length` option
+MAX_WITNESS_LENGTH = 1000
+
+
+def shortest_rules(cfg: CFG) -> dict[Letter, tuple[int, Rule]]:
+    """return the length of the shortest word of every generating variable,
+    and the rule that starts its derivation
+
+    Knuth's generalization of Dijkstra's algorithm on the rule hypergraph: a
+    variable is final once popped from the heap, and a rule is pushed once all
+    of its variables are final. this takes O(|G| log |G|).
+
+    the variables of each chosen rule became final before its input variable,
+    so following the rules always terminates. non-generating variables are
+    left out"""
+    rules = sorted(cfg.rules, key=rule_to_str)
+    # per rule: number of variable occurrences that aren't final yet, and the
+    # length of the parts that are
+    pending = []
+    length = []
+    # variable -> list of (rule number, occurrences of the variable in the rule)
+    occurrences: dict[Letter, list[tuple[int, int]]] = {}
+    heap = []
+    for i, rule in enumerate(rules):
+        counts = {}
+        terminals = 0
+        for letter in rule.output_word:
+            if letter.is_variable:
+                counts[letter] = counts.get(letter, 0) + 1
+            else:
+                terminals += 1
+        for variable, count in counts.items():
+            occurrences.setdefault(variable, []).append((i, count))
+        pending.append(sum(counts.values()))
+        length.append(terminals)
+        if pending[i] == 0:
+            heap.append((terminals, i))
+    heapq.heapify(heap)
+
+    result = {}
+    popped = 0
+    while heap:
+        total, i = heapq.heappop(heap)
+        popped += 1
+        variable = rules[i].input_letter
+        if variable in result:
+            continue
+        result[variable] = (total, rules[i])
+        for j, count in occurrences.get(variable, ()):
+            pending[j] -= count
+            length[j] += count * total
+            if pending[j] == 0 and rules[j].input_letter not in result:
+                heapq.heappush(heap, (length[j], j))
+    profiling.count("witness_heap_pops", popped)
+    return result
+
+
+def min_lengths(cfg: CFG) -> dict[Letter, int]:
+    """length of the shortest word of every generating variable"""
+    return {var: total for var, (total, _) in shortest_rules(cfg).items()}
+
+
+def witness_derivation(
+    best: dict[Letter, tuple[int, Rule]], variable: Letter
+) -> tuple[Rule, list]:
+    """return the derivation of the shortest word of a variable
+
+    - `best`: the result of `shortest_rules`
+
+    a derivation is `(rule, [derivation of each letter in the rule])`, with
+    None for letters, see `CFGParseTree.expand_with`"""
+    if variable not in best:
+        raise Exception(f"Variable {variable} doesn't produce any words!")
+    root = []
+    # stack of (list to put the derivation in, index, variable)
+    stack = [(root, 0, variable)]
+    root.append(None)
+    while stack:
+        output, i, variable = stack.pop()
+        rule = best[variable][1]
+        children = [None] * len(rule.output_word)
+        output[i] = (rule, children)
+        for k, letter in enumerate(rule.output_word):
+            if letter.is_variable:
+                stack.append((children, k, letter))
+    return root[0]
+
+
+def witness_word(
+    best: dict[Letter, tuple[int, Rule]], variable: Letter
+) -> tuple[Letter]:
+    """return the shortest word of a variable, see `shortest_rules`"""
+    if variable not in best:
+        raise Exception(f"Variable {variable} doesn't produce any words!")
+    word = []
+    # rightmost letter at the bottom
+    stack = [variable]
+    while stack:
+        letter = stack.pop()
+        if letter.is_variable:
+            stack.extend(reversed(best[letter][1].output_word))
+        else:
+            word.append(letter)
+    return tuple(word)
+
+
+def process(cfg: CFG, original_path: Path):
+    """list the shortest word of every variable and the rule it starts with
+
+    if a start variable is given, also write the derivation and parse tree of
+    its shortest word
+
+    options:
+    - `witness_max_length N`: only give the length of longer words
+    - `compact_derivation`: write the rules of the derivation instead of every step"""
+    max_length = options.get_int("witness_max_length", MAX_WITNESS_LENGTH)
+    with profiling.phase("witness_search"):
+        best = shortest_rules(cfg)
+
+    lines = []
+    for variable in sorted(cfg.all_variables(), key=lambda v: v.name):
+        if variable not in best:
+            lines.append(f"{variable}: produces no words")
+            continue
+        total, rule = best[variable]
+        if total <= max_length:
+            word = word_to_str(witness_word(best, variable))
+        else:
+            word = "(too long to show)"
+        lines.append(f"{variable}: length {total}, {word}")
+        lines.append(f"  using {rule_to_str(rule)}")
+    content = "\n".join(lines)
+    print(content)
+    write_to_path(path_with_suffix(original_path, "witness"), content)
+
+    start = cfg.start_variable
+    if start is None:
+        return
+    if start not in best:
+        print(f"Start variable {start} doesn't produce any words!")
+        return
+    if best[start][0] > max_length:
+        print(f"The shortest word of {start} is too long for a derivation!")
+        return
+    ptree = CFGParseTree((start,))
+    with profiling.phase("witness_tree"):
+        ptree.expand_with(ptree.leaves()[0], witness_derivation(best, start))
+    derivation_path = path_with_suffix(original_path, "witness_derivation")
+    diagram_path = path_with_suffix(original_path, "witness_diagram").with_suffix(
+        ".dot"
+    )
+    ptree.write_derivation(derivation_path, options.flag("compact_derivation"))
+    write_diagram(ptree, diagram_path)
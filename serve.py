@@ -0,0 +1,554 @@
+"""keep grammars compiled in memory and answer queries about them
+
+```
+python serve.py --socket /tmp/cfg-tools.sock
+python serve.py --port 8765
+```
+
+clients send one JSON object per line and get one JSON object per line back,
+with the same `id`. responses can come back in a different order than the
+requests, so clients can send many requests without waiting"""
+
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import signal
+from collections import Counter, OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+from obj.cfg import Letter, rule_to_str
+from processors_cfg.bnf import to_bnf, unbinarize
+from processors_cfg.cnf import to_cnf
+from processors_cfg.cyk_batch import CNFIndex, batch_accepts
+from processors_cfg.cyk_bnf import UnitClosureChart
+from processors_cfg.cyk_spans import SPAN_MODES, search_spans
+from processors_cfg.regular import compile_dfa
+from tools.cfg_parse import spaced_exclam_to_word, text_to_cfg
+
+# defaults of the command line arguments
+CACHE_SIZE = 32
+BATCH_WINDOW = 0.002
+MAX_BATCH = 256
+QUERY_TIMEOUT = 30.0
+# longest request line, grammars are sent inline
+MAX_LINE = 1 << 24
+
+QUERIES = ("accepts", "tree", "spans")
+
+
+class CompiledGrammar:
+    """a grammar with what the queries need, made once and kept by each worker
+
+    membership uses the minimal DFA if the grammar is regular, and CYK on the
+    CNF otherwise. parse trees use CYK on the binarized grammar, so they use the
+    rules of the input. spans use CYK on the CNF"""
+
+    def __init__(self, text: str):
+        self.cfg = text_to_cfg(text)
+        if self.cfg.start_variable is None:
+            raise Exception("The grammar needs a start variable!")
+        # merging variables would lose the names of span targets
+        self.cnf = to_cnf(self.cfg, merge=False)
+        self.index = CNFIndex(self.cnf)
+        self.dfa = None
+        if self.cfg.analysis().regular_kind() is not None:
+            try:
+                self.dfa = compile_dfa(self.cfg)[1]
+            except Exception:
+                # too many states, CYK it is
+                pass
+        self._bnf = None
+
+    def accepts(self, words: list[tuple[Letter]]) -> list[bool]:
+        if self.dfa is not None:
+            return [self.dfa.accepts(word) for word in words]
+        return batch_accepts(self.cnf, words, self.index)
+
+    def tree(self, word: tuple[Letter]):
+        """return the parse tree of the word as nested dicts, or None if it's
+        rejected"""
+        if self._bnf is None:
+            self._bnf = to_bnf(self.cfg)
+        bnf, chain_variables = self._bnf
+        chart = UnitClosureChart(bnf, word)
+        if not chart.accepted():
+            return None
+        return derivation_to_json(unbinarize(chart.derivation(), chain_variables))
+
+    def spans(
+        self, text: tuple[Letter], targets: list[str], mode: str, max_span: int
+    ) -> list[tuple[int, int, str]]:
+        if mode not in SPAN_MODES:
+            raise Exception(f"Unknown span mode {mode}!")
+        variables = {v.name: v for v in self.cnf.all_variables()}
+        if not targets:
+            targets = [self.cfg.start_variable.name]
+        target_set = set()
+        for name in targets:
+            name = name.rstrip("!")
+            if name not in variables:
+                raise Exception(f"Unknown variable {name}!")
+            target_set.add(variables[name])
+        hits = search_spans(self.cnf, self.index, text, target_set, mode, max_span)
+        return [(start, end, variable.name) for start, end, variable in hits]
+
+
+def derivation_to_json(derivation) -> dict:
+    """turn `(rule, [children])` into `{"rule": ..., "children": [...]}`, with the
+    names of the letters as children"""
+    root = {}
+    # stack of (dict to fill, derivation)
+    stack = [(root, derivation)]
+    while stack:
+        output, (rule, children) = stack.pop()
+        output["rule"] = rule_to_str(rule)
+        output["children"] = []
+        for letter, child in zip(rule.output_word, children):
+            if child is None:
+                output["children"].append(letter.name)
+            else:
+                child_output = {}
+                output["children"].append(child_output)
+                stack.append((child_output, child))
+    return root
+
+
+# the grammars compiled by this worker process, least recently used first
+_compiled: "OrderedDict[str, CompiledGrammar]" = OrderedDict()
+
+
+def compiled_grammar(grammar_id: str, text: str, cache_size: int) -> CompiledGrammar:
+    """return the compiled grammar, or None if it isn't compiled here and the
+    text wasn't sent"""
+    grammar = _compiled.get(grammar_id)
+    if grammar is None:
+        if text is None:
+            return None
+        grammar = CompiledGrammar(text)
+        _compiled[grammar_id] = grammar
+        while len(_compiled) > cache_size:
+            _compiled.popitem(last=False)
+    else:
+        _compiled.move_to_end(grammar_id)
+    return grammar
+
+
+def run_queries(
+    grammar_id: str, text: str, queries: list[dict], cache_size: int
+) -> list[dict]:
+    """answer a batch of queries about one grammar, in a worker process
+
+    the words of all `accepts` queries are tested together, so they share
+    the chart columns of common prefixes. the text is only sent when the
+    worker asks for it by returning None"""
+    try:
+        grammar = compiled_grammar(grammar_id, text, cache_size)
+    except Exception as e:
+        return [{"error": f"{type(e).__name__}: {e}"}] * len(queries)
+    if grammar is None:
+        return None
+    results = [None] * len(queries)
+
+    # (query number, word number in the query) of every word to test
+    owners = []
+    words = []
+    for i, query in enumerate(queries):
+        if query["op"] != "accepts":
+            continue
+        try:
+            query_words = query_word_list(query)
+        except Exception as e:
+            results[i] = {"error": f"{type(e).__name__}: {e}"}
+            continue
+        results[i] = {"accepted": [None] * len(query_words)}
+        for j, word in enumerate(query_words):
+            owners.append((i, j))
+            words.append(word)
+    try:
+        for (i, j), accepted in zip(owners, grammar.accepts(words)):
+            results[i]["accepted"][j] = accepted
+    except Exception as e:
+        for i, _ in owners:
+            results[i] = {"error": f"{type(e).__name__}: {e}"}
+    for i, query in enumerate(queries):
+        if query["op"] == "accepts" and "word" in query and "accepted" in results[i]:
+            results[i]["accepted"] = results[i]["accepted"][0]
+
+    for i, query in enumerate(queries):
+        if query["op"] == "accepts":
+            continue
+        try:
+            if query["op"] == "tree":
+                tree = grammar.tree(spaced_exclam_to_word(query["word"]))
+                results[i] = {"accepted": tree is not None, "tree": tree}
+            else:
+                spans = grammar.spans(
+                    spaced_exclam_to_word(query["text"]),
+                    query.get("targets"),
+                    query.get("mode", "all"),
+                    query.get("max_span"),
+                )
+                results[i] = {"spans": spans}
+        except Exception as e:
+            results[i] = {"error": f"{type(e).__name__}: {e}"}
+    return results
+
+
+def check_query(query: dict):
+    """raise an exception if a field of a query has the wrong type, before it's
+    sent to a worker"""
+    op = query["op"]
+    if op == "accepts":
+        if "word" in query:
+            check_string(query, "word")
+        elif "words" in query:
+            words = query["words"]
+            if not isinstance(words, list) or not all(
+                isinstance(w, str) for w in words
+            ):
+                raise Exception("`words` must be a list of strings!")
+        else:
+            raise Exception("Give the word to test with `word` or `words`!")
+    elif op == "tree":
+        check_string(query, "word")
+    else:
+        check_string(query, "text")
+        targets = query.get("targets")
+        if targets is not None and (
+            not isinstance(targets, list)
+            or not all(isinstance(t, str) for t in targets)
+        ):
+            raise Exception("`targets` must be a list of variable names!")
+        mode = query.get("mode", "all")
+        if mode not in SPAN_MODES:
+            raise Exception(f"`mode` must be one of {', '.join(SPAN_MODES)}!")
+        max_span = query.get("max_span")
+        if max_span is not None and (
+            not isinstance(max_span, int) or isinstance(max_span, bool) or max_span < 1
+        ):
+            raise Exception("`max_span` must be a positive whole number!")
+
+
+def kill_workers(executor: ProcessPoolExecutor):
+    """shut down an executor without waiting, killing its processes"""
+    # `shutdown` can't stop a running task, so the processes are killed first
+    processes = list((executor._processes or {}).values())
+    for process in processes:
+        process.kill()
+    executor.shutdown(wait=False, cancel_futures=True)
+    for process in processes:
+        process.join()
+
+
+def check_string(query: dict, name: str):
+    if name not in query:
+        raise Exception(f"`{name}` is missing!")
+    if not isinstance(query[name], str):
+        raise Exception(f"`{name}` must be a string!")
+
+
+def query_word_list(query: dict) -> list[tuple[Letter]]:
+    if "word" in query:
+        return [spaced_exclam_to_word(query["word"])]
+    if "words" in query:
+        return [spaced_exclam_to_word(w) for w in query["words"]]
+    raise Exception("Give the word to test with `word` or `words`!")
+
+
+class GrammarService:
+    """the grammar texts in an LRU cache, and the queries waiting to be sent to
+    the workers
+
+    each grammar always goes to the same worker, so it's compiled once. queries
+    about the same grammar that arrive within `batch_window` seconds are sent
+    to it together, up to `max_batch` at once. a worker that takes longer than
+    `query_timeout` seconds on a batch is killed and started again. requests
+    can only give a `path` to a file inside `grammar_dir`, and only if it's set"""
+
+    def __init__(
+        self,
+        jobs: int,
+        cache_size: int = CACHE_SIZE,
+        batch_window: float = BATCH_WINDOW,
+        max_batch: int = MAX_BATCH,
+        grammar_dir: Path = None,
+        query_timeout: float = QUERY_TIMEOUT,
+    ):
+        # one process per executor, so a grammar id picks its worker
+        self.executors = [ProcessPoolExecutor(max_workers=1) for _ in range(jobs)]
+        self.locks = [asyncio.Lock() for _ in range(jobs)]
+        self.cache_size = cache_size
+        self.batch_window = batch_window
+        self.max_batch = max_batch
+        self.query_timeout = query_timeout
+        self.grammar_dir = None if grammar_dir is None else grammar_dir.resolve()
+        # grammar id -> grammar text, least recently used first
+        self.texts: "OrderedDict[str, str]" = OrderedDict()
+        # grammar id -> (grammar text, [(query, future)]) not sent yet
+        self.pending: dict[str, tuple[str, list]] = {}
+        self.timers: dict[str, asyncio.TimerHandle] = {}
+        self.stats = Counter()
+
+    def load(self, text: str) -> str:
+        """remember a grammar text, return its id"""
+        grammar_id = hashlib.sha256(text.encode("utf8")).hexdigest()[:16]
+        self.texts[grammar_id] = text
+        self.texts.move_to_end(grammar_id)
+        while len(self.texts) > self.cache_size:
+            self.texts.popitem(last=False)
+        return grammar_id
+
+    def read_grammar(self, path: str) -> str:
+        """return the text of a grammar file inside `grammar_dir`"""
+        if self.grammar_dir is None:
+            raise Exception(
+                "Grammar files are off, start the server with --grammar-dir"
+            )
+        if not isinstance(path, str):
+            raise Exception("`path` must be a string!")
+        full_path = (self.grammar_dir / path).resolve()
+        if not full_path.is_relative_to(self.grammar_dir):
+            raise Exception(f"{path} is outside the grammar folder!")
+        with open(full_path, encoding="utf8") as f:
+            return f.read()
+
+    def close(self):
+        """stop the workers without waiting for the batches they're running"""
+        for executor in self.executors:
+            kill_workers(executor)
+
+    def _restart(self, slot: int):
+        self.stats["workers_restarted"] += 1
+        kill_workers(self.executors[slot])
+        self.executors[slot] = ProcessPoolExecutor(max_workers=1)
+
+    async def _call(self, slot: int, *args):
+        """run `run_queries` on a worker, one batch at a time so the timeout
+        only counts the time spent on this batch. a worker that takes too long
+        or stops is started again"""
+        loop = asyncio.get_running_loop()
+        async with self.locks[slot]:
+            try:
+                return await asyncio.wait_for(
+                    loop.run_in_executor(self.executors[slot], run_queries, *args),
+                    self.query_timeout,
+                )
+            except asyncio.TimeoutError:
+                self._restart(slot)
+                raise Exception(
+                    f"The query took longer than {self.query_timeout:g} seconds, "
+                    "it was stopped"
+                )
+            except BrokenProcessPool:
+                self._restart(slot)
+                raise Exception("The worker stopped while answering the query")
+
+    async def query(self, grammar_id: str, query: dict) -> dict:
+        if grammar_id not in self.texts:
+            raise Exception(f"Unknown grammar {grammar_id}, load it again")
+        self.texts.move_to_end(grammar_id)
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        _, batch = self.pending.setdefault(grammar_id, (self.texts[grammar_id], []))
+        batch.append((query, future))
+        if len(batch) >= self.max_batch:
+            self._flush(grammar_id)
+        elif len(batch) == 1:
+            self.timers[grammar_id] = loop.call_later(
+                self.batch_window, self._flush, grammar_id
+            )
+        return await future
+
+    def _flush(self, grammar_id: str):
+        timer = self.timers.pop(grammar_id, None)
+        if timer is not None:
+            timer.cancel()
+        text, batch = self.pending.pop(grammar_id)
+        self.stats["batches"] += 1
+        self.stats["batched_queries"] += len(batch)
+        asyncio.ensure_future(self._run(grammar_id, text, batch))
+
+    async def _run(self, grammar_id: str, text: str, batch: list):
+        queries = [query for query, _ in batch]
+        slot = int(grammar_id, 16) % len(self.executors)
+        try:
+            # the text can be large, it's only sent if the worker doesn't have
+            # the grammar compiled
+            results = await self._call(slot, grammar_id, None, queries, self.cache_size)
+            if results is None:
+                self.stats["grammars_sent"] += 1
+                results = await self._call(
+                    slot, grammar_id, text, queries, self.cache_size
+                )
+        except Exception as e:
+            results = [{"error": f"{type(e).__name__}: {e}"}] * len(batch)
+        for (_, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
+
+    async def handle_request(self, request: dict) -> dict:
+        if not isinstance(request, dict):
+            raise Exception("Requests must be JSON objects!")
+        op = request.get("op")
+        self.stats[f"op_{op}"] += 1
+        if op == "stats":
+            return {
+                "grammars": len(self.texts),
+                "workers": len(self.executors),
+                **self.stats,
+            }
+        if "grammar" in request:
+            check_string(request, "grammar")
+            grammar_id = self.load(request["grammar"])
+        elif "path" in request:
+            text = await asyncio.to_thread(self.read_grammar, request["path"])
+            grammar_id = self.load(text)
+        elif "grammar_id" in request:
+            check_string(request, "grammar_id")
+            grammar_id = request["grammar_id"]
+        else:
+            raise Exception("Give the grammar with `grammar`, `path` or `grammar_id`!")
+        if op == "load":
+            return {"grammar_id": grammar_id}
+        if op not in QUERIES:
+            raise Exception(f"Unknown op {op}!")
+        query = {k: v for k, v in request.items() if k not in ("grammar", "id")}
+        check_query(query)
+        return await self.query(grammar_id, query)
+
+    async def respond(self, line: bytes, writer: asyncio.StreamWriter):
+        request = {}
+        try:
+            request = json.loads(line)
+            response = await self.handle_request(request)
+        except Exception as e:
+            response = {"error": f"{type(e).__name__}: {e}"}
+        if isinstance(request, dict) and "id" in request:
+            response = {"id": request["id"], **response}
+        writer.write(json.dumps(response).encode("utf8") + b"\n")
+        await writer.drain()
+
+    async def handle_connection(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ):
+        tasks = set()
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                if not line.strip():
+                    continue
+                task = asyncio.ensure_future(self.respond(line, writer))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+            if tasks:
+                await asyncio.gather(*tasks, return_exceptions=True)
+        finally:
+            writer.close()
+
+
+async def serve(args):
+    service = GrammarService(
+        args.jobs,
+        args.cache_size,
+        args.batch_window / 1000,
+        args.max_batch,
+        args.grammar_dir,
+        args.query_timeout,
+    )
+    if args.socket is not None:
+        if args.socket.exists():
+            args.socket.unlink()
+        server = await asyncio.start_unix_server(
+            service.handle_connection, path=str(args.socket), limit=MAX_LINE
+        )
+        where = args.socket
+    else:
+        server = await asyncio.start_server(
+            service.handle_connection, args.host, args.port, limit=MAX_LINE
+        )
+        where = f"{args.host}:{args.port}"
+    # stop cleanly on Ctrl+C and `kill`, so the workers stop too
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for signal_number in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(signal_number, stop.set)
+        except NotImplementedError:
+            # Windows, Ctrl+C raises KeyboardInterrupt instead
+            pass
+    print(f"Listening on {where} with {args.jobs} workers", flush=True)
+    try:
+        async with server:
+            await stop.wait()
+    finally:
+        service.close()
+        if args.socket is not None and args.socket.exists():
+            args.socket.unlink()
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(
+        description="Answer membership, parse tree and span queries about grammars "
+        "kept in memory."
+    )
+    where = ap.add_mutually_exclusive_group()
+    where.add_argument("--socket", type=Path, help="Listen on this Unix socket")
+    where.add_argument(
+        "--port", type=int, default=8765, help="Listen on this TCP port, default 8765"
+    )
+    ap.add_argument(
+        "--host", default="127.0.0.1", help="Address of the TCP port, default localhost"
+    )
+    ap.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=os.cpu_count() or 1,
+        help="Number of worker processes, default is the number of CPUs",
+    )
+    ap.add_argument(
+        "--cache-size",
+        type=int,
+        default=CACHE_SIZE,
+        help=f"Grammars kept compiled per worker, default {CACHE_SIZE}",
+    )
+    ap.add_argument(
+        "--batch-window",
+        type=float,
+        default=BATCH_WINDOW * 1000,
+        help="Milliseconds to wait for more queries about a grammar before "
+        f"sending them to a worker, default {BATCH_WINDOW * 1000:g}",
+    )
+    ap.add_argument(
+        "--max-batch",
+        type=int,
+        default=MAX_BATCH,
+        help=f"Most queries sent to a worker at once, default {MAX_BATCH}",
+    )
+    ap.add_argument(
+        "--grammar-dir",
+        type=Path,
+        help="Let requests load grammar files from this folder with `path`, "
+        "off by default",
+    )
+    ap.add_argument(
+        "--query-timeout",
+        type=float,
+        default=QUERY_TIMEOUT,
+        help="Seconds a worker can take on a batch of queries before it's "
+        f"restarted, default {QUERY_TIMEOUT:g}",
+    )
+    args = ap.parse_args(argv)
+    try:
+        asyncio.run(serve(args))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# the modules are imported from the top folder, like `main.py` does
+sys.path.insert(1, os.path.join(os.path.dirname(__file__), ".."))
@@ -0,0 +1,51 @@
+"""the other membership tests against Earley, on every short word"""
+
+import random
+
+import pytest
+
+from benchmarks import generators
+from processors_cfg import earley
+from processors_cfg.bnf import to_bnf
+from processors_cfg.cyk_bnf import UnitClosureChart
+from processors_cfg.cyk_chart import CYKChart
+from processors_cfg.regular import compile_dfa
+
+
+def alphabet(cfg) -> list:
+    return sorted(cfg.all_alphabet(), key=str)
+
+
+@pytest.mark.parametrize("seed", range(30))
+def test_cyk_bnf(seed):
+    cfg = generators.random_cfg(4, 2, 3, seed)
+    bnf, _ = to_bnf(cfg)
+    for word in generators.all_words(alphabet(cfg), 4):
+        assert UnitClosureChart(bnf, word).accepted() == earley.accepts(cfg, word)
+
+
+@pytest.mark.parametrize("seed", range(30))
+def test_dfa(seed):
+    cfg = generators.random_linear(4, 2, 3, seed)
+    assert cfg.analysis().regular_kind() is not None
+    _, dfa = compile_dfa(cfg)
+    for word in generators.all_words(alphabet(cfg), 5):
+        assert dfa.accepts(word) == earley.accepts(cfg, word), word
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_cyk_chart_edits(seed):
+    cfg = generators.random_cnf(5, 2, 3, seed)
+    letters = alphabet(cfg)
+    rng = random.Random(seed)
+    chart = CYKChart(cfg, generators.sample_word(cfg, 6, seed))
+    for _ in range(30):
+        if len(chart) == 0 or rng.random() < 0.4:
+            chart.insert(rng.randint(0, len(chart)), rng.choice(letters))
+        elif rng.random() < 0.5:
+            chart.delete(rng.randrange(len(chart)))
+        else:
+            chart.replace(rng.randrange(len(chart)), rng.choice(letters))
+        fresh = CYKChart(cfg, chart.word)
+        assert chart.columns == fresh.columns
+        assert chart.accepted() == earley.accepts(cfg, chart.word)
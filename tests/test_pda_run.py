@@ -0,0 +1,38 @@
+"""the PDA of random grammars against Earley, on every short word"""
+
+import pytest
+
+from benchmarks import generators
+from processors_cfg import earley
+from processors_cfg.pda import cfg_to_pda
+from processors_cfg.pda_run import run_pda
+
+MAX_CONFIGURATIONS = 20000
+
+
+def alphabet(cfg) -> list:
+    return sorted(cfg.all_alphabet(), key=str)
+
+
+@pytest.mark.parametrize("seed", range(30))
+def test_random_cfg(seed):
+    cfg = generators.random_cfg(4, 2, 3, seed)
+    pda = cfg_to_pda(cfg)
+    decided = 0
+    for word in generators.all_words(alphabet(cfg), 4):
+        run = run_pda(pda, word, MAX_CONFIGURATIONS)
+        if run.gave_up:
+            continue
+        decided += 1
+        assert run.accepted == earley.accepts(cfg, word), word
+    assert decided > 0
+
+
+@pytest.mark.parametrize("seed", range(10))
+def test_random_cnf(seed):
+    cfg = generators.random_cnf(5, 2, 3, seed)
+    pda = cfg_to_pda(cfg)
+    for word in generators.all_words(alphabet(cfg), 5):
+        run = run_pda(pda, word, MAX_CONFIGURATIONS)
+        if not run.gave_up:
+            assert run.accepted == earley.accepts(cfg, word), word
@@ -1,6 +1,7 @@
 from typing import Callable
 from obj.cfg import Letter, CFG, Rule
 from tools.common import hasupper
+from tools.fromtext import MetaError, parse_meta_lines, text_to_lines_lists
 
 ARROWS = ("->", "→")
 EPSILON = ("ε", "e")
@@ -111,3 +112,52 @@ def spaced_exclam_to_word(str_word: str) -> tuple[Letter]:
         return ()
 
     return tuple(map(quick_letter, full_word.split()))
+
+
+WORD_CONVERTERS = {
+    "char": chars_to_word,
+    "spaced": spaced_to_word,
+    "spaced!": spaced_exclam_to_word,
+}
+
+
+def format_to_word_converter(text_format: str) -> Callable:
+    try:
+        return WORD_CONVERTERS[text_format]
+    except KeyError:
+        raise MetaError(f"Unknown format {text_format}")
+
+
+def guess_format(parse_lines: list[str]) -> str:
+    """the format of rules written without a `format` line, like the output of
+    `cnf`"""
+    outputs = [
+        word
+        for line in parse_lines
+        if not line.split()[0] == "start"
+        for word in line.split("->", maxsplit=1)[-1].split("|")
+    ]
+    if any("!" in line for line in parse_lines):
+        return "spaced!"
+    if any(len(word.split()) > 1 for word in outputs):
+        return "spaced"
+    return "char"
+
+
+def text_to_cfg(text: str, text_format: str = None, guess: bool = False) -> CFG:
+    """parse a CFG written like an input file, its actions and options are
+    ignored
+
+    the format is the `format` line of the text, or `text_format`. with `guess`,
+    texts with neither are guessed from the rules. a LaTeX block after the rules
+    is skipped"""
+    text = text.split("$$", maxsplit=1)[0]
+    parse_lines, meta_lines = text_to_lines_lists(text)
+    meta_data = parse_meta_lines(meta_lines)
+    if len(meta_data["format"]) > 0:
+        text_format = meta_data["format"][0]
+    if text_format is None:
+        if not guess:
+            raise MetaError("Format is unspecified! Include `format xxx` in the text.")
+        text_format = guess_format(parse_lines)
+    return lines_to_cfg(parse_lines, format_to_word_converter(text_format))
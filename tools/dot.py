@@ -0,0 +1,78 @@
+import gzip
+import shutil
+import subprocess
+from pathlib import Path
+
+
+def open_text(path: Path):
+    """open a file for writing text, gzip-compressed if the path ends with `.gz`"""
+    if Path(path).suffix == ".gz":
+        return gzip.open(path, "wt", encoding="utf-8")
+    return open(path, "w", encoding="utf-8")
+
+
+def escape_label(label: str) -> str:
+    return label.replace("\\", "\\\\").replace('"', '\\"')
+
+
+def write_tree(
+    path: Path,
+    roots,
+    children,
+    label,
+    max_depth: int = None,
+    max_nodes: int = None,
+) -> int:
+    """stream a tree to a DOT file, return the number of nodes written
+
+    - `roots`: the nodes to start from
+    - `children`: function that returns the children of a node
+    - `label`: function that returns the label of a node
+    - `max_depth`: nodes deeper than this are replaced with a "..." node
+    - `max_nodes`: stop after writing this many nodes, adding a "..." node
+
+    nodes are named by their position in the output, so any hashable or
+    unhashable node object works"""
+    written = 0
+    truncated = 0
+    with open_text(path) as f:
+        f.write("digraph tree {\n")
+        # stack of (node, depth, name of parent in the output)
+        stack = [(root, 0, None) for root in reversed(list(roots))]
+        while stack:
+            node, depth, parent_name = stack.pop()
+            name = f"n{written + truncated}"
+            too_deep = max_depth is not None and depth > max_depth
+            too_many = max_nodes is not None and written >= max_nodes
+            if too_deep or too_many:
+                f.write(f'  {name} [shape=plain, label="..."];\n')
+                truncated += 1
+                if parent_name is not None:
+                    f.write(f"  {parent_name} -> {name};\n")
+                if too_many:
+                    break
+                continue
+            f.write(f'  {name} [shape=plain, label="{escape_label(label(node))}"];\n')
+            written += 1
+            if parent_name is not None:
+                f.write(f"  {parent_name} -> {name};\n")
+            for child in reversed(list(children(node))):
+                stack.append((child, depth + 1, name))
+        f.write("}\n")
+    return written
+
+
+def rasterize(dot_path: Path, output_path: Path, output_format: str = None):
+    """convert a DOT file to an image with Graphviz's `dot` command
+
+    the image format defaults to the output file's suffix, e.g. "png" """
+    if output_format is None:
+        output_format = Path(output_path).suffix.lstrip(".")
+    if shutil.which("dot") is None:
+        raise Exception("Graphviz's `dot` command is required to render images!")
+    cmd = ["dot", f"-T{output_format}", "-o", str(output_path)]
+    if Path(dot_path).suffix == ".gz":
+        with gzip.open(dot_path, "rb") as f:
+            subprocess.run(cmd, input=f.read(), check=True)
+    else:
+        subprocess.run(cmd + [str(dot_path)], check=True)
@@ -1,7 +1,7 @@
 # if __name__ == "__main__": import sys, os ; sys.path.insert(1, os.path.join(sys.path[0], '..'))
 
 
-META_KEYWORDS = ("format", "action", "#")
+META_KEYWORDS = ("format", "action", "option", "#")
 
 
 class MetaError(Exception):
@@ -29,5 +29,34 @@ def parse_meta_lines(meta_lines: list[str]):
         meta_data[keyword] = []
     for line in meta_lines:
         args = line.split()
+        if args[0] == "option":
+            # every option line is kept, one option per line
+            meta_data["option"].append(args[1:])
+            continue
         meta_data[args[0]] = args[1:]
     return meta_data
+
+
+def parse_option_lines(option_lines: list[list[str]]) -> dict:
+    """convert the args of `option KEY VALUE...` lines to a dict
+
+    the value is the rest of the line, or `True` if the line has no value"""
+    options = {}
+    for args in option_lines:
+        if len(args) == 0:
+            raise MetaError("Option line without a name!")
+        key = args[0]
+        options[key] = " ".join(args[1:]) if len(args) > 1 else True
+    return options
+
+
+def parse_option_args(option_args: list[str]) -> dict:
+    """convert `KEY=VALUE` or `KEY` strings from the command line to a dict"""
+    options = {}
+    for arg in option_args:
+        if "=" in arg:
+            key, value = arg.split("=", maxsplit=1)
+            options[key] = value
+        else:
+            options[arg] = True
+    return options
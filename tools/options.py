@@ -0,0 +1,42 @@
+"""options for the processors
+
+options come from `option KEY VALUE` lines in the input file and from
+`--option KEY=VALUE` on the command line. options without a value are flags"""
+
+_options = {}
+
+
+def set_options(options: dict):
+    _options.clear()
+    _options.update(options)
+
+
+def all_options() -> dict:
+    return dict(_options)
+
+
+def get(name: str, default=None):
+    return _options.get(name, default)
+
+
+def flag(name: str) -> bool:
+    """return whether an option is set, "no"/"false"/"0" count as unset"""
+    value = _options.get(name)
+    if value is None:
+        return False
+    if isinstance(value, str) and value.lower() in ("no", "false", "0"):
+        return False
+    return True
+
+
+def get_int(name: str, default: int = None) -> int:
+    value = _options.get(name)
+    if value is None:
+        return default
+    # a bare `option NAME` is True, which int() would take as 1
+    if value is True:
+        raise Exception(f"Option {name} must be a number, got no value")
+    try:
+        return int(value)
+    except ValueError:
+        raise Exception(f"Option {name} must be a number, got '{value}'")
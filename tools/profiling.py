@@ -0,0 +1,104 @@
+"""optional profiling: wall time and peak memory per phase, plus hot-path counters
+
+everything here is a no-op until `enable()` is called, so processors can call
+`phase()` and `count()` unconditionally"""
+
+import cProfile
+import json
+import time
+import tracemalloc
+from collections import Counter
+from contextlib import contextmanager
+from pathlib import Path
+
+enabled = False
+counters = Counter()
+phases = []
+_stack = []
+
+
+def enable():
+    global enabled
+    enabled = True
+    tracemalloc.start()
+
+
+def disable():
+    global enabled
+    enabled = False
+    if tracemalloc.is_tracing():
+        tracemalloc.stop()
+
+
+def reset():
+    """forget the recorded phases and counters, e.g. before the next input file"""
+    counters.clear()
+    phases.clear()
+    _stack.clear()
+
+
+def count(name: str, amount: int = 1):
+    """add `amount` to the counter `name`
+
+    in hot loops, sum into a local variable first and call this once"""
+    if enabled:
+        counters[name] += amount
+
+
+@contextmanager
+def phase(name: str):
+    """record wall time, peak memory and counter changes of the enclosed block
+
+    phases can be nested, the peak memory of a phase includes its sub-phases"""
+    if not enabled:
+        yield None
+        return
+    if _stack:
+        # the parent's peak so far must be saved before resetting it
+        _stack[-1]["peak_bytes"] = max(
+            _stack[-1]["peak_bytes"], tracemalloc.get_traced_memory()[1]
+        )
+    record = {
+        "name": name,
+        "depth": len(_stack),
+        "seconds": None,
+        "start_bytes": tracemalloc.get_traced_memory()[0],
+        "peak_bytes": 0,
+        "counters": {},
+    }
+    phases.append(record)
+    _stack.append(record)
+    counters_before = counters.copy()
+    tracemalloc.reset_peak()
+    start = time.perf_counter()
+    try:
+        yield record
+    finally:
+        record["seconds"] = time.perf_counter() - start
+        peak = max(record["peak_bytes"], tracemalloc.get_traced_memory()[1])
+        record["peak_bytes"] = peak - record["start_bytes"]
+        record["counters"] = dict(counters - counters_before)
+        _stack.pop()
+        if _stack:
+            _stack[-1]["peak_bytes"] = max(_stack[-1]["peak_bytes"], peak)
+
+
+@contextmanager
+def cprofile_to(path: Path):
+    """run the enclosed block under cProfile, dumping the stats to `path`"""
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield profiler
+    finally:
+        profiler.disable()
+        profiler.dump_stats(path)
+
+
+def report() -> dict:
+    return {"phases": phases, "counters": dict(counters)}
+
+
+def write_report(path: Path):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(report(), f, indent=2)